@@ -14,10 +14,12 @@
 # limitations under the License.
 #
 
-from marklogic.models.connection import Connection
+from marklogic.models.connection import Connection, AsyncConnection
 from marklogic.models.forest import Forest
 from marklogic.models.database import Database
 from marklogic.models.server import Server, HttpServer, XdbcServer, OdbcServer, WebDAVServer
 from marklogic.models.host import Host
 from marklogic.models.role import Role
 from marklogic.models.privilege import Privilege
+from marklogic.models.document import Document
+from marklogic.models.cluster import ClusterSnapshot
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Cluster related classes for reading a whole cluster's configuration
+"""
+
+import time
+import logging
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from marklogic.models.database import Database
+from marklogic.models.server import Server
+from marklogic.models.user import User
+from marklogic.models.role import Role
+from marklogic.models.privilege import Privilege
+
+class ClusterSnapshot:
+    """
+    The ClusterSnapshot class holds the configuration of every database,
+    server, user, role and privilege on a cluster, read at one time.
+
+    The snapshot is read-only: its attributes cannot be set and its
+    indexes are read-only mappings.  The configuration objects in it
+    are shared by every caller, so use `copy.deepcopy` on one before
+    changing it.
+
+    Servers are indexed by "group|name", privileges by "kind|name" and
+    everything else by name.  Privileges are also indexed by
+    "kind|action".
+    """
+    def __init__(self, databases, servers, users, roles, privileges, timestamp=None):
+        """
+        Create a snapshot.
+
+        :param databases: A list of Database objects
+        :param servers: A list of Server objects
+        :param users: A list of User objects
+        :param roles: A list of Role objects
+        :param privileges: A list of Privilege objects
+        :param timestamp: The time the configuration was read, by default now
+        :return: The snapshot
+        """
+        index = {
+            'databases': dict((d.database_name(), d) for d in databases),
+            'servers': dict(("{0}|{1}".format(s.group_name(), s.server_name()), s)
+                            for s in servers),
+            'users': dict((u.user_name(), u) for u in users),
+            'roles': dict((r.role_name(), r) for r in roles),
+            'privileges': dict(("{0}|{1}".format(p.kind(), p.privilege_name()), p)
+                               for p in privileges),
+            'actions': dict(("{0}|{1}".format(p.kind(), p.action()), p)
+                            for p in privileges)
+            }
+
+        for key in index:
+            object.__setattr__(self, "_" + key, MappingProxyType(index[key]))
+        object.__setattr__(self, "timestamp",
+                           timestamp if timestamp is not None else time.time())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ClusterSnapshot is read-only")
+
+    @classmethod
+    def fetch(cls, connection, max_workers=None):
+        """
+        Read the configuration of the whole cluster.  The resources
+        of every type are listed at the same time and then looked up
+        in parallel by at most `max_workers` threads.
+
+        :param connection: The connection to a MarkLogic server
+        :param max_workers: The number of threads, by default the connection's management pool size
+        :return: The snapshot
+        """
+        if max_workers is None:
+            max_workers = connection.management_pool_size
+
+        timestamp = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            lists = [
+                executor.submit(lambda: [db.database_name()
+                                         for db in Database.list_databases(connection)]),
+                executor.submit(Server.list, connection),
+                executor.submit(User.list, connection),
+                executor.submit(Role.list, connection),
+                executor.submit(Privilege.list, connection)
+                ]
+            names = [future.result() for future in lists]
+
+            lookups = [Database.lookup, Server.lookup, User.lookup,
+                       Role.lookup, Privilege.lookup]
+            futures = [[executor.submit(lookup, connection, name) for name in type_names]
+                       for lookup, type_names in zip(lookups, names)]
+            results = [[future.result() for future in type_futures]
+                       for type_futures in futures]
+
+        # Resources deleted between the list and the lookup are skipped
+        databases, servers, users, roles, privileges \
+          = [[item for item in items if item is not None] for items in results]
+
+        logging.info("Read cluster configuration: {0} databases, {1} servers, "
+                     "{2} users, {3} roles, {4} privileges"
+                     .format(len(databases), len(servers), len(users),
+                             len(roles), len(privileges)))
+
+        return ClusterSnapshot(databases, servers, users, roles, privileges, timestamp)
+
+    def databases(self):
+        """
+        The databases, by name.
+
+        :return: A read-only mapping
+        """
+        return self._databases
+
+    def servers(self):
+        """
+        The servers, by "group|name".
+
+        :return: A read-only mapping
+        """
+        return self._servers
+
+    def users(self):
+        """
+        The users, by name.
+
+        :return: A read-only mapping
+        """
+        return self._users
+
+    def roles(self):
+        """
+        The roles, by name.
+
+        :return: A read-only mapping
+        """
+        return self._roles
+
+    def privileges(self):
+        """
+        The privileges, by "kind|name".
+
+        :return: A read-only mapping
+        """
+        return self._privileges
+
+    def database(self, name):
+        """
+        Look up a database.
+
+        :param name: The database name
+        :return: The database or None
+        """
+        return self._databases.get(name)
+
+    def server(self, name, group='Default'):
+        """
+        Look up a server.  The server name may be a structured value
+        consisting of the group name and the server name separated
+        by "|", in which case the group parameter is ignored.
+
+        :param name: The server name
+        :param group: The group name
+        :return: The server or None
+        """
+        if "|" not in name:
+            name = "{0}|{1}".format(group, name)
+        return self._servers.get(name)
+
+    def user(self, name):
+        """
+        Look up a user.
+
+        :param name: The user name
+        :return: The user or None
+        """
+        return self._users.get(name)
+
+    def role(self, name):
+        """
+        Look up a role.
+
+        :param name: The role name
+        :return: The role or None
+        """
+        return self._roles.get(name)
+
+    def privilege(self, name, kind):
+        """
+        Look up a privilege by name.
+
+        :param name: The privilege name
+        :param kind: The kind of privilege, "execute" or "uri"
+        :return: The privilege or None
+        """
+        return self._privileges.get("{0}|{1}".format(kind, name))
+
+    def privilege_for_action(self, action, kind):
+        """
+        Look up a privilege by action.
+
+        :param action: The privilege action
+        :param kind: The kind of privilege, "execute" or "uri"
+        :return: The privilege or None
+        """
+        return self._actions.get("{0}|{1}".format(kind, action))
+
+    def marshal(self):
+        """
+        Return a flat structure suitable for conversion to JSON or XML.
+
+        :return: A hash with a list of configurations for each resource type
+        """
+        return {
+            'servers': [item.marshal() for item in self._servers.values()],
+            'databases': [item.marshal() for item in self._databases.values()],
+            'users': [item.marshal() for item in self._users.values()],
+            'roles': [item.marshal() for item in self._roles.values()],
+            'privileges': [item.marshal() for item in self._privileges.values()]
+            }
+
+    def __repr__(self):
+        return "ClusterSnapshot({0} databases, {1} servers, {2} users, {3} roles, {4} privileges)" \
+          .format(len(self._databases), len(self._servers), len(self._users),
+                  len(self._roles), len(self._privileges))
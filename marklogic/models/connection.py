@@ -19,7 +19,27 @@
 # Paul Hoehne       03/01/2015     Initial development
 #
 
-from requests.auth import HTTPDigestAuth
+import copy
+import gzip
+import json
+import asyncio
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+from requests.auth import HTTPDigestAuth, HTTPBasicAuth
+from marklogic.models.utilities import operations
+from marklogic.models.utilities.operations import Request, Concurrent
+from marklogic.models.utilities.auth import CachedDigestAuth
+from marklogic.models.utilities.retry import RetryPolicy
+from marklogic.models.utilities.cache import ConfigurationCache
+from marklogic.models.utilities.exceptions import MLClientException, UnexpectedManagementAPIResponse
+
+# aiohttp is only needed by AsyncConnection (pip install marklogic[async])
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 """
 Connection related classes and method to connect to MarkLogic.
@@ -31,13 +51,619 @@ class Connection:
     a MarkLogic server.  The server (for the purpose of loading data
     or creating databases, will listen on ports 8000 and 8002.
     It depends on the database auth class from the requests package.
+
+    Each connection owns a pooled, keep-alive HTTP session.  All of
+    the model classes send their requests through the connection, so
+    TCP connections are reused between calls instead of being opened
+    for every request.
+
+    Digest authentication is handled by a CachedDigestAuth object that
+    reuses the server's nonce across requests, so only the first
+    request (or one made after the nonce expires) needs a challenge
+    round trip.  A plain HTTPDigestAuth object passed to the
+    constructor is replaced with an equivalent CachedDigestAuth.
+
+    With `compress_requests` the document writes of Database.load_file
+    and Database.write_documents (and so of the loaders) are gzip
+    compressed when they are at least `compression_threshold` bytes
+    long.  Streamed (file) bodies are sent as they are.  Other requests,
+    including all management API calls, are only compressed when they
+    are sent with `compress=True`, because not every server endpoint
+    accepts a compressed body.  Compression is off by default.
+
+    Requests that fail for transient reasons, such as a 503 while the
+    server restarts, are retried with backoff as the `retry_policy`
+    allows; by default a RetryPolicy that retries idempotent requests up
+    to five times.  Pass RetryPolicy(max_attempts=1) to never retry.
+
+    Configuration lookups (Database.lookup, Server.lookup and so on) go
+    through a per-connection ConfigurationCache of up to `cache_size`
+    objects, each kept for at most `cache_ttl` seconds.  A cached object
+    is revalidated with If-None-Match on every lookup and a copy of it
+    is returned if the server answers 304 Not Modified, so the payload
+    is neither sent nor unmarshalled again.  Any other request to the
+    management port empties the cache.  A `cache_size` of 0 turns the
+    cache off.
     """
-    def __init__(self, host, auth, port=8000, management_port=8002):
+    def __init__(self, host, auth, port=8000, management_port=8002,
+                 pool_size=10, management_pool_size=10, compress_requests=False,
+                 compression_threshold=1024, retry_policy=None, admin_port=8001,
+                 cache_size=256, cache_ttl=60.0):
+        """
+        Create a connection.
+
+        :param host: The MarkLogic host name
+        :param auth: The requests authentication object
+        :param port: The REST API port
+        :param management_port: The management API port
+        :param pool_size: The maximum number of pooled connections to the REST API port
+        :param management_pool_size: The maximum number of pooled connections to the management API port
+        :param compress_requests: Gzip large document writes
+        :param compression_threshold: The smallest body size in bytes that is compressed
+        :param retry_policy: The RetryPolicy, by default RetryPolicy()
+        :param admin_port: The admin API port
+        :param cache_size: The maximum number of cached configuration objects
+        :param cache_ttl: The maximum age in seconds of a cached configuration object
+        :return: The connection object
+        """
         self.host = host
         self.port = port
         self.management_port = management_port
+        self.admin_port = admin_port
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.configuration_cache = None
+        if cache_size > 0:
+            self.configuration_cache = ConfigurationCache(cache_size, cache_ttl)
+        if type(auth) is HTTPDigestAuth:
+            auth = CachedDigestAuth(auth.username, auth.password)
         self.auth = auth
+        self.pool_size = pool_size
+        self.management_pool_size = management_pool_size
+        self.compress_requests = compress_requests
+        self.compression_threshold = compression_threshold
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.mount("http://{0}:{1}/".format(host, port),
+                           HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount("http://{0}:{1}/".format(host, management_port),
+                           HTTPAdapter(pool_maxsize=management_pool_size))
 
     @classmethod
     def make_connection(cls, host, username, password):
-        return Connection(host, HTTPDigestAuth(username, password))
\ No newline at end of file
+        return Connection(host, CachedDigestAuth(username, password))
+
+    def for_host(self, host):
+        """
+        Create a connection to another host of the same cluster, with
+        the same ports, pool sizes and credentials but its own session
+        and connection pools.
+
+        :param host: The host name
+        :return: The new connection
+        """
+        auth = self.auth
+        if isinstance(auth, CachedDigestAuth):
+            # Each host issues its own nonces
+            auth = CachedDigestAuth(auth.username, auth.password)
+        return Connection(host, auth, port=self.port,
+                          management_port=self.management_port,
+                          pool_size=self.pool_size,
+                          management_pool_size=self.management_pool_size,
+                          compress_requests=self.compress_requests,
+                          compression_threshold=self.compression_threshold,
+                          retry_policy=self.retry_policy,
+                          admin_port=self.admin_port,
+                          cache_size=self.cache_size,
+                          cache_ttl=self.cache_ttl)
+
+    def request(self, method, uri, **kwargs):
+        """
+        Send a request over the pooled session of this connection.
+
+        :param method: The HTTP method
+        :param uri: The request URI
+        :param kwargs: Additional arguments passed on to requests,
+          `compress` to gzip a large POST or PUT body and
+          `retry` to override whether the retry policy applies to the method
+        :return: The response
+        """
+        kwargs, retry = self._prepare_request(method, uri, kwargs)
+        return self.retry_policy.send(method,
+                                      lambda: self.session.request(method, uri, **kwargs),
+                                      body=kwargs.get('data'), retry=retry)
+
+    def _prepare_request(self, method, uri, kwargs):
+        """
+        Apply the cache invalidation and compression of this connection
+        to the arguments of a request.  AsyncConnection shares it.
+
+        :return: The arguments to send and the retry override
+        """
+        kwargs = dict(kwargs)
+        compress = kwargs.pop('compress', False)
+        retry = kwargs.pop('retry', None)
+        if (self.configuration_cache is not None and method not in ('GET', 'HEAD')
+            and urlparse(uri).port == self.management_port):
+            self.configuration_cache.invalidate()
+        if compress and method in ('POST', 'PUT'):
+            kwargs = self._compress_body(kwargs)
+        return kwargs, retry
+
+    def _compress_body(self, kwargs):
+        headers = dict(kwargs.get('headers') or {})
+        if 'content-encoding' in [name.lower() for name in headers]:
+            return kwargs
+
+        data = kwargs.get('data')
+        if kwargs.get('json') is not None and data is None:
+            data = json.dumps(kwargs['json']).encode('utf-8')
+            if 'content-type' not in [name.lower() for name in headers]:
+                headers['Content-Type'] = 'application/json'
+        elif isinstance(data, str):
+            data = data.encode('utf-8')
+        elif not isinstance(data, (bytes, bytearray, memoryview)):
+            # Streamed and form bodies are sent as they are
+            return kwargs
+
+        if len(data) < self.compression_threshold:
+            return kwargs
+
+        kwargs = dict(kwargs)
+        kwargs.pop('json', None)
+        headers['Content-Encoding'] = 'gzip'
+        kwargs['headers'] = headers
+        kwargs['data'] = gzip.compress(data, compresslevel=6)
+        return kwargs
+
+    def lookup_configuration(self, uri, unmarshal):
+        """
+        Read a configuration from the management API, through the
+        configuration cache.
+
+        :param uri: The properties URI of the resource
+        :param unmarshal: A function that makes an object from the JSON payload
+        :return: The object, with its etag set, or None if the resource does not exist
+        """
+        return self.run(configuration_lookup(self, uri, unmarshal))
+
+    def run(self, operation):
+        """
+        Run a model operation (see marklogic.models.utilities.operations)
+        with blocking I/O.  Concurrent steps run on a thread pool.
+
+        :param operation: The operation
+        :return: The result of the operation
+        """
+        return operations.run(operation, self._perform)
+
+    def _perform(self, step):
+        if isinstance(step, Concurrent):
+            with ThreadPoolExecutor(max_workers=step.max_workers) as executor:
+                futures = [executor.submit(self.run, operation)
+                           for operation in step.operations]
+            return [(future.result() if future.exception() is None else None,
+                     future.exception()) for future in futures]
+        return self.request(step.method, step.uri, **step.kwargs)
+
+    def prepare_auth(self, uri):
+        """
+        Make sure a digest challenge is cached before sending a body
+        that is expensive to send twice, such as a streamed file.
+        Without one the body is sent once only to be answered with a
+        401 and then again with the credentials.
+
+        :param uri: A URI on the port the body will be sent to
+        """
+        auth = self.auth
+        if isinstance(auth, CachedDigestAuth) and not auth.has_challenge():
+            self.head(uri)
+
+    def get(self, uri, **kwargs):
+        """
+        Send a GET request over this connection.
+
+        :param uri: The request URI
+        :return: The response
+        """
+        return self.request('GET', uri, **kwargs)
+
+    def head(self, uri, **kwargs):
+        """
+        Send a HEAD request over this connection.
+
+        :param uri: The request URI
+        :return: The response
+        """
+        return self.request('HEAD', uri, **kwargs)
+
+    def post(self, uri, **kwargs):
+        """
+        Send a POST request over this connection.
+
+        :param uri: The request URI
+        :return: The response
+        """
+        return self.request('POST', uri, **kwargs)
+
+    def put(self, uri, **kwargs):
+        """
+        Send a PUT request over this connection.
+
+        :param uri: The request URI
+        :return: The response
+        """
+        return self.request('PUT', uri, **kwargs)
+
+    def delete(self, uri, **kwargs):
+        """
+        Send a DELETE request over this connection.
+
+        :param uri: The request URI
+        :return: The response
+        """
+        return self.request('DELETE', uri, **kwargs)
+
+    def close(self):
+        """
+        Close the pooled connections held by this connection.
+        """
+        self.session.close()
+
+
+def configuration_lookup(connection, uri, unmarshal):
+    """
+    The operation behind `lookup_configuration`, for the models' own
+    operations to use with `yield from`.
+
+    :param connection: The Connection or AsyncConnection
+    :param uri: The properties URI of the resource
+    :param unmarshal: A function that makes an object from the JSON payload
+    :return: The object, with its etag set, or None if the resource does not exist
+    """
+    cache = connection.configuration_cache
+    entry = cache.get(uri) if cache is not None else None
+
+    headers = {'accept': 'application/json'}
+    if entry is not None:
+        headers['if-none-match'] = entry[0]
+
+    response = yield Request('GET', uri, headers=headers)
+
+    if response.status_code == 304 and entry is not None:
+        cache.record(True)
+        return copy.deepcopy(entry[1])
+
+    if response.status_code == 200:
+        result = unmarshal(json.loads(response.text))
+        if 'etag' in response.headers:
+            result.etag = response.headers['etag']
+            if cache is not None:
+                cache.record(False)
+                cache.put(uri, result.etag, copy.deepcopy(result))
+        return result
+
+    if cache is not None:
+        cache.invalidate(uri)
+    if response.status_code == 404:
+        return None
+    raise UnexpectedManagementAPIResponse(response.text)
+
+
+class AsyncResponse:
+    """
+    A response read completely by an AsyncConnection.  It has the
+    attributes of a requests response that the models use.
+    """
+    def __init__(self, status_code, reason, headers, content, encoding, url):
+        """
+        Create a response.
+
+        :param status_code: The HTTP status code
+        :param reason: The HTTP reason phrase
+        :param headers: The case insensitive response headers
+        :param content: The body as bytes
+        :param encoding: The character encoding of the body
+        :param url: The request URL
+        :return: The response object
+        """
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.url = url
+
+    @property
+    def text(self):
+        """
+        The body as a string.
+        """
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        """
+        The body parsed as JSON.
+
+        :return: The JSON structure
+        """
+        return json.loads(self.text)
+
+    def close(self):
+        """
+        Nothing to release, the body has already been read.
+        """
+        pass
+
+
+class AsyncConnection:
+    """
+    The AsyncConnection class is a connection for asyncio code.  It
+    takes its host, ports, credentials, pool sizes, retry policy,
+    compression and configuration cache from a Connection, but sends
+    its requests with aiohttp, which is an optional dependency
+    (pip install marklogic[async]).
+
+    The model methods that support it accept an AsyncConnection in
+    place of a Connection and then return an awaitable; their
+    docstrings say so.  They share their URIs, payloads, marshalling
+    and error handling with the blocking API (see
+    marklogic.models.utilities.operations).  For example::
+
+        async with AsyncConnection(Connection.make_connection(host, user, password)) as aconn:
+            db = await Database.lookup(aconn, "Documents")
+            await db.write_documents(aconn, documents)
+            forest = await Forest.lookup(aconn, "Documents")
+
+    Responses are read completely and returned as AsyncResponse
+    objects.  Connection failures and timeouts are raised as the
+    `requests` exceptions a Connection raises, so the models and the
+    retry policy handle both in the same way.
+
+    Digest and basic credentials are supported.  The digest challenge
+    is kept per host and port, so steady state requests are
+    authenticated on the first attempt.
+    """
+    def __init__(self, connection):
+        """
+        Create an asynchronous connection.
+
+        :param connection: The Connection to take the settings from
+        :return: The asynchronous connection object
+        """
+        if aiohttp is None:
+            raise MLClientException("AsyncConnection needs aiohttp: pip install marklogic[async]")
+        self.connection = connection
+        self._session = None
+
+    @property
+    def host(self):
+        """
+        The host name.
+        """
+        return self.connection.host
+
+    @property
+    def port(self):
+        """
+        The REST API port.
+        """
+        return self.connection.port
+
+    @property
+    def management_port(self):
+        """
+        The management API port.
+        """
+        return self.connection.management_port
+
+    @property
+    def admin_port(self):
+        """
+        The admin API port.
+        """
+        return self.connection.admin_port
+
+    @property
+    def compress_requests(self):
+        """
+        Whether document writes are compressed.
+        """
+        return self.connection.compress_requests
+
+    @property
+    def configuration_cache(self):
+        """
+        The configuration cache, shared with the Connection.
+        """
+        return self.connection.configuration_cache
+
+    @property
+    def retry_policy(self):
+        """
+        The RetryPolicy.
+        """
+        return self.connection.retry_policy
+
+    def for_host(self, host):
+        """
+        Create an asynchronous connection to another host of the same
+        cluster.  See `Connection.for_host`.
+
+        :param host: The host name
+        :return: The new asynchronous connection
+        """
+        return AsyncConnection(self.connection.for_host(host))
+
+    def _get_session(self):
+        # Created on first use, inside the event loop it belongs to
+        if self._session is None:
+            auth = self.connection.auth
+            session_auth = None
+            middlewares = ()
+            if isinstance(auth, HTTPDigestAuth):
+                middlewares = (_DigestAuthMiddleware(auth.username, auth.password),)
+            elif isinstance(auth, HTTPBasicAuth):
+                session_auth = aiohttp.BasicAuth(auth.username, auth.password)
+            elif auth is not None:
+                raise MLClientException("AsyncConnection does not support {0}"
+                                        .format(type(auth).__name__))
+
+            limit = max(self.connection.pool_size, self.connection.management_pool_size)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0, limit_per_host=limit),
+                auth=session_auth, middlewares=middlewares)
+        return self._session
+
+    async def request(self, method, uri, **kwargs):
+        """
+        Send a request.  The arguments are those of `Connection.request`.
+
+        :param method: The HTTP method
+        :param uri: The request URI
+        :return: The AsyncResponse
+        """
+        kwargs, retry = self.connection._prepare_request(method, uri, kwargs)
+        session = self._get_session()
+
+        options = dict(kwargs)
+        timeout = options.pop('timeout', None)
+        if isinstance(timeout, tuple):
+            options['timeout'] = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        elif timeout is not None:
+            options['timeout'] = aiohttp.ClientTimeout(total=timeout)
+
+        async def send():
+            try:
+                async with session.request(method, uri, **options) as response:
+                    content = await response.read()
+                    return AsyncResponse(response.status, response.reason, response.headers,
+                                         content, response.get_encoding(), str(response.url))
+            except asyncio.TimeoutError as error:
+                raise requests.exceptions.Timeout(error) from error
+            except aiohttp.ClientConnectionError as error:
+                raise requests.exceptions.ConnectionError(error) from error
+            except aiohttp.ClientError as error:
+                raise requests.exceptions.RequestException(error) from error
+
+        return await self.retry_policy.send_async(method, send, body=kwargs.get('data'),
+                                                  retry=retry)
+
+    def get(self, uri, **kwargs):
+        """
+        Send a GET request over this connection.
+
+        :param uri: The request URI
+        :return: An awaitable for the response
+        """
+        return self.request('GET', uri, **kwargs)
+
+    def head(self, uri, **kwargs):
+        """
+        Send a HEAD request over this connection.
+
+        :param uri: The request URI
+        :return: An awaitable for the response
+        """
+        return self.request('HEAD', uri, **kwargs)
+
+    def post(self, uri, **kwargs):
+        """
+        Send a POST request over this connection.
+
+        :param uri: The request URI
+        :return: An awaitable for the response
+        """
+        return self.request('POST', uri, **kwargs)
+
+    def put(self, uri, **kwargs):
+        """
+        Send a PUT request over this connection.
+
+        :param uri: The request URI
+        :return: An awaitable for the response
+        """
+        return self.request('PUT', uri, **kwargs)
+
+    def delete(self, uri, **kwargs):
+        """
+        Send a DELETE request over this connection.
+
+        :param uri: The request URI
+        :return: An awaitable for the response
+        """
+        return self.request('DELETE', uri, **kwargs)
+
+    def lookup_configuration(self, uri, unmarshal):
+        """
+        Read a configuration from the management API, through the
+        configuration cache.  See `Connection.lookup_configuration`.
+
+        :param uri: The properties URI of the resource
+        :param unmarshal: A function that makes an object from the JSON payload
+        :return: An awaitable for the object, or None if the resource does not exist
+        """
+        return self.run(configuration_lookup(self, uri, unmarshal))
+
+    async def run(self, operation):
+        """
+        Run a model operation (see marklogic.models.utilities.operations)
+        without blocking the event loop.  Concurrent steps run as tasks.
+
+        :param operation: The operation
+        :return: The result of the operation
+        """
+        return await operations.run_async(operation, self._perform)
+
+    async def _perform(self, step):
+        if isinstance(step, Concurrent):
+            semaphore = asyncio.Semaphore(step.max_workers)
+
+            async def run_one(operation):
+                async with semaphore:
+                    try:
+                        return (await self.run(operation), None)
+                    except Exception as exception:
+                        return (None, exception)
+
+            return await asyncio.gather(*[run_one(operation) for operation in step.operations])
+        return await self.request(step.method, step.uri, **step.kwargs)
+
+    async def close(self):
+        """
+        Close the HTTP session of this connection and the Connection it
+        was made from.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
+class _DigestAuthMiddleware:
+    """
+    Digest authentication for an aiohttp session with a challenge per
+    host and port.  aiohttp's DigestAuthMiddleware only answers the
+    challenges of the first host and port it sees, and the REST and
+    management APIs are on different ports.
+    """
+    def __init__(self, username, password):
+        self._username = username
+        self._password = password
+        self._origins = {}
+
+    async def __call__(self, request, handler):
+        origin = request.url.origin()
+        middleware = self._origins.get(origin)
+        if middleware is None:
+            middleware = aiohttp.DigestAuthMiddleware(self._username, self._password)
+            self._origins[origin] = middleware
+        return await middleware(request, handler)
@@ -26,14 +26,20 @@ Database related classes for manipulating MarkLogic databases
 
 
 
-import sys
-
-import requests
+import os
 import json
 import logging
+import itertools
 from marklogic.models.forest import Forest
+from marklogic.models.document import Document
+from marklogic.models.connection import configuration_lookup
+from marklogic.models.database.loader import DocumentLoader, DirectorySync, STREAM_THRESHOLD
 from marklogic.models.utilities import files
+from marklogic.models.utilities.multipart import make_boundary, encode_multipart
+from marklogic.models.utilities.multipart import content_type_boundary, decode_multipart
+from marklogic.models.utilities.multipart import disposition_filename
 from marklogic.models.utilities.utilities import PropertyLists
+from marklogic.models.utilities.operations import Request
 from marklogic.models.utilities.validators import *
 from marklogic.models.utilities.exceptions import *
 from marklogic.models.database.fragment import FragmentRoot, FragmentParent
@@ -3157,9 +3163,9 @@ class Database(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -3177,9 +3183,9 @@ class Database(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -3197,9 +3203,9 @@ class Database(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -3208,45 +3214,48 @@ class Database(PropertyLists):
 
     # ============================================================
 
-    def create(self, connection):
+    def create(self, connection, forest_threads=4):
         """
         Create a new database defined by these parameters on the given connection.
 
-        :param connection: The server connection
+        The forests of the database are created first, up to
+        `forest_threads` at a time.  If any of them fails, the forests
+        already created are removed and the database is not created.
+        If the database cannot be created, its forests are removed.
+
+        :param connection: The server connection (a Connection or AsyncConnection)
+        :param forest_threads: The maximum number of forests created concurrently
 
         :return: The database object
         """
+        return connection.run(self._create(connection, forest_threads))
+
+    def _create(self, connection, forest_threads):
         uri = "http://{0}:{1}/manage/v2/databases" \
           .format(connection.host, connection.management_port)
 
-        forest_names = []
-        # unicode doesn't exist in Python 3
-        if sys.version_info[0] < 3:
-            for forest_info in self._config['forest']:
-                if isinstance(forest_info, str) or isinstance(forest_info, str):
-                    new_forest = Forest(forest_info, host=self.hostname)
-                    new_forest.create(connection)
-                    forest_names.append(forest_info)
-
-                elif isinstance(forest_info, Forest):
-                    forest_info.create(connection)
-                    forest_names.append(forest_info.name())
-        else:
-            for forest_info in self._config['forest']:
-                if isinstance(forest_info, str):
-                    new_forest = Forest(forest_info, host=self.hostname)
-                    new_forest.create(connection)
-                    forest_names.append(forest_info)
+        forests = []
+        for forest_info in self._config['forest']:
+            if isinstance(forest_info, str):
+                forests.append(Forest(forest_info, host=self.hostname))
+            elif isinstance(forest_info, Forest):
+                forests.append(forest_info)
 
-                elif isinstance(forest_info, Forest):
-                    forest_info.create(connection)
-                    forest_names.append(forest_info.name())
+        created = yield from Forest._create_forests(connection, forests, forest_threads, False)
+        forest_names = [forest.forest_name() for forest in forests]
 
         self._config['forest'] = forest_names
 
-        response = requests.post(uri, json=self._config, auth=connection.auth)
-        if response.status_code > 299:
-            raise UnexpectedManagementAPIResponse(response.text)
+        try:
+            response = yield Request('POST', uri, json=self._config)
+            if response.status_code > 299:
+                raise UnexpectedManagementAPIResponse(response.text)
+        except Exception as error:
+            try:
+                yield from Forest._remove_forests(connection, created, forest_threads)
+            except UnexpectedManagementAPIResponse as rollback_error:
+                raise UnexpectedManagementAPIResponse("{0}. {1}".format(error, rollback_error))
+            raise
 
         return self
 
@@ -3258,12 +3267,13 @@ class Database(PropertyLists):
         :param connection: The connection to a MarkLogic server
         :return: The server object
         """
-        database = Server.lookup(connection, self.database_name())
+        database = Database.lookup(connection, self.database_name())
         if database is None:
             return None
         else:
             self._config = database._config
             self.etag = database.etag
+            self.mark_clean()
             return self
 
     def update(self, connection):
@@ -3272,26 +3282,34 @@ class Database(PropertyLists):
         If the database already exists on the
         given connection, then you can update the settings with this method.
 
-        :param connection:The server connection
+        :param connection: The server connection (a Connection or AsyncConnection)
 
         :return: The database object
         """
+        return connection.run(self._update(connection))
+
+    def _update(self, connection):
         uri = "http://{0}:{1}/manage/v2/databases/{2}/properties" \
           .format(connection.host, connection.management_port, self.name)
 
+        struct = self.changed_configuration()
+        if not struct:
+            return self
+
         headers = {}
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        struct = self.marshal()
-        response = requests.put(uri, json=struct, auth=connection.auth,
-                                headers=headers)
+        response = yield Request('PUT', uri, json=struct, headers=headers)
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
 
         # In case we renamed it
         self.name = self._config['database-name']
+        # The old etag no longer matches after a successful PUT
+        self.etag = response.headers.get('etag')
+        self.mark_clean()
 
         return self
 
@@ -3299,28 +3317,37 @@ class Database(PropertyLists):
         """
         Remove the given database and all its forests.
 
-        :param connection: The server connection
+        :param connection: The server connection (a Connection or AsyncConnection)
 
         :return: The database object
         """
+        return connection.run(self._delete(connection))
+
+    def _delete(self, connection):
         uri = "http://{0}:{1}/manage/v2/databases/{2}?forest-delete=data" \
           .format(connection.host, connection.management_port, self.name)
-        response = requests.delete(uri, auth=connection.auth)
+        response = yield Request('DELETE', uri)
 
         if response.status_code > 299 and not response.status_code == 404:
             raise UnexpectedManagementAPIResponse(response.text)
 
         return self
 
-    def load_file(self, connection, path, uri, collections=None, content_type="application/json"):
+    def load_file(self, connection, path, uri, collections=None, content_type="application/json",
+                  stream_threshold=STREAM_THRESHOLD):
         """
         Load a given file into a given database.
 
+        Files larger than `stream_threshold` bytes are streamed from
+        disk into the request body instead of being read into memory
+        first.
+
         :param connection: The server connection
         :param path: The path to the file
         :param uri: The uri for the file contents in the database
         :param collections: A list of collections
         :param content_type: The content type of the data
+        :param stream_threshold: The file size above which the file is streamed
 
         :return: The database object
         """
@@ -3331,87 +3358,219 @@ class Database(PropertyLists):
             for collection in collections:
                 doc_url += ("&collection=" + collection)
 
-        with open(path) as data_file:
-            file_data = data_file.read()
-            response = requests.put(doc_url, data=file_data, auth=connection.auth,
-                                    headers={'content-type': content_type})
+        with open(path, "rb") as data_file:
+            if os.fstat(data_file.fileno()).st_size > stream_threshold:
+                connection.prepare_auth(doc_url)
+                file_data = data_file
+            else:
+                file_data = data_file.read()
+            response = connection.put(doc_url, data=file_data,
+                                      headers={'content-type': content_type},
+                                      compress=connection.compress_requests)
             if response.status_code > 299:
                 raise UnexpectedAPIResponse(response.text)
 
         return self
 
-    def load_directory_files(self, connection, path, prefix="/", collections=None, content_type="application/json"):
+    def load_directory_files(self, connection, path, prefix="/", collections=None, content_type="application/json",
+                             threads=None):
         """
         Load all the given files in a directory.  It will combine the prefix with the filename to generate
         a uri for the file on the server.
 
+        If `threads` is given, the files are loaded in batches by a
+        DocumentLoader with that many worker threads.
+
         :param connection: The server connection
         :param path: The path to the directory
         :param prefix: The prefix to the individuals files
         :param collections: A list of collections to use for the files
         :param content_type: The content type of the files
+        :param threads: The number of loader threads, or None to load one file at a time
 
         :return: The database object
         """
-        file_list = files.walk_directories(path)
+        file_list = files.iter_files(path)
+        if threads is not None:
+            loader = DocumentLoader(connection, self, threads=threads,
+                                    collections=collections, content_type=content_type)
+            loader.load_files((result['partial-directory'], prefix + result['filename'], result['size'])
+                              for result in file_list)
+            return self
+
         for result in file_list:
             self.load_file(connection, result['partial-directory'], prefix + result['filename'],
                            collections=collections, content_type=content_type)
         return self
 
-    def load_directory(self, connection, path, prefix="/", collections=None, content_type="application/json"):
+    def load_directory(self, connection, path, prefix="/", collections=None, content_type="application/json",
+                       threads=None):
         """
         Load all the file in a directory, preserving the partial path between the directory root and the
         file.  So a file located at /data/files/myfile.xml, with a prefix parameter of '/data' will be
         loaded as /files/myfile.xml.  (Using the default prefix).
 
+        If `threads` is given, the files are loaded in batches by a
+        DocumentLoader with that many worker threads.  Use a
+        DocumentLoader directly to control the batch size and the
+        in-flight byte cap, or to get the load statistics.
+
         :param connection: The server connection
         :param path: The path to the directory root
         :param prefix: The prefix to use when constructing the server URI for the file
         :param collections: The collections to use for the files
         :param content_type: The content type of the files
+        :param threads: The number of loader threads, or None to load one file at a time
 
         :return: The database object
         """
-        file_list = files.walk_directories(path)
+        if threads is not None:
+            loader = DocumentLoader(connection, self, threads=threads,
+                                    collections=collections, content_type=content_type)
+            loader.load_directory(path, prefix)
+            return self
+
+        file_list = files.iter_files(path)
         for result in file_list:
             self.load_file(connection, result['partial-directory'], prefix + result['partial-directory'],
                            collections=collections, content_type=content_type)
         return self
 
+    def sync_directory(self, connection, path, manifest_path, prefix="/", collections=None,
+                       content_type="application/json", delete=False, threads=8):
+        """
+        Incrementally load a directory, as `load_directory` does, but only
+        upload the files that are new or changed since the last sync.  The
+        state of the last sync is kept in a local manifest file.  See
+        DirectorySync for the details.
+
+        :param connection: The server connection
+        :param path: The path to the directory root
+        :param manifest_path: The path of the local manifest file
+        :param prefix: The prefix to use when constructing the server URI for the file
+        :param collections: The collections to use for the files
+        :param content_type: The content type of the files
+        :param delete: Delete the documents of files that were removed
+        :param threads: The number of loader threads
+
+        :return: A dictionary with the 'uploaded', 'unchanged' and 'deleted' counts
+        """
+        sync = DirectorySync(connection, self, manifest_path, prefix=prefix,
+                             collections=collections, content_type=content_type,
+                             delete=delete, threads=threads)
+        return sync.sync(path)
+
+    def write_documents(self, connection, documents, batch_size=100):
+        """
+        Write many documents with as few requests as possible.  The
+        documents are consumed lazily from the iterable and sent in
+        batches of `batch_size` documents as multipart/mixed POSTs
+        to /v1/documents.  Each document carries its own URI, content
+        type, collections and permissions.
+
+        :param connection: The server connection (a Connection or AsyncConnection)
+        :param documents: An iterable of Document objects
+        :param batch_size: The number of documents sent per request
+
+        :return: The database object
+        """
+        return connection.run(self._write_documents(connection, documents, batch_size))
+
+    def _write_documents(self, connection, documents, batch_size):
+        doc_url = "http://{0}:{1}/v1/documents?database={2}" \
+          .format(connection.host, connection.port, self.name)
+
+        documents = iter(documents)
+        while True:
+            batch = list(itertools.islice(documents, batch_size))
+            if not batch:
+                break
+            yield from self._write_batch(connection, doc_url, batch)
+
+        return self
+
+    def delete_documents(self, connection, document_uris, batch_size=100):
+        """
+        Delete many documents, `batch_size` URIs per request.
+
+        :param connection: The server connection (a Connection or AsyncConnection)
+        :param document_uris: An iterable of document URIs
+        :param batch_size: The number of documents deleted per request
+
+        :return: The database object
+        """
+        return connection.run(self._delete_documents(connection, document_uris, batch_size))
+
+    def _delete_documents(self, connection, document_uris, batch_size):
+        document_uris = iter(document_uris)
+        while True:
+            batch = list(itertools.islice(document_uris, batch_size))
+            if not batch:
+                break
+
+            doc_url = "http://{0}:{1}/v1/documents" \
+              .format(connection.host, connection.port)
+            params = [('database', self.name)] + [('uri', uri) for uri in batch]
+
+            response = yield Request('DELETE', doc_url, params=params)
+            if response.status_code > 299:
+                raise UnexpectedAPIResponse(response.text)
+
+        return self
+
+    def _write_batch(self, connection, doc_url, batch):
+        """
+        Send one batch of documents as a single multipart request.
+        """
+        parts = []
+        for document in batch:
+            assert_type(document, Document)
+            disposition = 'attachment; filename="{0}"'.format(document.uri())
+            metadata = document.metadata()
+            if metadata is not None:
+                parts.append(({'Content-Type': 'application/json',
+                               'Content-Disposition': disposition + '; category=metadata'},
+                              json.dumps(metadata).encode('utf-8')))
+            parts.append(({'Content-Type': document.content_type(),
+                           'Content-Disposition': disposition},
+                          document.content_bytes()))
+
+        boundary = make_boundary()
+        response = yield Request('POST', doc_url, data=encode_multipart(parts, boundary),
+                                 headers={'content-type': 'multipart/mixed; boundary=' + boundary,
+                                          'accept': 'application/json'},
+                                 compress=connection.compress_requests)
+        if response.status_code > 299:
+            raise UnexpectedAPIResponse(response.text)
+
     @classmethod
     def lookup(cls, connection, name):
         """
         Lookup a database configuration by name.
 
         :param name:The name of the database
-        :param connection:The server connection
+        :param connection:The server connection (a Connection or AsyncConnection)
 
         :return: The database configuration
         """
+        return connection.run(cls._lookup(connection, name))
+
+    @classmethod
+    def _lookup(cls, connection, name):
         uri = "http://{0}:{1}/manage/v2/databases/{2}/properties" \
           .format(connection.host, connection.management_port, name)
 
         logging.info("Reading database configuration: {0}".format(name))
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
-
-        result = None
-        if response.status_code == 200:
-            result = Database.unmarshal(json.loads(response.text))
-            if 'etag' in response.headers:
-                result.etag = response.headers['etag']
-
-        elif response.status_code != 404:
-            raise UnexpectedManagementAPIResponse(response.text)
-
+        result = yield from configuration_lookup(connection, uri, Database.unmarshal)
+        if result is not None:
+            result.mark_clean()
         return result
 
     @classmethod
     def list_databases(cls, connection):
         uri = "http://{0}:{1}/manage/v2/databases".format(connection.host, connection.management_port)
-        response = requests.get(uri, auth=connection.auth, headers={'accept': 'application/json'})
+        response = connection.get(uri, headers={'accept': 'application/json'})
 
         if response.status_code == 200:
             response_json = json.loads(response.text)
@@ -4008,7 +4167,7 @@ class Database(PropertyLists):
         doc_url = "http://{0}:{1}/v1/documents?uri={2}&database={3}" \
           .format(conn.host, conn.port, document_uri, self.name)
 
-        response = requests.get(doc_url, auth=conn.auth, headers={'accept': content_type})
+        response = conn.get(doc_url, headers={'accept': content_type})
         if response.status_code == 404:
             return None
         elif response.status_code == 200:
@@ -4016,3 +4175,141 @@ class Database(PropertyLists):
         else:
             raise UnexpectedAPIResponse(response.text)
 
+    def get_document_stream(self, conn, document_uri, content_type='*/*', chunk_size=64 * 1024):
+        """
+        Read a document without holding the whole body in memory.
+
+        The response is closed when the iterator is exhausted.  Call
+        the iterator's `close()` method to release the connection if
+        the document is not read to the end.
+
+        :param conn: The server connection
+        :param document_uri: The URI of the document
+        :param content_type: The accepted content type
+        :param chunk_size: The size of the chunks
+
+        :return: An iterator of bytes chunks, or None if there is no such document
+        """
+        doc_url = "http://{0}:{1}/v1/documents".format(conn.host, conn.port)
+        params = {'uri': document_uri, 'database': self.name}
+
+        response = conn.get(doc_url, params=params, headers={'accept': content_type}, stream=True)
+        if response.status_code == 404:
+            response.close()
+            return None
+        elif response.status_code != 200:
+            raise UnexpectedAPIResponse(response.text)
+
+        def chunks():
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    yield chunk
+            finally:
+                response.close()
+
+        return chunks()
+
+    def download_document(self, conn, document_uri, target, content_type='*/*', chunk_size=64 * 1024):
+        """
+        Read a document straight into a file object or a writable buffer.
+
+        If `target` has a `write` method, the document is copied to it
+        through a single reusable buffer of `chunk_size` bytes.  Otherwise
+        `target` must be a writable buffer, such as a bytearray or a
+        memoryview, large enough to hold the document; the body is read
+        directly into it.
+
+        :param conn: The server connection
+        :param document_uri: The URI of the document
+        :param target: A file object or writable buffer
+        :param content_type: The accepted content type
+        :param chunk_size: The size of the copy buffer
+
+        :return: The number of bytes read, or None if there is no such document
+        """
+        doc_url = "http://{0}:{1}/v1/documents".format(conn.host, conn.port)
+        params = {'uri': document_uri, 'database': self.name}
+
+        response = conn.get(doc_url, params=params, headers={'accept': content_type}, stream=True)
+        if response.status_code == 404:
+            response.close()
+            return None
+        elif response.status_code != 200:
+            raise UnexpectedAPIResponse(response.text)
+
+        raw = response.raw
+        raw.decode_content = True
+        total = 0
+        try:
+            if hasattr(target, 'write'):
+                view = memoryview(bytearray(chunk_size))
+                count = raw.readinto(view)
+                while count:
+                    target.write(view[:count])
+                    total += count
+                    count = raw.readinto(view)
+            else:
+                view = memoryview(target).cast('B')
+                count = raw.readinto(view)
+                while count:
+                    total += count
+                    if total == len(view):
+                        if raw.read(1):
+                            raise ValueError("The buffer is too small for the document")
+                        break
+                    count = raw.readinto(view[total:])
+        finally:
+            response.close()
+
+        return total
+
+    def get_documents(self, conn, document_uris, batch_size=100):
+        """
+        Read many documents with as few requests as possible.  The
+        documents are requested `batch_size` at a time as a single
+        multipart/mixed response each.
+
+        Documents that do not exist are not included in the result.
+
+        The content of each document is a memoryview slice of the
+        response body it arrived in, so no document is copied.  A
+        slice keeps its whole response body alive (it is the slice's
+        `obj`); use `bytes()` to copy a document that is kept longer
+        than the rest.
+
+        :param conn: The server connection (a Connection or AsyncConnection)
+        :param document_uris: A list of document URIs
+        :param batch_size: The number of documents read per request
+
+        :return: A dictionary mapping the URIs to the document content as memoryviews
+        """
+        return conn.run(self._get_documents(conn, document_uris, batch_size))
+
+    def _get_documents(self, conn, document_uris, batch_size):
+        result = {}
+        document_uris = iter(document_uris)
+        while True:
+            batch = list(itertools.islice(document_uris, batch_size))
+            if not batch:
+                break
+
+            doc_url = "http://{0}:{1}/v1/documents" \
+              .format(conn.host, conn.port)
+            params = [('database', self.name)] + [('uri', uri) for uri in batch]
+
+            response = yield Request('GET', doc_url, params=params, headers={'accept': 'multipart/mixed'})
+            if response.status_code == 404:
+                continue
+            elif response.status_code != 200:
+                raise UnexpectedAPIResponse(response.text)
+
+            boundary = content_type_boundary(response.headers.get('content-type'))
+            if boundary is None:
+                raise UnexpectedAPIResponse("Expected a multipart response")
+
+            for headers, body in decode_multipart(response.content, boundary):
+                uri = disposition_filename(headers)
+                if uri is not None:
+                    result[uri] = body
+
+        return result
@@ -23,7 +23,6 @@
 Classes for dealing with scheduled backups
 """
 
-import requests
 import json
 from marklogic.models.utilities.validators import *
 from marklogic.models.utilities.exceptions import *
@@ -74,9 +73,9 @@ class DatabaseBackup:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -121,9 +120,9 @@ class DatabaseBackup:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -142,9 +141,9 @@ class DatabaseBackup:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -164,9 +163,9 @@ class DatabaseBackup:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -188,9 +187,9 @@ class DatabaseBackup:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -241,9 +240,9 @@ class DatabaseRestore:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -287,9 +286,9 @@ class DatabaseRestore:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -308,9 +307,9 @@ class DatabaseRestore:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -330,9 +329,9 @@ class DatabaseRestore:
         uri = "http://{0}:{1}/manage/v2/databases/{2}" \
           .format(conn.host, conn.management_port, self.database_name)
 
-        response = requests.post(uri, json=payload, auth=conn.auth,
-                                 headers={'content-type': 'application/json',
-                                          'accept': 'application/json'})
+        response = conn.post(uri, json=payload,
+                             headers={'content-type': 'application/json',
+                                      'accept': 'application/json'})
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -0,0 +1,484 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Classes for loading many files into a database in parallel
+"""
+
+import os
+import json
+import time
+import itertools
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from marklogic.models.host import Host
+from marklogic.models.document import Document
+from marklogic.models.utilities import files
+
+# Files larger than this are streamed from disk when they are loaded
+STREAM_THRESHOLD = 16 * 1024 * 1024
+
+# The memory charged against the in-flight cap for a streamed file
+STREAM_BUFFER = 64 * 1024
+
+class LoadStatistics:
+    """
+    The LoadStatistics class records the progress of a load: the
+    number of documents and bytes written and the elapsed time.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.bytes = 0
+        self.start_time = time.time()
+        self.end_time = None
+
+    def record(self, documents, size):
+        """
+        Record a batch of documents that has been written.
+
+        :param documents: The number of documents
+        :param size: The number of bytes
+        """
+        with self._lock:
+            self.documents += documents
+            self.bytes += size
+
+    def finish(self):
+        """
+        Mark the end of the load.
+        """
+        self.end_time = time.time()
+
+    def elapsed(self):
+        """
+        The elapsed time of the load in seconds.
+
+        :return: The elapsed time
+        """
+        end_time = self.end_time if self.end_time is not None else time.time()
+        return end_time - self.start_time
+
+    def documents_per_second(self):
+        """
+        The document throughput of the load.
+
+        :return: Documents per second
+        """
+        elapsed = self.elapsed()
+        return self.documents / elapsed if elapsed > 0 else 0.0
+
+    def bytes_per_second(self):
+        """
+        The byte throughput of the load.
+
+        :return: Bytes per second
+        """
+        elapsed = self.elapsed()
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def __repr__(self):
+        return "LoadStatistics({0} documents, {1} bytes, {2:.2f} docs/sec, {3:.0f} bytes/sec)" \
+          .format(self.documents, self.bytes, self.documents_per_second(),
+                  self.bytes_per_second())
+
+
+class _ByteBudget:
+    """
+    Limits the number of bytes read into memory but not yet written
+    to the server.  A single request larger than the whole budget is
+    allowed through when nothing else is in flight.
+    """
+    def __init__(self, limit):
+        self._limit = limit
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        with self._condition:
+            while self._in_flight > 0 and self._in_flight + size > self._limit:
+                self._condition.wait()
+            self._in_flight += size
+
+    def release(self, size):
+        with self._condition:
+            self._in_flight -= size
+            self._condition.notify_all()
+
+
+class DocumentLoader:
+    """
+    The DocumentLoader class writes files to a database with a bounded
+    pool of worker threads.  Files are grouped into batches that are
+    read and written by the workers as multipart requests, so disk
+    reads and HTTP uploads overlap.  The number of bytes read but not
+    yet acknowledged by the server is capped by `max_in_flight_bytes`.
+
+    Files larger than `stream_threshold` are not batched: each one is
+    streamed from disk in its own request by `Database.load_file`, and
+    only counts against the in-flight cap with the size of its buffer.
+
+    The connection's pool size should be at least `threads`, otherwise
+    the extra HTTP connections are not reused.
+
+    By default every batch is written through the given connection.
+    With `host_affinity` the loader looks up the hosts that serve the
+    connection's app server, the hosts in the group of the connection's
+    host (see `Host.request_hosts`), and spreads the batches over them,
+    each host with its own connection pool, so a single host does not
+    have to evaluate every request.  An explicit list of `hosts` can be
+    used instead.
+
+    If `content_type` is None the content type of each file is guessed
+    from its extension.  If a `callback` is given it is called with the
+    load statistics after every batch is written, from the worker
+    thread that wrote it.
+    """
+    def __init__(self, connection, database, threads=8, batch_size=100,
+                 max_in_flight_bytes=64 * 1024 * 1024, collections=None,
+                 content_type="application/json", host_affinity=False,
+                 hosts=None, stream_threshold=STREAM_THRESHOLD, callback=None):
+        """
+        Create a loader.
+
+        :param connection: The server connection
+        :param database: The Database to load into
+        :param threads: The number of worker threads
+        :param batch_size: The maximum number of documents per request
+        :param max_in_flight_bytes: The cap on bytes held in memory
+        :param collections: A list of collections to use for the files
+        :param content_type: The content type of the files, or None to guess it
+        :param host_affinity: Spread the batches over the hosts that serve the app server
+        :param hosts: A list of host names to spread the batches over
+        :param stream_threshold: The file size above which a file is streamed on its own
+        :param callback: A function called with the load statistics after each batch
+        :return: The loader object
+        """
+        self.connection = connection
+        self.database = database
+        self.threads = threads
+        self.batch_size = batch_size
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.collections = collections
+        self.content_type = content_type
+        self.host_affinity = host_affinity
+        self.hosts = hosts
+        self.stream_threshold = stream_threshold
+        self.callback = callback
+
+    def connections(self):
+        """
+        The connections the batches are written through.
+
+        :return: A list of connections
+        """
+        hosts = self.hosts
+        if hosts is None and self.host_affinity:
+            hosts = Host.request_hosts(self.connection)
+
+        if not hosts:
+            return [self.connection]
+
+        return [self.connection if host == self.connection.host
+                else self.connection.for_host(host)
+                for host in hosts]
+
+    def load_directory(self, path, prefix="/"):
+        """
+        Load all the files in a directory, preserving the partial path
+        as `Database.load_directory` does.
+
+        :param path: The path to the directory root
+        :param prefix: The prefix to use when constructing the server URI for the file
+        :return: The load statistics
+        """
+        return self.load_files((result['partial-directory'],
+                                prefix + result['partial-directory'],
+                                result['size'])
+                               for result in files.iter_files(path))
+
+    def load_files(self, file_list):
+        """
+        Load files into the database.  The file list is consumed lazily,
+        so the first batch is written while the rest of the list is
+        still being produced.
+
+        :param file_list: An iterable of (path, uri) or (path, uri, size) tuples
+        :return: The load statistics
+        """
+        statistics = LoadStatistics()
+        budget = _ByteBudget(self.max_in_flight_bytes)
+        # Bound the number of queued batches, not just the bytes
+        slots = threading.BoundedSemaphore(self.threads * 2)
+        errors = []
+        connection_list = self.connections()
+        connections = itertools.cycle(connection_list)
+
+        def finished(future, size):
+            budget.release(size)
+            slots.release()
+            if future.exception() is not None:
+                errors.append(future.exception())
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            batch = []
+            batch_bytes = 0
+            for item in file_list:
+                if errors:
+                    break
+
+                path, uri = item[0], item[1]
+                size = item[2] if len(item) > 2 else os.path.getsize(path)
+                if size > self.stream_threshold:
+                    self._submit(executor, next(connections), [(path, uri, size)],
+                                 STREAM_BUFFER, budget, slots, statistics, finished)
+                    continue
+
+                batch.append((path, uri, size))
+                batch_bytes += size
+                if len(batch) >= self.batch_size or batch_bytes >= self.max_in_flight_bytes:
+                    self._submit(executor, next(connections), batch, batch_bytes,
+                                 budget, slots, statistics, finished)
+                    batch = []
+                    batch_bytes = 0
+
+            if batch and not errors:
+                self._submit(executor, next(connections), batch, batch_bytes,
+                             budget, slots, statistics, finished)
+
+        statistics.finish()
+        for connection in connection_list:
+            if connection is not self.connection:
+                connection.close()
+
+        if errors:
+            raise errors[0]
+
+        logging.info("Loaded {0} into {1}".format(statistics, self.database.name))
+        return statistics
+
+    def _submit(self, executor, connection, batch, batch_bytes, budget, slots,
+                statistics, finished):
+        slots.acquire()
+        budget.acquire(batch_bytes)
+        future = executor.submit(self._write_batch, connection, batch, statistics)
+        future.add_done_callback(lambda f: finished(f, batch_bytes))
+
+    def _write_batch(self, connection, batch, statistics):
+        if len(batch) == 1 and batch[0][2] > self.stream_threshold:
+            path, uri, size = batch[0]
+            self.database.load_file(connection, path, uri, collections=self.collections,
+                                    content_type=self.file_content_type(path),
+                                    stream_threshold=self.stream_threshold)
+            self._record(statistics, 1, size)
+            return
+
+        documents = []
+        size = 0
+        for path, uri, file_size in batch:
+            with open(path, "rb") as data_file:
+                content = data_file.read()
+            size += len(content)
+            documents.append(Document(uri, content, self.file_content_type(path),
+                                      collections=self.collections))
+
+        self.database.write_documents(connection, documents,
+                                      batch_size=len(documents))
+        self._record(statistics, len(documents), size)
+
+    def _record(self, statistics, documents, size):
+        statistics.record(documents, size)
+        if self.callback is not None:
+            self.callback(statistics)
+
+    def file_content_type(self, path):
+        """
+        The content type a file is loaded with.
+
+        :param path: The path to the file
+        :return: The content type
+        """
+        if self.content_type is not None:
+            return self.content_type
+        content_type, encoding = mimetypes.guess_type(path)
+        if content_type is None or encoding is not None:
+            return "application/octet-stream"
+        return content_type
+
+
+class DirectorySync:
+    """
+    The DirectorySync class keeps a database in step with a directory
+    tree.  A local manifest records the size, modification time, content
+    hash and URI of every file that was loaded.  On each run only new
+    and changed files are uploaded, and with `delete` the documents of
+    files that were removed are deleted from the database.  So are the
+    documents at the old URIs of files whose URI changed, for example
+    because the prefix did.  Without `delete` those old URIs are kept
+    in the manifest and deleted by the next run that has it.
+
+    A file whose size and modification time are unchanged is assumed
+    to be unchanged.  Otherwise its content hash decides, so touching a
+    file does not cause it to be uploaded again.
+
+    The manifest is only written after all uploads and deletes have
+    succeeded, so a failed run is simply repeated the next time.
+    """
+    def __init__(self, connection, database, manifest_path, prefix="/",
+                 collections=None, content_type="application/json",
+                 delete=False, threads=8, batch_size=100):
+        """
+        Create a directory sync.
+
+        :param connection: The server connection
+        :param database: The Database to load into
+        :param manifest_path: The path of the local manifest file
+        :param prefix: The prefix to use when constructing the server URI for the file
+        :param collections: A list of collections to use for the files
+        :param content_type: The content type of the files
+        :param delete: Delete the documents of files that were removed
+        :param threads: The number of loader threads
+        :param batch_size: The maximum number of documents per request
+        :return: The directory sync object
+        """
+        self.connection = connection
+        self.database = database
+        self.manifest_path = manifest_path
+        self.prefix = prefix
+        self.delete = delete
+        self.batch_size = batch_size
+        self.loader = DocumentLoader(connection, database, threads=threads,
+                                     batch_size=batch_size, collections=collections,
+                                     content_type=content_type)
+
+    def sync(self, path):
+        """
+        Upload the new and changed files in a directory, preserving the
+        partial path as `Database.load_directory` does.
+
+        :param path: The path to the directory root
+        :return: A dictionary with the 'uploaded', 'unchanged' and 'deleted'
+          counts and the load 'statistics'
+        """
+        manifest = self.read_manifest()
+        pending = self.read_pending_deletes()
+        entries = {}
+        changed = {}
+        moved = []
+
+        def changed_files():
+            for result in files.iter_files(path):
+                filename = result['partial-directory']
+                uri = self.prefix + filename
+                entry = {'size': result['size'], 'mtime': result['mtime'], 'uri': uri}
+                old = manifest.get(filename)
+
+                if (old is not None and old['uri'] == uri
+                    and old['size'] == entry['size'] and old['mtime'] == entry['mtime']):
+                    entries[filename] = old
+                    continue
+
+                entry['hash'] = self.file_hash(filename)
+                if old is not None and old['uri'] == uri and old['hash'] == entry['hash']:
+                    entries[filename] = entry
+                    continue
+
+                changed[filename] = entry
+                if old is not None and old['uri'] != uri:
+                    moved.append(old['uri'])
+                yield (filename, uri, entry['size'])
+
+        statistics = self.loader.load_files(changed_files())
+        unchanged = len(entries)
+
+        removed = [filename for filename in manifest
+                   if filename not in entries and filename not in changed]
+        if not self.delete:
+            for filename in removed:
+                entries[filename] = manifest[filename]
+        entries.update(changed)
+
+        # An old URI may have become current again, e.g. when the prefix
+        # was changed back, so never delete a URI the manifest still uses.
+        current = set(entry['uri'] for entry in entries.values())
+        deletes = []
+        for uri in pending + moved:
+            if uri not in current and uri not in deletes:
+                deletes.append(uri)
+
+        if self.delete:
+            deletes = [manifest[filename]['uri'] for filename in removed] + deletes
+            if deletes:
+                self.database.delete_documents(self.connection, deletes,
+                                               batch_size=self.batch_size)
+            self.write_manifest(entries)
+        else:
+            self.write_manifest(entries, pending_deletes=deletes)
+
+        return {
+            'uploaded': len(changed),
+            'unchanged': unchanged,
+            'deleted': len(deletes) if self.delete else 0,
+            'statistics': statistics
+            }
+
+    def read_manifest(self):
+        """
+        Read the manifest.
+
+        :return: A dictionary mapping file paths to their manifest entries
+        """
+        return self._load_manifest().get('files', {})
+
+    def read_pending_deletes(self):
+        """
+        Read the old URIs that a run without `delete` left undeleted.
+
+        :return: A list of document URIs
+        """
+        return self._load_manifest().get('pending-deletes', [])
+
+    def write_manifest(self, entries, pending_deletes=None):
+        """
+        Atomically replace the manifest.
+
+        :param entries: A dictionary mapping file paths to their manifest entries
+        :param pending_deletes: A list of old URIs still to be deleted
+        """
+        manifest = {'files': entries}
+        if pending_deletes:
+            manifest['pending-deletes'] = pending_deletes
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temp_path, self.manifest_path)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as manifest_file:
+            return json.load(manifest_file)
+
+    def file_hash(self, path):
+        """
+        The SHA-256 hash of the content of a file.
+
+        :param path: The path to the file
+        :return: The hex digest
+        """
+        return files.file_hash(path)
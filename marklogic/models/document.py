@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Document related classes for writing content with the REST API
+"""
+
+import json
+from marklogic.models.permission import Permission
+from marklogic.models.utilities.validators import assert_list_of_type
+from marklogic.models.utilities.validators import validate_list_of_strings
+
+class Document:
+    """
+    The Document class encapsulates a single document to be written
+    to a database: its URI, content, content type, collections
+    and permissions.
+    """
+    def __init__(self, uri, content, content_type="application/json",
+                 collections=None, permissions=None):
+        """
+        Create a document.
+
+        :param uri: The URI of the document in the database
+        :param content: The content as str, bytes or a JSON structure
+        :param content_type: The content type of the document
+        :param collections: A list of collection names
+        :param permissions: A list of Permission objects
+        :return: The document object
+        """
+        self._uri = uri
+        self._content = content
+        self._content_type = content_type
+        self._collections = None
+        self._permissions = None
+        if collections is not None:
+            self.set_collections(collections)
+        if permissions is not None:
+            self.set_permissions(permissions)
+
+    def uri(self):
+        """
+        The URI of the document.
+
+        :return: The URI
+        """
+        return self._uri
+
+    def content(self):
+        """
+        The content of the document.
+
+        :return: The content
+        """
+        return self._content
+
+    def content_type(self):
+        """
+        The content type of the document.
+
+        :return: The content type
+        """
+        return self._content_type
+
+    def collections(self):
+        """
+        The collections of the document.
+
+        :return: The list of collections or None
+        """
+        return self._collections
+
+    def set_collections(self, collections):
+        """
+        Set the collections of the document.
+
+        :param collections: A list of collection names
+        :return: The document object
+        """
+        validate_list_of_strings(collections)
+        self._collections = collections
+        return self
+
+    def permissions(self):
+        """
+        The permissions of the document.
+
+        :return: The list of permissions or None
+        """
+        return self._permissions
+
+    def set_permissions(self, permissions):
+        """
+        Set the permissions of the document.
+
+        :param permissions: A list of Permission objects
+        :return: The document object
+        """
+        self._permissions = assert_list_of_type(permissions, Permission)
+        return self
+
+    def content_bytes(self):
+        """
+        The content of the document encoded as bytes.
+
+        Strings are encoded as UTF-8, other values that are not
+        already bytes are serialized as JSON.
+
+        :return: The content as bytes
+        """
+        if isinstance(self._content, bytes):
+            return self._content
+        if isinstance(self._content, str):
+            return self._content.encode('utf-8')
+        return json.dumps(self._content).encode('utf-8')
+
+    def metadata(self):
+        """
+        The document metadata in the JSON format of the REST API.
+
+        :return: The metadata structure or None if there is no metadata
+        """
+        if self._collections is None and self._permissions is None:
+            return None
+
+        struct = {}
+        if self._collections is not None:
+            struct['collections'] = self._collections
+
+        if self._permissions is not None:
+            roles = {}
+            for perm in self._permissions:
+                if perm.role_name() not in roles:
+                    roles[perm.role_name()] = []
+                roles[perm.role_name()].append(perm.capability())
+            struct['permissions'] = [{'role-name': role, 'capabilities': roles[role]}
+                                     for role in roles]
+        return struct
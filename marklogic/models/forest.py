@@ -23,8 +23,8 @@
 #
 
 import socket
-import requests
 import json
+from .utilities.operations import Request, Concurrent
 from .utilities.validators import validate_forest_availability
 from .utilities.exceptions import UnexpectedManagementAPIResponse
 
@@ -149,34 +149,124 @@ class Forest:
         """
         return self.config['forest-name']
 
-    def create(self, connection):
+    def create(self, connection, lookup=True):
         """
         Creates the forest on the MarkLogic server.
 
-        :param connection: The connection to a MarkLogic server
+        By default the forest is read back from the server after it
+        is created, which costs two more requests.  If `lookup` is
+        False, this object, with the locally known configuration, is
+        returned instead.
+
+        :param connection: The connection to a MarkLogic server (a Connection or AsyncConnection)
+        :param lookup: Read the forest back from the server
         :return: The Forest object
         """
+        return connection.run(self._create(connection, lookup))
+
+    def _create(self, connection, lookup):
         uri = "http://{0}:{1}/manage/v2/forests".format(connection.host, connection.management_port)
         payload = {}
         payload.update(self.properties)
         payload.update(self.config)
 
-        response = requests.post(uri, json=payload, auth=connection.auth)
+        response = yield Request('POST', uri, json=payload)
         if response.status_code > 299:
             raise Exception(response.text)
 
-        return Forest.lookup(connection, self.config['forest-name'])
+        if not lookup:
+            return self
+
+        return (yield from Forest._lookup(connection, self.config['forest-name']))
+
+    @classmethod
+    def create_forests(cls, connection, forests, max_workers=4, lookup=False):
+        """
+        Create several forests concurrently.
+
+        At most `max_workers` forests are created at the same time.  If
+        any forest cannot be created, the forests that were created are
+        removed again and an exception describing every failure is
+        raised.  The exception also describes any forest that could not
+        be removed.
+
+        Unlike `create`, the forests are not read back from the server
+        unless `lookup` is True.
+
+        :param connection: The connection to a MarkLogic server (a Connection or AsyncConnection)
+        :param forests: A list of Forest objects
+        :param max_workers: The maximum number of concurrent creates
+        :param lookup: Read each forest back from the server
+        :return: The list of created Forest objects
+        """
+        return connection.run(cls._create_forests(connection, forests, max_workers, lookup))
+
+    @classmethod
+    def _create_forests(cls, connection, forests, max_workers, lookup):
+        outcomes = yield Concurrent([forest._create(connection, lookup) for forest in forests],
+                                    max_workers=max_workers)
+
+        created = []
+        failures = []
+        for forest, (result, exception) in zip(forests, outcomes):
+            if exception is None:
+                created.append(result)
+            else:
+                failures.append("{0}: {1}".format(forest.forest_name(), exception))
+
+        if failures:
+            message = "Failed to create forests: " + "; ".join(failures)
+            try:
+                yield from Forest._remove_forests(connection, created, max_workers)
+            except UnexpectedManagementAPIResponse as error:
+                message = "{0}. {1}".format(message, error)
+            raise UnexpectedManagementAPIResponse(message)
+
+        return created
+
+    @classmethod
+    def remove_forests(cls, connection, forests, max_workers=4):
+        """
+        Remove several forests concurrently.
+
+        At most `max_workers` forests are removed at the same time.
+        Every forest is tried; if any cannot be removed, an exception
+        describing every failure is raised.
+
+        :param connection: The connection to a MarkLogic server (a Connection or AsyncConnection)
+        :param forests: A list of Forest objects
+        :param max_workers: The maximum number of concurrent removes
+        :return: The list of removed Forest objects
+        """
+        return connection.run(cls._remove_forests(connection, forests, max_workers))
+
+    @classmethod
+    def _remove_forests(cls, connection, forests, max_workers):
+        outcomes = yield Concurrent([forest._remove(connection) for forest in forests],
+                                    max_workers=max_workers)
+
+        failures = ["{0}: {1}".format(forest.forest_name(), exception)
+                    for forest, (result, exception) in zip(forests, outcomes)
+                    if exception is not None]
+        if failures:
+            raise UnexpectedManagementAPIResponse("Failed to remove forests: "
+                                                  + "; ".join(failures))
+
+        return forests
 
     def save(self, connection):
         """
         Saves the updated forest configuration to the MarkLogic server.
 
-        :param connection: The connection to a MarkLogic server
+        :param connection: The connection to a MarkLogic server (a Connection or AsyncConnection)
         :return: The Forest object
         """
+        return connection.run(self._save(connection))
+
+    def _save(self, connection):
         uri = "http://{0}:{1}/manage/v2/forests/{2}/properties".format(connection.host, connection.management_port,
                                                                        self.config['forest-name'])
-        response = requests.put(uri, json=self.config, auth=connection.auth)
+        response = yield Request('PUT', uri, json=self.config)
 
         if response.status_code > 299:
             raise Exception(response.text)
@@ -187,12 +277,15 @@ class Forest:
         """
         Delete a forest from the MarkLogic server.
 
-        :param connection: The connection to a MerkLogic server
+        :param connection: The connection to a MerkLogic server (a Connection or AsyncConnection)
         :return: The Forest object
         """
+        return connection.run(self._remove(connection))
+
+    def _remove(self, connection):
         uri = "http://{0}:{1}/manage/v2/forests/{2}?level=full".format(connection.host, connection.management_port,
                                                                        self.config['forest-name'])
-        response = requests.delete(uri, auth=connection.auth)
+        response = yield Request('DELETE', uri)
 
         if response.status_code > 299 and not response.status_code == 404:
             raise Exception(response.text)
@@ -205,20 +298,24 @@ class Forest:
         Look up a forest's configuration from the MarkLogic server.
 
         :param name: The name of the forest
-        :param connection: The connection to a MarkLogic server
+        :param connection: The connection to a MarkLogic server (a Connection or AsyncConnection)
         :return: The Forest object
         """
+        return conn.run(cls._lookup(conn, name))
+
+    @classmethod
+    def _lookup(cls, conn, name):
         result = Forest('temp')
 
         uri = "http://{0}:{1}/manage/v2/forests/{2}/properties".format(conn.host, conn.management_port, name)
-        response = requests.get(uri, auth=conn.auth, headers={'accept': 'application/json'})
+        response = yield Request('GET', uri, headers={'accept': 'application/json'})
         if response.status_code != 200:
             raise UnexpectedManagementAPIResponse(response.text)
 
         result.properties = json.loads(response.text)
 
         uri='http://{0}:{1}/manage/v2/forests/{2}?view=config'.format(conn.host, conn.management_port, name)
-        response = requests.get(uri, auth=conn.auth, headers={'accept': 'application/json'})
+        response = yield Request('GET', uri, headers={'accept': 'application/json'})
         if response.status_code != 200:
             raise UnexpectedManagementAPIResponse(response.text)
 
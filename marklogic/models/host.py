@@ -25,8 +25,8 @@ Host related classes for manipulating MarkLogic hosts
 """
 
 
-import requests
 import json
+from marklogic.models.utilities.exceptions import UnexpectedManagementAPIResponse
 
 class Host:
     """
@@ -97,7 +97,7 @@ class Host:
         uri = "http://{0}:{1}/manage/v2/hosts/{2}/properties".format(connection.host, connection.management_port,
                                                                      name)
         result = None
-        response = requests.get(uri, auth=connection.auth, headers={'accept': 'application/json'})
+        response = connection.get(uri, headers={'accept': 'application/json'})
         if response.status_code == 200:
             result = Host()
             result._config = json.loads(response.text)
@@ -106,18 +106,19 @@ class Host:
         return result
 
     @classmethod
-    def list(cls, connection):
+    def list(cls, connection, group=None):
         """
         Lists the names of hosts available on this cluster.
 
         :param connection: A connection to a MarkLogic server
+        :param group: Only list the hosts in this group
         :return: A list of host names
         """
         uri = "http://{0}:{1}/manage/v2/hosts" \
           .format(connection.host, connection.management_port)
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
+        params = {} if group is None else {'group-id': group}
+        response = connection.get(uri, params=params, headers={'accept': 'application/json'})
 
         if response.status_code == 200:
             response_json = json.loads(response.text)
@@ -131,3 +132,22 @@ class Host:
             raise UnexpectedManagementAPIResponse(response.text)
 
         return result
+
+    @classmethod
+    def request_hosts(cls, connection):
+        """
+        Lists the names of the hosts that serve the app server the
+        connection talks to.  App servers are configured per group, so
+        these are the hosts in the group of the connection's host.
+
+        If the connection's host is not known to the cluster by that
+        name (for example "localhost" or a load balancer) its group
+        cannot be found and only the connection's host is returned.
+
+        :param connection: A connection to a MarkLogic server
+        :return: A list of host names
+        """
+        host = Host.lookup(connection, connection.host)
+        if host is None:
+            return [connection.host]
+        return Host.list(connection, group=host.group_name())
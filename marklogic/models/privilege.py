@@ -27,7 +27,6 @@ Classes for manipulating MarkLogic privileges.
 
 
 
-import requests
 from marklogic.models.utilities import exceptions
 from marklogic.models.utilities.validators import validate_custom
 from marklogic.models.utilities.validators import validate_privilege_kind
@@ -175,7 +174,7 @@ class Privilege(PropertyLists):
         post_config = self._config
         post_config['kind'] = self.kind()
 
-        response = requests.post(uri, json=post_config, auth=connection.auth)
+        response = connection.post(uri, json=post_config)
         if response.status_code not in [200, 201, 204]:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
 
@@ -212,8 +211,7 @@ class Privilege(PropertyLists):
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        response = requests.put(uri, json=self._config, auth=connection.auth,
-                                headers=headers)
+        response = connection.put(uri, json=self._config, headers=headers)
 
         if response.status_code not in [200, 204]:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
@@ -238,7 +236,7 @@ class Privilege(PropertyLists):
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        response = requests.delete(uri, auth=connection.auth, headers=headers)
+        response = connection.delete(uri, headers=headers)
 
         if (response.status_code not in [200, 204]
             and not response.status_code == 404):
@@ -259,8 +257,7 @@ class Privilege(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/privileges" \
           .format(connection.host, connection.management_port)
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
+        response = connection.get(uri, headers={'accept': 'application/json'})
 
         if response.status_code != 200:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
@@ -302,7 +299,7 @@ class Privilege(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/privileges/{2}/properties?kind={3}" \
           .format(connection.host, connection.management_port, name, kind)
 
-        response = requests.head(uri, auth=connection.auth)
+        response = connection.head(uri)
 
         if response.status_code == 200:
         	return True
@@ -339,15 +336,4 @@ class Privilege(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/privileges/{2}/properties?kind={3}" \
           .format(connection.host, connection.management_port, name, kind)
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
-
-        if response.status_code == 200:
-            result = Privilege.unmarshal(json.loads(response.text))
-            if 'etag' in response.headers:
-                result.etag = response.headers['etag']
-            return result
-        elif response.status_code == 404:
-            return None
-        else:
-            raise exceptions.UnexpectedManagementAPIResponse(response.text)
+        return connection.lookup_configuration(uri, Privilege.unmarshal)
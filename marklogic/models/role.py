@@ -26,7 +26,6 @@ Role related classes for manipulating MarkLogic roles
 
 
 
-import requests
 from marklogic.models.utilities import exceptions
 from marklogic.models.utilities.utilities import PropertyLists
 import json
@@ -273,7 +272,7 @@ class Role(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/roles" \
           .format(connection.host, connection.management_port)
 
-        response = requests.post(uri, json=self._config, auth=connection.auth)
+        response = connection.post(uri, json=self._config)
         if response.status_code not in [200, 201, 204]:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
 
@@ -309,8 +308,7 @@ class Role(PropertyLists):
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        response = requests.put(uri, json=self._config, auth=connection.auth,
-                                headers=headers)
+        response = connection.put(uri, json=self._config, headers=headers)
 
         if response.status_code not in [200, 204]:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
@@ -331,7 +329,7 @@ class Role(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/roles/{2}" \
           .format(connection.host, connection.management_port, self.name)
 
-        response = requests.delete(uri, auth=connection.auth)
+        response = connection.delete(uri)
 
         if (response.status_code not in [200, 204]
             and not response.status_code == 404):
@@ -351,8 +349,7 @@ class Role(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/roles" \
           .format(connection.host, connection.management_port)
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
+        response = connection.get(uri, headers={'accept': 'application/json'})
 
         if response.status_code != 200:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
@@ -377,8 +374,7 @@ class Role(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/roles/{2}/properties" \
           .format(connection.host, connection.management_port, name)
 
-        response = requests.head(uri, auth=connection.auth,
-                                 headers={'accept': 'application/json'})
+        response = connection.head(uri, headers={'accept': 'application/json'})
 
         if response.status_code == 200:
             return True
@@ -399,15 +395,4 @@ class Role(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/roles/{2}/properties" \
           .format(connection.host, connection.management_port, name)
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
-
-        if response.status_code == 200:
-            result = Role.unmarshal(json.loads(response.text))
-            if 'etag' in response.headers:
-                result.etag = response.headers['etag']
-            return result
-        elif response.status_code == 404:
-            return None
-        else:
-            raise exceptions.UnexpectedManagementAPIResponse(response.text)
+        return connection.lookup_configuration(uri, Role.unmarshal)
@@ -27,8 +27,13 @@ import re
 import requests
 import time
 import json
+import asyncio
 import logging
-from marklogic.models.utilities.exceptions import UnexpectedManagementAPIResponse
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from marklogic.models.connection import configuration_lookup
+from marklogic.models.utilities.operations import Request
+from marklogic.models.utilities.exceptions import UnexpectedManagementAPIResponse, RestartTimeout
 from marklogic.models.utilities.validators import validate_custom
 from marklogic.models.utilities.utilities import PropertyLists
 from marklogic.models.server.schema import Schema
@@ -36,6 +41,13 @@ from marklogic.models.server.namespace import UsingNamespace, Namespace
 from marklogic.models.server.requestblackout import RequestBlackout
 from marklogic.models.server.module import ModuleLocation
 
+# Polling while waiting for a restart: the first interval in seconds, its
+# growth after each poll, the largest interval and the per-request timeout
+RESTART_POLL_INITIAL = 0.25
+RESTART_POLL_GROWTH = 1.5
+RESTART_POLL_MAXIMUM = 2.0
+RESTART_REQUEST_TIMEOUT = 5.0
+
 class Server(PropertyLists, metaclass=ABCMeta):
     """
     The Server class encapsulates a MarkLogic application server. It provides
@@ -1437,7 +1449,7 @@ class Server(PropertyLists, metaclass=ABCMeta):
         uri = "http://{0}:{1}/manage/v2/servers" \
           .format(connection.host, connection.management_port)
 
-        response = requests.post(uri, json=self._config, auth=connection.auth)
+        response = connection.post(uri, json=self._config)
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
 
@@ -1457,6 +1469,7 @@ class Server(PropertyLists, metaclass=ABCMeta):
         else:
             self._config = server._config
             self.etag = server.etag
+            self.mark_clean()
             return self
 
     def update(self, connection):
@@ -1470,13 +1483,15 @@ class Server(PropertyLists, metaclass=ABCMeta):
           .format(connection.host, connection.management_port,
                   self.name, self.group_name())
 
+        struct = self.changed_configuration()
+        if not struct:
+            return self
+
         headers = {}
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        struct = self.marshal()
-        response = requests.put(uri, json=struct, auth=connection.auth,
-                                headers=headers)
+        response = connection.put(uri, json=struct, headers=headers)
 
         if response.status_code > 299:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -1484,6 +1499,7 @@ class Server(PropertyLists, metaclass=ABCMeta):
         self.name = self._config['server-name']
         if 'etag' in response.headers:
                 self.etag = response.headers['etag']
+        self.mark_clean()
 
         if response.status_code == 202:
             Server.wait_for_restart(connection, response)
@@ -1505,7 +1521,7 @@ class Server(PropertyLists, metaclass=ABCMeta):
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        response = requests.delete(uri, auth=connection.auth, headers=headers)
+        response = connection.delete(uri, headers=headers)
 
         if response.status_code > 299 and not response.status_code == 404:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -1529,8 +1545,7 @@ class Server(PropertyLists, metaclass=ABCMeta):
         uri = "http://{0}:{1}/manage/v2/servers" \
           .format(connection.host, connection.port)
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
+        response = connection.get(uri, headers={'accept': 'application/json'})
 
         if response.status_code != 200:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -1570,7 +1585,7 @@ class Server(PropertyLists, metaclass=ABCMeta):
           .format(connection.host, connection.management_port,
                   name, group)
 
-        response = requests.head(uri, auth=connection.auth)
+        response = connection.head(uri)
 
         if response.status_code > 299 and not response.status_code == 404:
             raise UnexpectedManagementAPIResponse(response.text)
@@ -1587,9 +1602,13 @@ class Server(PropertyLists, metaclass=ABCMeta):
 
         :param name: The server name
         :param group: The group name
-        :param: connection: The connection to a MarkLogic server
+        :param: connection: The connection to a MarkLogic server (a Connection or AsyncConnection)
         :return: True or False
         """
+        return connection.run(cls._lookup(connection, name, group))
+
+    @classmethod
+    def _lookup(cls, connection, name, group):
         parts = name.split("|")
         if len(parts) == 1:
             pass
@@ -1605,28 +1624,13 @@ class Server(PropertyLists, metaclass=ABCMeta):
         logging.info("Reading server configuration: {0}[{1}]" \
                      .format(name,group))
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
-
-        if response.status_code > 299 and not response.status_code == 404:
-            raise UnexpectedManagementAPIResponse(response.text)
-
-        result = None
-
-        if response.status_code == 404:
-            return result
-
-        if response.status_code != 200:
-            raise UnexpectedManagementAPIResponse(response.text)
-
-        result = Server.unmarshal(json.loads(response.text))
-        if 'etag' in response.headers:
-            result.etag = response.headers['etag']
-
+        result = yield from configuration_lookup(connection, uri, Server.unmarshal)
+        if result is not None:
+            result.mark_clean()
         return result
 
     @classmethod
-    def wait_for_restart(cls, connection, response):
+    def wait_for_restart(cls, connection, response, timeout=300):
         """
         Waits for the server to restart.
 
@@ -1634,31 +1638,122 @@ class Server(PropertyLists, metaclass=ABCMeta):
         require a restart. On receipt of a 202 response from the server,
         you can pass that response to this method and it will wait until
         the server has restarted.
+
+        Every host listed in the response is polled at the same time,
+        on the connection's admin port, until it reports a startup time
+        later than the one in the response.  Polling starts quickly and
+        slows down while a host is still restarting.
+
+        :param connection: The connection to a MarkLogic server
+        :param response: The 202 response
+        :param timeout: The maximum time to wait in seconds
+        :return: None
+        """
+        deadline = time.time() + timeout
+        restarts = connection.run(cls._restart_hosts(connection, response))
+        with ThreadPoolExecutor(max_workers=len(restarts)) as executor:
+            futures = [executor.submit(cls._wait_for_host, connection, host, timestamp, deadline)
+                       for host, timestamp in restarts]
+            for future in futures:
+                future.result()
+
+    @classmethod
+    async def wait_for_restart_async(cls, aconn, response, timeout=300):
+        """
+        Waits for the server to restart, without blocking the event loop.
+        See `wait_for_restart`.
+
+        Other hosts are polled through AsyncConnections of their own.
+
+        :param aconn: The AsyncConnection to a MarkLogic server
+        :param response: The 202 response
+        :param timeout: The maximum time to wait in seconds
+        :return: None
+        """
+        deadline = time.time() + timeout
+        restarts = await aconn.run(cls._restart_hosts(aconn, response))
+
+        async def wait_for_host(host, timestamp):
+            host_aconn = aconn if host == aconn.host else aconn.for_host(host)
+            try:
+                interval = RESTART_POLL_INITIAL
+                while not await host_aconn.run(cls._restarted(host_aconn, timestamp, deadline)):
+                    cls._check_deadline(host, deadline)
+                    await asyncio.sleep(min(interval, max(deadline - time.time(), 0)))
+                    interval = min(interval * RESTART_POLL_GROWTH, RESTART_POLL_MAXIMUM)
+            finally:
+                if host_aconn is not aconn:
+                    await host_aconn.close()
+
+        await asyncio.gather(*[wait_for_host(host, timestamp) for host, timestamp in restarts])
+
+    @classmethod
+    def _restart_hosts(cls, connection, response):
+        """
+        The host names and previous startup times in a restart response.
         """
         rconfig = json.loads(response.text)
-        timestamp = rconfig['restart']['last-startup'][0]['value']
-        uri = "http://localhost:8001/admin/v1/timestamp"
-        waiting = True
-        while waiting:
-            waiting = False
-            stamp = None
+        startups = rconfig['restart']['last-startup']
+
+        host_names = {}
+        if len(startups) > 1 or 'host-id' in startups[0]:
+            uri = "http://{0}:{1}/manage/v2/hosts" \
+              .format(connection.host, connection.management_port)
             try:
-                response = requests.get(uri, auth=connection.auth)
-                stamp = response.text
-            except requests.exceptions.ConnectionError as e:
-                waiting = True
-                time.sleep(2)
-                pass
-            except http.client.BadStatusLine as e:
-                waiting = True
-                time.sleep(2)
+                hosts = yield Request('GET', uri, headers={'accept': 'application/json'})
+                if hosts.status_code == 200:
+                    for item in hosts.json()['host-default-list']['list-items']['list-item']:
+                        host_names[item['idref']] = item['nameref']
+            except requests.exceptions.RequestException:
                 pass
 
-            if not(waiting):
-                if re.match(r"\d\d\d\d-\d\d-\d\dT", stamp):
-                    waiting = (stamp <= timestamp)
-                else:
-                    waiting = True
+        restarts = []
+        for startup in startups:
+            host = host_names.get(startup.get('host-id'))
+            if host is None:
+                if len(startups) > 1:
+                    logging.warning("Cannot resolve restarted host {0}, waiting for {1}"
+                                    .format(startup.get('host-id'), connection.host))
+                host = connection.host
+            if (host, startup['value']) not in restarts:
+                restarts.append((host, startup['value']))
+        return restarts
+
+    @classmethod
+    def _wait_for_host(cls, connection, host, timestamp, deadline):
+        host_connection = connection if host == connection.host else connection.for_host(host)
+        try:
+            interval = RESTART_POLL_INITIAL
+            while not host_connection.run(cls._restarted(host_connection, timestamp, deadline)):
+                cls._check_deadline(host, deadline)
+                time.sleep(min(interval, max(deadline - time.time(), 0)))
+                interval = min(interval * RESTART_POLL_GROWTH, RESTART_POLL_MAXIMUM)
+        finally:
+            if host_connection is not connection:
+                host_connection.close()
+
+    @classmethod
+    def _check_deadline(cls, host, deadline):
+        if time.time() >= deadline:
+            raise RestartTimeout("Timed out waiting for {0} to restart".format(host))
+
+    @classmethod
+    def _restarted(cls, connection, timestamp, deadline):
+        """
+        Has the host restarted since the timestamp?
+        """
+        uri = "http://{0}:{1}/admin/v1/timestamp" \
+          .format(connection.host, connection.admin_port)
+        request_timeout = min(RESTART_REQUEST_TIMEOUT, max(deadline - time.time(), 0.1))
+        try:
+            response = yield Request('GET', uri, timeout=request_timeout, retry=False)
+        except (requests.exceptions.RequestException, http.client.HTTPException):
+            return False
+
+        stamp = response.text
+        if response.status_code == 200 and re.match(r"\d\d\d\d-\d\d-\d\dT", stamp):
+            return stamp > timestamp
+        return False
 
     @classmethod
     def unmarshal(cls, config):
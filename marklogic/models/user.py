@@ -27,7 +27,6 @@ User related classes for manipulating MarkLogic users
 
 
 
-import requests
 from marklogic.models.utilities import exceptions
 from marklogic.models.permission import Permission
 from marklogic.models.utilities.utilities import PropertyLists
@@ -286,7 +285,7 @@ class User(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/users" \
           .format(connection.host, connection.management_port)
 
-        response = requests.post(uri, json=self._config, auth=connection.auth)
+        response = connection.post(uri, json=self._config)
 
         if response.status_code not in [200, 201, 204]:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
@@ -323,8 +322,7 @@ class User(PropertyLists):
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        response = requests.put(uri, json=self._config, auth=connection.auth,
-                                headers=headers)
+        response = connection.put(uri, json=self._config, headers=headers)
 
         if response.status_code not in [200, 204]:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
@@ -349,7 +347,7 @@ class User(PropertyLists):
         if self.etag is not None:
             headers['if-match'] = self.etag
 
-        response = requests.delete(uri, auth=connection.auth, headers=headers)
+        response = connection.delete(uri, headers=headers)
 
         if (response.status_code not in [200, 204]
             and not response.status_code == 404):
@@ -369,8 +367,7 @@ class User(PropertyLists):
         uri = "http://{0}:{1}/manage/v2/users" \
           .format(connection.host, connection.management_port)
 
-        response = requests.get(uri, auth=connection.auth,
-                                headers={'accept': 'application/json'})
+        response = connection.get(uri, headers={'accept': 'application/json'})
 
         if response.status_code != 200:
             raise exceptions.UnexpectedManagementAPIResponse(response.text)
@@ -394,14 +391,4 @@ class User(PropertyLists):
         """
         uri = "http://{0}:{1}/manage/v2/users/{2}/properties".format(connection.host, connection.port,
                                                                      name)
-        response = requests.get(uri, auth=connection.auth, headers={'accept': 'application/json'})
-
-        if response.status_code == 200:
-            result = User.unmarshal(json.loads(response.text))
-            if 'etag' in response.headers:
-                result.etag = response.headers['etag']
-            return result
-        elif response.status_code == 404:
-            return None
-        else:
-            raise exceptions.UnexpectedManagementAPIResponse(response.text)
+        return connection.lookup_configuration(uri, User.unmarshal)
@@ -14,4 +14,4 @@
 # limitations under the License.
 #
 
-from .files import walk_directories
\ No newline at end of file
+from .files import walk_directories, iter_files, file_hash
\ No newline at end of file
@@ -0,0 +1,204 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import re
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+from requests.auth import HTTPDigestAuth
+from requests.cookies import extract_cookies_to_jar
+from requests.utils import parse_dict_header
+
+"""
+MarkLogic authentication classes
+"""
+
+class CachedDigestAuth(HTTPDigestAuth):
+    """
+    Digest authentication that shares the server challenge between
+    all of the requests (and threads) using a connection.
+
+    The stock HTTPDigestAuth class keeps the challenge per thread, so
+    every new thread starts with a 401 round trip.  This class caches
+    the realm and nonce from the last challenge and increments the
+    nonce count for each request, so steady state requests are
+    authenticated on the first attempt.  A new challenge is only
+    answered when the server rejects the cached nonce.
+
+    The `requests` and `challenges` counters record how many requests
+    were sent and how many of them needed an extra challenge round trip.
+    """
+    def __init__(self, username, password):
+        HTTPDigestAuth.__init__(self, username, password)
+        self._lock = threading.Lock()
+        self._challenge = None
+        self._nonce_count = 0
+        self.requests = 0
+        self.challenges = 0
+
+    def statistics(self):
+        """
+        Return the request and challenge counters.
+
+        :return: A dictionary with the counters
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'challenges': self.challenges
+                }
+
+    def has_challenge(self):
+        """
+        Whether a server challenge is cached.
+
+        :return: True or False
+        """
+        with self._lock:
+            return self._challenge is not None
+
+    def reset_statistics(self):
+        """
+        Reset the request and challenge counters.
+        """
+        with self._lock:
+            self.requests = 0
+            self.challenges = 0
+
+    def build_digest_header(self, method, url):
+        """
+        Build the authorization header for a request from the cached
+        challenge.
+
+        :param method: The HTTP method
+        :param url: The request URL
+        :return: The header value or None if there is no usable challenge
+        """
+        with self._lock:
+            if self._challenge is None:
+                return None
+            challenge = self._challenge
+            self._nonce_count += 1
+            nonce_count = self._nonce_count
+
+        realm = challenge['realm']
+        nonce = challenge['nonce']
+        qop = challenge.get('qop')
+        algorithm = challenge.get('algorithm')
+        opaque = challenge.get('opaque')
+
+        which = 'MD5' if algorithm is None else algorithm.upper()
+        if which in ['MD5', 'MD5-SESS']:
+            digest = hashlib.md5
+        elif which == 'SHA':
+            digest = hashlib.sha1
+        elif which == 'SHA-256':
+            digest = hashlib.sha256
+        elif which == 'SHA-512':
+            digest = hashlib.sha512
+        else:
+            return None
+
+        def hash_utf8(value):
+            return digest(value.encode('utf-8')).hexdigest()
+
+        parsed = urlparse(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        ha1 = hash_utf8("{0}:{1}:{2}".format(self.username, realm, self.password))
+        ha2 = hash_utf8("{0}:{1}".format(method, path))
+
+        ncvalue = "{0:08x}".format(nonce_count)
+        seed = "{0}{1}{2}".format(nonce_count, nonce, time.ctime()).encode('utf-8')
+        cnonce = hashlib.sha1(seed + os.urandom(8)).hexdigest()[:16]
+
+        if which == 'MD5-SESS':
+            ha1 = hash_utf8("{0}:{1}:{2}".format(ha1, nonce, cnonce))
+
+        if not qop:
+            response = hash_utf8("{0}:{1}:{2}".format(ha1, nonce, ha2))
+        elif qop == 'auth' or 'auth' in qop.split(','):
+            response = hash_utf8("{0}:{1}:{2}:{3}:auth:{4}"
+                                 .format(ha1, nonce, ncvalue, cnonce, ha2))
+        else:
+            return None
+
+        header = 'username="{0}", realm="{1}", nonce="{2}", uri="{3}", response="{4}"' \
+          .format(self.username, realm, nonce, path, response)
+        if opaque:
+            header += ', opaque="{0}"'.format(opaque)
+        if algorithm:
+            header += ', algorithm="{0}"'.format(algorithm)
+        if qop:
+            header += ', qop="auth", nc={0}, cnonce="{1}"'.format(ncvalue, cnonce)
+
+        return "Digest " + header
+
+    def _update_challenge(self, www_authenticate):
+        pattern = re.compile(r'digest ', flags=re.IGNORECASE)
+        challenge = parse_dict_header(pattern.sub('', www_authenticate, count=1))
+        with self._lock:
+            self.challenges += 1
+            if self._challenge is None or self._challenge.get('nonce') != challenge.get('nonce'):
+                self._nonce_count = 0
+            self._challenge = challenge
+
+    def __call__(self, request):
+        with self._lock:
+            self.requests += 1
+
+        header = self.build_digest_header(request.method, request.url)
+        if header is not None:
+            request.headers['Authorization'] = header
+
+        position = None
+        if hasattr(request.body, 'tell'):
+            position = request.body.tell()
+
+        def handle_401(response, **kwargs):
+            if response.status_code != 401:
+                return response
+
+            www_authenticate = response.headers.get('www-authenticate', '')
+            if 'digest' not in www_authenticate.lower():
+                return response
+
+            self._update_challenge(www_authenticate)
+
+            if position is not None:
+                response.request.body.seek(position)
+
+            # Consume the content so the connection can be reused
+            response.content
+            response.close()
+
+            prepared = response.request.copy()
+            extract_cookies_to_jar(prepared._cookies, response.request, response.raw)
+            prepared.prepare_cookies(prepared._cookies)
+            prepared.headers['Authorization'] \
+              = self.build_digest_header(prepared.method, prepared.url)
+
+            retry = response.connection.send(prepared, **kwargs)
+            retry.history.append(response)
+            retry.request = prepared
+            return retry
+
+        request.register_hook('response', handle_401)
+        return request
@@ -0,0 +1,122 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import threading
+from collections import OrderedDict
+
+"""
+Caching of configuration objects read from the management API
+"""
+
+class ConfigurationCache:
+    """
+    The ConfigurationCache class holds unmarshalled configuration
+    objects by resource URI, together with the ETag they were read with.
+    It evicts the least recently used entry when it holds `max_entries`
+    and forgets entries that are older than `ttl` seconds.
+
+    The cache does not decide whether an entry is current; the caller
+    revalidates it with a conditional GET (see
+    `Connection.lookup_configuration`).
+    """
+    def __init__(self, max_entries=256, ttl=60.0):
+        """
+        Create a cache.
+
+        :param max_entries: The maximum number of entries
+        :param ttl: The maximum age of an entry in seconds
+        :return: The cache
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, uri):
+        """
+        Get an entry.
+
+        :param uri: The resource URI
+        :return: An (etag, object) tuple, or None
+        """
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is None:
+                return None
+            etag, value, stored = entry
+            if time.time() - stored > self.ttl:
+                del self._entries[uri]
+                return None
+            self._entries.move_to_end(uri)
+            return (etag, value)
+
+    def put(self, uri, etag, value):
+        """
+        Store an entry.
+
+        :param uri: The resource URI
+        :param etag: The ETag the object was read with
+        :param value: The object
+        """
+        with self._lock:
+            self._entries[uri] = (etag, value, time.time())
+            self._entries.move_to_end(uri)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit):
+        """
+        Count a lookup that was, or was not, answered from the cache.
+
+        :param hit: True if the cached object was used
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, uri=None):
+        """
+        Remove an entry, or every entry.
+
+        :param uri: The resource URI, or None for every entry
+        """
+        with self._lock:
+            if uri is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(uri, None)
+
+    def statistics(self):
+        """
+        Return the cache counters.
+
+        :return: A dictionary with the 'entries', 'hits' and 'misses'
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+                }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
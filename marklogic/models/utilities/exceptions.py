@@ -47,3 +47,12 @@ class UnexpectedAPIResponse(MLClientException):
 
     """
     pass
+
+
+class RestartTimeout(MLClientException):
+    """
+    This exception class is for hosts that did not come back within the
+    allowed time after a restart.
+
+    """
+    pass
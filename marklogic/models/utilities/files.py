@@ -19,7 +19,9 @@
 # Paul Hoehne       03/01/2015     Initial development
 #
 
-import os, sys, stat
+import os
+import fnmatch
+import hashlib
 
 """
 MarkLogic file classes
@@ -29,13 +31,91 @@ def walk_directories(current_directory):
     """
     Recursively walk a directory returning all of the files found.
     """
-    file_list = []
-    for dir in os.listdir(current_directory):
-        pathname = os.path.join(current_directory, dir)
-        mode = os.stat(pathname).st_mode
-
-        if stat.S_ISDIR(mode):
-            file_list.extend(walk_directories(pathname))
-        else:
-            file_list.append({'filename': dir, 'partial-directory': pathname})
-    return file_list
+    return list(iter_files(current_directory))
+
+
+def iter_files(current_directory, include=None, exclude=None, symlinks='follow'):
+    """
+    Lazily walk a directory tree, yielding the files as they are found.
+
+    Each file is returned as a dictionary with the same 'filename' and
+    'partial-directory' keys as `walk_directories` plus the 'size' and
+    modification time ('mtime') of the file.  The directory entries
+    come from `os.scandir`, so no extra stat call is needed per entry
+    and memory use does not grow with the size of the tree.
+
+    The include and exclude patterns are glob patterns matched against
+    both the file name and the path relative to `current_directory`.
+    A file is returned if it matches one of the include patterns (or
+    there are none) and none of the exclude patterns.  Directories
+    matching an exclude pattern are not descended into.
+
+    The symlink policy is one of 'follow' (follow links to files and
+    directories, skipping directories already visited), 'files' (follow
+    links to files only) or 'skip' (ignore all links).
+
+    :param current_directory: The root of the directory tree
+    :param include: A list of glob patterns for files to include
+    :param exclude: A list of glob patterns for files and directories to exclude
+    :param symlinks: The symlink policy
+    :return: A generator of file dictionaries
+    """
+    if symlinks not in ['follow', 'files', 'skip']:
+        raise ValueError("Unknown symlink policy: {0}".format(symlinks))
+
+    visited = set()
+    pending = [current_directory]
+    while pending:
+        directory = pending.pop()
+        if symlinks == 'follow':
+            dir_stat = os.stat(directory)
+            if (dir_stat.st_dev, dir_stat.st_ino) in visited:
+                continue
+            visited.add((dir_stat.st_dev, dir_stat.st_ino))
+
+        subdirectories = []
+        # Closed even if the caller stops iterating part way through
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    if symlinks == 'skip' or (symlinks == 'files' and entry.is_dir()):
+                        continue
+
+                relative = os.path.relpath(entry.path, current_directory).replace(os.sep, '/')
+                if exclude and _matches(entry.name, relative, exclude):
+                    continue
+
+                if entry.is_dir():
+                    subdirectories.append(entry.path)
+                elif include is None or _matches(entry.name, relative, include):
+                    try:
+                        file_stat = entry.stat()
+                    except OSError:
+                        # A dangling link
+                        continue
+                    yield {'filename': entry.name, 'partial-directory': entry.path,
+                           'size': file_stat.st_size, 'mtime': file_stat.st_mtime}
+
+        # Depth first, in directory order
+        pending.extend(reversed(subdirectories))
+
+
+def _matches(name, relative, patterns):
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative, pattern):
+            return True
+    return False
+
+
+def file_hash(path):
+    """
+    The SHA-256 hash of the content of a file.
+
+    :param path: The path to the file
+    :return: The hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as data_file:
+        for block in iter(lambda: data_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
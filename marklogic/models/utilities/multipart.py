@@ -0,0 +1,130 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import uuid
+
+"""
+Helpers for the multipart/mixed payloads used by the bulk document
+operations of the REST API.
+"""
+
+def make_boundary():
+    """
+    Create a random multipart boundary.
+
+    :return: The boundary string
+    """
+    return "ML-BOUNDARY-" + uuid.uuid4().hex
+
+
+def encode_multipart(parts, boundary):
+    """
+    Encode a list of parts as a multipart/mixed body.
+
+    Each part is a tuple of a dictionary of headers and the body of
+    the part as bytes.
+
+    :param parts: The list of (headers, body) tuples
+    :param boundary: The multipart boundary
+    :return: The encoded body as bytes
+    """
+    delimiter = "--{0}\r\n".format(boundary).encode('utf-8')
+    chunks = []
+    for headers, body in parts:
+        chunks.append(delimiter)
+        for name in headers:
+            chunks.append("{0}: {1}\r\n".format(name, headers[name]).encode('utf-8'))
+        chunks.append(b"\r\n")
+        chunks.append(body)
+        chunks.append(b"\r\n")
+    chunks.append("--{0}--\r\n".format(boundary).encode('utf-8'))
+    return b"".join(chunks)
+
+
+def content_type_boundary(content_type):
+    """
+    Extract the boundary from a multipart content type header.
+
+    :param content_type: The content type header value
+    :return: The boundary or None
+    """
+    match = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def decode_multipart(body, boundary):
+    """
+    Split a multipart body into its parts.
+
+    The parts are returned as (headers, body) tuples with the header
+    names in lower case.  The part bodies are memoryview slices of
+    the original body, so no content is copied.
+
+    :param body: The multipart body as bytes
+    :param boundary: The multipart boundary
+    :return: The list of (headers, body) tuples
+    """
+    delimiter = b"--" + boundary.encode('utf-8')
+    view = memoryview(body)
+    parts = []
+
+    position = body.find(delimiter)
+    while position >= 0:
+        start = position + len(delimiter)
+        if body[start:start + 2] == b"--":
+            break
+        start = body.find(b"\r\n", start) + 2
+        end = body.find(b"\r\n" + delimiter, start)
+        if end < 0:
+            break
+
+        header_end = body.find(b"\r\n\r\n", start, end)
+        if header_end < 0:
+            header_block = body[start:end]
+            content_start = end
+        else:
+            header_block = body[start:header_end]
+            content_start = header_end + 4
+
+        headers = {}
+        for line in header_block.decode('utf-8').split("\r\n"):
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        parts.append((headers, view[content_start:end]))
+        position = end + 2
+
+    return parts
+
+
+def disposition_filename(headers):
+    """
+    The filename from the content disposition header of a part.
+
+    :param headers: The part headers, with lower case names
+    :return: The filename or None
+    """
+    disposition = headers.get('content-disposition', "")
+    match = re.search(r'filename="([^"]*)"', disposition)
+    if match is None:
+        match = re.search(r'filename=([^;]+)', disposition)
+    if match is None:
+        return None
+    return match.group(1).strip()
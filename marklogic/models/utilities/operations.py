@@ -0,0 +1,125 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Model operations that run on a blocking or an asyncio connection
+
+A model method that talks to the server is written once, as a
+generator (an "operation") that yields the steps it needs, a Request
+or a Concurrent group of operations, and is resumed with their
+results.  A Connection runs the steps with blocking I/O, an
+AsyncConnection with asyncio, so the URIs, payloads, marshalling and
+error handling are shared.  For example::
+
+    def _remove(self, connection):
+        response = yield Request('DELETE', uri)
+        if response.status_code > 299:
+            raise UnexpectedManagementAPIResponse(response.text)
+        return self
+
+    def remove(self, connection):
+        return connection.run(self._remove(connection))
+
+Operations are composed with `yield from`.
+"""
+
+
+class Request:
+    """
+    A step that sends one request.  The operation is resumed with the
+    response, or with the exception the connection raised.
+    """
+    def __init__(self, method, uri, **kwargs):
+        """
+        Create a request step.
+
+        :param method: The HTTP method
+        :param uri: The request URI
+        :param kwargs: The arguments of `Connection.request`
+        :return: The request step
+        """
+        self.method = method
+        self.uri = uri
+        self.kwargs = kwargs
+
+
+class Concurrent:
+    """
+    A step that runs several operations at the same time, at most
+    `max_workers` of them at once.  The operation is resumed with a
+    list of (result, exception) pairs, in the order of the operations;
+    the exception is None for an operation that succeeded.
+    """
+    def __init__(self, operations, max_workers=4):
+        """
+        Create a concurrent step.
+
+        :param operations: A list of operations
+        :param max_workers: The maximum number of operations run at once
+        :return: The concurrent step
+        """
+        self.operations = operations
+        self.max_workers = max_workers
+
+
+def run(operation, perform):
+    """
+    Drive an operation with a blocking function that performs its steps.
+
+    :param operation: The operation
+    :param perform: A function that performs a step and returns its result
+    :return: The result of the operation
+    """
+    result = None
+    error = None
+    while True:
+        try:
+            if error is None:
+                step = operation.send(result)
+            else:
+                step = operation.throw(error)
+        except StopIteration as stop:
+            return stop.value
+
+        try:
+            result, error = perform(step), None
+        except Exception as exception:
+            result, error = None, exception
+
+
+async def run_async(operation, perform):
+    """
+    Drive an operation with a coroutine function that performs its steps.
+
+    :param operation: The operation
+    :param perform: A coroutine function that performs a step and returns its result
+    :return: The result of the operation
+    """
+    result = None
+    error = None
+    while True:
+        try:
+            if error is None:
+                step = operation.send(result)
+            else:
+                step = operation.throw(error)
+        except StopIteration as stop:
+            return stop.value
+
+        try:
+            result, error = await perform(step), None
+        except Exception as exception:
+            result, error = None, exception
@@ -0,0 +1,207 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import time
+import random
+import asyncio
+import logging
+import requests
+
+"""
+Retrying requests that fail for transient reasons
+"""
+
+# Methods that can be repeated without changing the result
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+
+class RetryPolicy:
+    """
+    The RetryPolicy class decides whether and when a failed request is
+    sent again.  A request is retried when the server answers with one of
+    the `statuses` (by default 502, 503 and 504, as MarkLogic does while
+    it restarts) or the connection fails, up to `max_attempts` attempts
+    in all.
+
+    The delay before attempt n+1 is chosen at random between zero and
+    `backoff` * 2^(n-1) seconds, capped at `max_backoff` ("full jitter"),
+    so that many clients retrying at once do not hit the server in step.
+    A Retry-After header on the response is honored if it is longer.
+
+    Only idempotent requests (GET, HEAD, OPTIONS, PUT and DELETE) are
+    retried automatically.  A single request can be made retryable, or
+    not, with the `retry` argument of `Connection.request`.
+    """
+    def __init__(self, max_attempts=5, backoff=0.5, max_backoff=30.0,
+                 statuses=(502, 503, 504), methods=IDEMPOTENT_METHODS):
+        """
+        Create a retry policy.
+
+        :param max_attempts: The maximum number of attempts, 1 to never retry
+        :param backoff: The base delay in seconds
+        :param max_backoff: The maximum delay in seconds
+        :param statuses: The HTTP status codes that are retried
+        :param methods: The HTTP methods that are retried automatically
+        :return: The retry policy
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(methods)
+
+    def retryable_method(self, method):
+        """
+        Is the method retried automatically?
+
+        :param method: The HTTP method
+        :return: True or False
+        """
+        return method.upper() in self.methods
+
+    def retryable_response(self, response):
+        """
+        Does the response indicate a transient failure?
+
+        :param response: The response
+        :return: True or False
+        """
+        return response.status_code in self.statuses
+
+    def retryable_exception(self, exception):
+        """
+        Is the exception a transient failure?
+
+        :param exception: The exception raised by requests
+        :return: True or False
+        """
+        return isinstance(exception, (requests.exceptions.ConnectionError,
+                                      requests.exceptions.Timeout))
+
+    def delay(self, attempt, response=None):
+        """
+        The time to wait after a failed attempt.
+
+        :param attempt: The number of the attempt that failed, from 1
+        :param response: The failed response, if there was one
+        :return: The delay in seconds
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** (attempt - 1))))
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, min(self.max_backoff, float(retry_after)))
+        return delay
+
+    def send(self, method, send, body=None, retry=None):
+        """
+        Send a request, retrying it as the policy allows.
+
+        :param method: The HTTP method
+        :param send: A function of no arguments that sends the request and returns the response
+        :param body: The request body, rewound before each retry if it is a file
+        :param retry: True or False to override the policy's choice of retryable methods
+        :return: The response
+        """
+        retry, position = self._prepare(method, body, retry)
+
+        attempt = 1
+        while True:
+            try:
+                response = send()
+            except Exception as exception:
+                delay = self._retry_delay(method, retry, attempt, exception=exception)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retry_delay(method, retry, attempt, response=response)
+                if delay is None:
+                    return response
+                response.close()
+
+            time.sleep(delay)
+            if position is not None:
+                body.seek(position)
+            attempt += 1
+
+    async def send_async(self, method, send, body=None, retry=None):
+        """
+        Send a request from asyncio code, retrying it as the policy
+        allows.  See `send`.
+
+        :param method: The HTTP method
+        :param send: A coroutine function of no arguments that sends the request and returns the response
+        :param body: The request body, rewound before each retry if it is a file
+        :param retry: True or False to override the policy's choice of retryable methods
+        :return: The response
+        """
+        retry, position = self._prepare(method, body, retry)
+
+        attempt = 1
+        while True:
+            try:
+                response = await send()
+            except Exception as exception:
+                delay = self._retry_delay(method, retry, attempt, exception=exception)
+                if delay is None:
+                    raise
+            else:
+                delay = self._retry_delay(method, retry, attempt, response=response)
+                if delay is None:
+                    return response
+                response.close()
+
+            await asyncio.sleep(delay)
+            if position is not None:
+                body.seek(position)
+            attempt += 1
+
+    def _prepare(self, method, body, retry):
+        """
+        Whether the request may be retried, and the position to rewind
+        its body to.
+        """
+        if retry is None:
+            retry = self.retryable_method(method)
+
+        position = None
+        if hasattr(body, 'seek') and hasattr(body, 'tell'):
+            position = body.tell()
+        elif body is not None and not isinstance(body, (bytes, bytearray, memoryview, str, dict, list)):
+            # A generator or other one-shot body can't be sent twice
+            retry = False
+        return retry, position
+
+    def _retry_delay(self, method, retry, attempt, response=None, exception=None):
+        """
+        The delay before the next attempt, or None if the response or
+        exception of this attempt is final.
+        """
+        if exception is not None:
+            if not (retry and attempt < self.max_attempts
+                    and self.retryable_exception(exception)):
+                return None
+            reason = exception
+        else:
+            if not (retry and attempt < self.max_attempts
+                    and self.retryable_response(response)):
+                return None
+            reason = response.status_code
+
+        delay = self.delay(attempt, response)
+        logging.info("Retrying {0} after {1}, attempt {2} of {3}, in {4:.2f} seconds"
+                     .format(method, reason, attempt + 1, self.max_attempts, delay))
+        return delay
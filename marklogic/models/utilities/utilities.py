@@ -25,6 +25,7 @@ Various utility classes.
 """
 
 
+import copy
 from abc import ABCMeta, abstractmethod
 from marklogic.models.utilities.validators import validate_type
 from marklogic.models.utilities.validators import validate_list_of_type
@@ -35,6 +36,10 @@ class PropertyLists(metaclass=ABCMeta):
     The PropertyLists class is an abstract, mixin class. It defines
     methods for adding, removing and setting the values of a list
     property on an object.
+
+    It also keeps track of which properties have changed since the
+    object was last read from or written to the server, so that an
+    update only needs to send the changed properties.
     """
 
     def _add_to_object_list(self, objlist, obj, objtype):
@@ -243,3 +248,51 @@ class PropertyLists(metaclass=ABCMeta):
                 self._config[propname] = thelist
             else:
                 del self._config[propname]
+
+    def mark_clean(self, changed=None):
+        """
+        Record the current configuration as the one on the server.
+        Later calls to `changed_configuration` report the properties that
+        differ from it.
+
+        If the configuration was not read from the server, but the
+        properties that differ from the server's are known, name them
+        in `changed`.
+
+        :param changed: The names of properties that differ from the server's
+        :return: The calling object
+        """
+        self._baseline = copy.deepcopy(self.marshal())
+        if changed is not None:
+            for key in changed:
+                self._baseline.pop(key, None)
+        return self
+
+    def changed_configuration(self):
+        """
+        The configuration to send to the server to update it.
+
+        This is only the properties that changed since `mark_clean` was
+        last called.  The full configuration is returned if the object
+        was never marked clean, if a property was removed, or if a list
+        property changed, since a partial list can't be sent.
+
+        :return: A hash of properties, empty if nothing changed
+        """
+        struct = self.marshal()
+        baseline = getattr(self, '_baseline', None)
+        if baseline is None:
+            return struct
+
+        if [key for key in baseline if key not in struct]:
+            return struct
+
+        changed = {}
+        for key in struct:
+            if key in baseline and struct[key] == baseline[key]:
+                continue
+            if isinstance(struct[key], list) or isinstance(baseline.get(key), list):
+                return struct
+            changed[key] = struct[key]
+
+        return changed
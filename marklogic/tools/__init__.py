@@ -25,9 +25,19 @@
 import os
 import requests
 import zipfile
+import hashlib
+import tempfile
+import time
 import platform
 import shutil
-import subprocess
+import threading
+from marklogic.models.document import Document
+from marklogic.models.host import Host
+from marklogic.models.database.loader import DocumentLoader
+from marklogic.models.utilities import files
+from marklogic.models.utilities.exceptions import MLClientException
+from marklogic.tools.watchers import InotifyEvents, PollingEvents
+from marklogic.tools.mlcp import MLCPRun, partition_directory, run_parallel
 
 
 """
@@ -35,69 +45,302 @@ These are assorted tools to help the end user.  The goal is to provide
 a simple set of scripting interfaces.
 """
 
+MLCP_VERSION = "1.3-1"
+MLCP_URL = "http://developer.marklogic.com/download/binaries/mlcp/mlcp-Hadoop2-{0}-bin.zip"
+
+
+def default_cache_directory():
+    """
+    The directory MLCP is cached in: $MLCP_CACHE if it is set, otherwise
+    marklogic/mlcp under the user's cache directory.
+
+    :return: The cache directory path
+    """
+    if os.environ.get("MLCP_CACHE"):
+        return os.environ["MLCP_CACHE"]
+    if platform.system() == "Windows":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "marklogic", "mlcp")
+
+
 class MLCPLoader():
     """
     This class will execute the content pump to load data.
+
+    If MLCP is not on the path, it is downloaded once into a cache
+    directory that is shared by every working directory, and kept there
+    per version.  The archive's SHA-256 checksum is verified against
+    `checksum` if one is given, and is otherwise recorded when the
+    archive is first downloaded.  The archive is extracted into a
+    temporary directory that is renamed into place, so concurrent jobs
+    never see a partial install.
+
+    For offline use, `archive` is the path to a local copy of the MLCP
+    zip file, which is used instead of downloading it.
     """
-    def __init__(self):
-        pass
+    def __init__(self, version=MLCP_VERSION, cache_directory=None, archive=None,
+                 checksum=None):
+        """
+        Create a loader.
+
+        :param version: The MLCP version
+        :param cache_directory: The cache directory, by default `default_cache_directory()`
+        :param archive: The path to a local MLCP zip file
+        :param checksum: The expected SHA-256 hex digest of the archive
+        :return: The loader object
+        """
+        self.version = version
+        self.cache_directory = cache_directory if cache_directory else default_cache_directory()
+        self.archive = archive
+        self.checksum = checksum
 
     def load(self, conn):
         pass
 
+    def mlcp_home(self):
+        """
+        The directory this version of MLCP is installed in.
+
+        :return: The path of the cached install
+        """
+        return os.path.join(self.cache_directory, self.version, "mlcp")
+
     def clear_directory(self):
+        """
+        Remove the cached copy of this version of MLCP, and any copy
+        in the .mlcp directory used by earlier releases.
+        """
+        version_directory = os.path.join(self.cache_directory, self.version)
+        if os.path.isdir(version_directory):
+            shutil.rmtree(version_directory)
         if os.path.isdir(".mlcp"):
             shutil.rmtree(".mlcp")
 
     def download_mlcp(self):
-        os.mkdir(".mlcp")
-        mlcp_url = "http://developer.marklogic.com/download/binaries/mlcp/mlcp-Hadoop2-1.3-1-bin.zip"
-        archive_path = os.path.join(".mlcp", "mlcp.zip")
-        chunk_size = 16 * 1024
-
-        response = requests.get(mlcp_url, stream=True)
-        with open(archive_path, "wb") as bin_file:
-            for chunk in response.iter_content(chunk_size):
-                bin_file.write(chunk)
-
-        archive = zipfile.ZipFile(archive_path)
-        archive.extractall(os.path.join(".mlcp"))
-        for filename in os.listdir(".mlcp"):
-            if filename.find("Hadoop") > -1:
-                os.rename(os.path.join(".mlcp", filename), os.path.join(".mlcp", "mlcp"))
+        """
+        Make sure this version of MLCP is in the cache, downloading and
+        extracting it if it is not.
 
-    def load_directory(self, conn, database, data_directory, collections=None, prefix=''):
+        :return: The path of the cached install
+        """
+        home = self.mlcp_home()
+        if os.path.isdir(home):
+            return home
+
+        version_directory = os.path.dirname(home)
+        os.makedirs(version_directory, exist_ok=True)
+
+        archive_path = self.archive
+        if archive_path is None:
+            archive_path = os.path.join(version_directory, "mlcp.zip")
+            if not os.path.exists(archive_path) or not self._verify(archive_path):
+                self._download(archive_path)
+        elif not self._verify(archive_path):
+            raise MLClientException("Checksum mismatch for {0}".format(archive_path))
+
+        self._extract(archive_path, home)
+        return home
+
+    def _download(self, archive_path):
+        temp_path = "{0}.{1}.tmp".format(archive_path, os.getpid())
+        checksum_path = "{0}.sha256.{1}.tmp".format(archive_path, os.getpid())
+        digest = hashlib.sha256()
+        chunk_size = 1024 * 1024
+
+        try:
+            response = requests.get(MLCP_URL.format(self.version), stream=True)
+            try:
+                response.raise_for_status()
+                with open(temp_path, "wb") as bin_file:
+                    for chunk in response.iter_content(chunk_size):
+                        bin_file.write(chunk)
+                        digest.update(chunk)
+            finally:
+                response.close()
+
+            actual = digest.hexdigest()
+            if self.checksum is not None and actual != self.checksum.lower():
+                raise MLClientException("Checksum mismatch for {0}: expected {1}, got {2}"
+                                        .format(MLCP_URL.format(self.version), self.checksum, actual))
+
+            # The checksum is in place before the archive appears, so
+            # another job never finds the archive without it
+            with open(checksum_path, "w") as checksum_file:
+                checksum_file.write(actual)
+            os.replace(checksum_path, archive_path + ".sha256")
+            os.replace(temp_path, archive_path)
+        finally:
+            for path in [temp_path, checksum_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _verify(self, archive_path):
+        expected = self.checksum
+        if expected is None and os.path.exists(archive_path + ".sha256"):
+            with open(archive_path + ".sha256") as checksum_file:
+                expected = checksum_file.read().strip()
+        if expected is None:
+            return True
+        return files.file_hash(archive_path) == expected.lower()
+
+    def _extract(self, archive_path, home):
+        version_directory = os.path.dirname(home)
+        temp_directory = tempfile.mkdtemp(prefix=".extract-", dir=version_directory)
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                archive.extractall(temp_directory)
+
+            extracted = temp_directory
+            for filename in os.listdir(temp_directory):
+                if filename.find("Hadoop") > -1:
+                    extracted = os.path.join(temp_directory, filename)
+
+            if platform.system() != "Windows":
+                bin_directory = os.path.join(extracted, "bin")
+                for script in os.listdir(bin_directory):
+                    script_path = os.path.join(bin_directory, script)
+                    os.chmod(script_path, os.stat(script_path).st_mode | 0o111)
+
+            try:
+                os.rename(extracted, home)
+            except OSError:
+                # Another job installed it first
+                if not os.path.isdir(home):
+                    raise
+        finally:
+            shutil.rmtree(temp_directory, ignore_errors=True)
+
+    def load_directory(self, conn, database, data_directory, collections=None, prefix='',
+                       callback=None):
+        """
+        Load all the files in a directory with MLCP, waiting for it to
+        finish.  MLCP's output is parsed into events (see
+        marklogic.tools.mlcp); if a callback is given it is called with
+        each event and MLCP is stopped if it returns False.
+
+        :param conn: The server connection
+        :param database: The Database to load into
+        :param data_directory: The path to the directory root
+        :param collections: A list of collections to use for the files
+        :param prefix: The prefix that replaces the directory path
+        :param callback: A function called with each event
+        :return: The summary of the run
+        """
+        run = self.start_load_directory(conn, database, data_directory,
+                                        collections=collections, prefix=prefix)
+        return run.wait(callback)
+
+    def start_load_directory(self, conn, database, data_directory, collections=None, prefix=''):
+        """
+        Start loading all the files in a directory with MLCP.  Iterate
+        over the returned run for its events.
+
+        :param conn: The server connection
+        :param database: The Database to load into
+        :param data_directory: The path to the directory root
+        :param collections: A list of collections to use for the files
+        :param prefix: The prefix that replaces the directory path
+        :return: The MLCPRun
+        """
+        return MLCPRun(self.import_command(conn, database, data_directory,
+                                           collections=collections, prefix=prefix))
+
+    def load_directory_parallel(self, conn, database, data_directory, collections=None,
+                                prefix='', partitions=None, hosts=None, thread_count=None,
+                                callback=None):
+        """
+        Load all the files in a directory with several MLCP processes at
+        once.  The tree is split into `partitions` groups of roughly equal
+        size (see marklogic.tools.mlcp.partition_directory) and each group
+        is loaded by its own process, the processes taking turns over the
+        hosts.  URIs are the same as with `load_directory`.
+
+        Events passed to the callback have the 'partition' index and the
+        'host' of their process added; if the callback returns False every
+        process is stopped.
+
+        :param conn: The server connection
+        :param database: The Database to load into
+        :param data_directory: The path to the directory root
+        :param collections: A list of collections to use for the files
+        :param prefix: The prefix that replaces the directory path
+        :param partitions: The number of processes, by default one per host
+        :param hosts: The hosts to load through, by default `Host.list`
+        :param thread_count: The MLCP -thread_count of each process
+        :param callback: A function called with each event
+        :return: The combined summary, with the summary of each process in 'partitions'
+        """
+        if hosts is None:
+            hosts = Host.list(conn)
+        if not hosts:
+            hosts = [conn.host]
+        if partitions is None:
+            partitions = len(hosts)
+
+        groups = partition_directory(data_directory, partitions)
+        partition_hosts = [hosts[index % len(hosts)] for index in range(0, len(groups))]
+        commands = [self.import_command(conn, database, data_directory, collections=collections,
+                                        prefix=prefix, input_paths=group, host=host,
+                                        thread_count=thread_count)
+                    for group, host in zip(groups, partition_hosts)]
+
+        def host_callback(event):
+            event['host'] = partition_hosts[event['partition']]
+            return callback(event)
+
+        summary = run_parallel(commands, host_callback if callback is not None else None)
+        for partition_summary, host in zip(summary['partitions'], partition_hosts):
+            partition_summary['host'] = host
+        return summary
+
+    def import_command(self, conn, database, data_directory, collections=None, prefix='',
+                       input_paths=None, host=None, thread_count=None):
+        """
+        The MLCP import command for a directory, as a list of arguments.
+
+        :param conn: The server connection
+        :param database: The Database to load into
+        :param data_directory: The path to the directory root
+        :param collections: A list of collections to use for the files
+        :param prefix: The prefix that replaces the directory path
+        :param input_paths: The files and directories under the root to load, by default the root
+        :param host: The host to load through, by default the connection's host
+        :param thread_count: The MLCP -thread_count
+        :return: The command
+        """
         mlcp_path = self.mlcp_path()
         if not mlcp_path:
             which_script = "mlcp.sh"
             if platform.system() == "Windows":
                 which_script = "mlcp.bat"
 
-            mlcp_path = os.path.join(".mlcp", "mlcp", "bin", which_script)
+            mlcp_path = os.path.join(self.download_mlcp(), "bin", which_script)
 
-            if not os.path.exists(mlcp_path):
-                self.download_mlcp()
-
-        if platform.system() != "Windows":
-            subprocess.call(["chmod", "+x", mlcp_path])
+        def mlcp_file_path(path):
+            full_path = os.path.abspath(path)
+            if platform.system() == "Windows":
+                full_path = "/" + full_path.replace("\\", "/")
+            return full_path
 
-        if collections:
-            collections_command = "-output_collections \"{0}\"".format(",".join(collections))
+        full_path = mlcp_file_path(data_directory)
+        if input_paths is None:
+            input_path = full_path
         else:
-            collections_command = ''
-
-        command_line = "{0} import -username {1} -password {2} -host {3} -port {4} -database {5} {6} " \
-                       "-input_file_path {7} -output_uri_replace \"{8},'{9}'\""
+            input_path = ",".join([mlcp_file_path(path) for path in input_paths])
 
-        full_path = os.path.abspath(data_directory)
-        if platform.system() == "Windows":
-            full_path = "/" + full_path.replace("\\", "/")
-        run_line = command_line.format(mlcp_path, conn.auth.username, conn.auth.password, conn.host,
-                                       conn.port, database.database_name(), collections_command,
-                                       full_path, full_path, prefix)
-        with os.popen(run_line) as in_file:
-            for line in in_file:
-                print(line.rstrip())
+        command = [mlcp_path, "import",
+                   "-username", conn.auth.username, "-password", conn.auth.password,
+                   "-host", host if host is not None else conn.host, "-port", str(conn.port),
+                   "-database", database.database_name()]
+        if collections:
+            command.extend(["-output_collections", ",".join(collections)])
+        if thread_count is not None:
+            command.extend(["-thread_count", str(thread_count)])
+        command.extend(["-input_file_path", input_path,
+                        "-output_uri_replace", "{0},'{1}'".format(full_path, prefix)])
+        return command
 
     def mlcp_installed(self):
         paths = os.environ["PATH"].split(os.pathsep)
@@ -117,14 +360,174 @@ class MLCPLoader():
         return None
 
 
+class RESTLoader():
+    """
+    This class loads data in process through the REST document API.  It
+    takes the same options as MLCPLoader.load_directory but needs neither
+    a JVM nor a download of the content pump.  The files are written in
+    parallel, in batched multipart requests, by a DocumentLoader.
+    """
+    def __init__(self, threads=8, batch_size=100, content_type=None, callback=None):
+        """
+        Create a loader.
+
+        :param threads: The number of worker threads
+        :param batch_size: The maximum number of documents per request
+        :param content_type: The content type of the files, or None to guess it from the extension
+        :param callback: A function called with the load statistics after each batch
+        :return: The loader object
+        """
+        self.threads = threads
+        self.batch_size = batch_size
+        self.content_type = content_type
+        self.callback = callback
+
+    def load_directory(self, conn, database, data_directory, collections=None, prefix=''):
+        """
+        Load all the files in a directory.  As with the content pump's
+        -output_uri_replace option, the path of the directory is replaced
+        by the prefix, so data/orders/001.json is loaded with a prefix of
+        '/test' as /test/orders/001.json.
+
+        :param conn: The server connection
+        :param database: The Database to load into
+        :param data_directory: The path to the directory root
+        :param collections: A list of collections to use for the files
+        :param prefix: The prefix that replaces the directory path
+        :return: The load statistics
+        """
+        loader = DocumentLoader(conn, database, threads=self.threads, batch_size=self.batch_size,
+                                collections=collections, content_type=self.content_type,
+                                callback=self.callback)
+        return loader.load_files((result['partial-directory'],
+                                  self.document_uri(data_directory, result['partial-directory'], prefix),
+                                  result['size'])
+                                 for result in files.iter_files(data_directory))
+
+    def document_uri(self, data_directory, path, prefix=''):
+        """
+        The URI a file is loaded as.
+
+        :param data_directory: The path to the directory root
+        :param path: The path to the file
+        :param prefix: The prefix that replaces the directory path
+        :return: The document URI
+        """
+        relative = os.path.relpath(path, data_directory).replace(os.sep, "/")
+        return prefix.rstrip("/") + "/" + relative
+
+
 class Watcher():
     """
     Watcher will observe a directory and all the files in the director
     or its descendants.  If any change, it should upload the file to
     the appropriate database.
+
+    Changes are reported by inotify where it is available, otherwise by
+    polling the tree.  Bursts of changes are coalesced: the watcher
+    waits until no change has been seen for `debounce` seconds (or
+    `max_pending` changes are waiting) and then writes the changed files
+    with batched multipart requests and deletes the removed ones with
+    batched deletes.  A file is stored at `prefix` plus its path
+    relative to the watched directory.  Files that exist when watching
+    starts are not uploaded.
     """
-    def __init__(self):
-        pass
+    def __init__(self, database, prefix="/", collections=None, content_type="application/json",
+                 debounce=0.5, batch_size=100, max_pending=10000, poll_interval=1.0,
+                 use_inotify=True):
+        """
+        Create a watcher.
+
+        :param database: The Database to write to
+        :param prefix: The prefix of the document URIs
+        :param collections: A list of collections for the documents
+        :param content_type: The content type of the documents
+        :param debounce: The quiet time in seconds before changes are sent
+        :param batch_size: The number of documents per request
+        :param max_pending: The number of pending changes that forces a send
+        :param poll_interval: The polling interval if inotify is not used
+        :param use_inotify: Use inotify if it is available
+        :return: The watcher object
+        """
+        self.database = database
+        self.prefix = prefix
+        self.collections = collections
+        self.content_type = content_type
+        self.debounce = debounce
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """
+        Stop watching.  The changes already seen are still sent.
+        """
+        self._stopped.set()
 
     def watch(self, conn, directory):
-        pass
+        """
+        Watch a directory and send its changes to the database until
+        `stop` is called.
+
+        :param conn: The server connection
+        :param directory: The directory to watch
+        """
+        if self.use_inotify and InotifyEvents.available():
+            source = InotifyEvents(directory)
+        else:
+            source = PollingEvents(directory, self.poll_interval)
+
+        pending = {}
+        last_event = None
+        try:
+            while not self._stopped.is_set():
+                events = source.read_events(self.debounce)
+                for path, kind in events:
+                    pending[path] = kind
+                if events:
+                    last_event = time.time()
+
+                if pending and (len(pending) >= self.max_pending
+                                or time.time() - last_event >= self.debounce):
+                    self.flush(conn, directory, pending)
+                    pending = {}
+        finally:
+            source.close()
+
+        if pending:
+            self.flush(conn, directory, pending)
+
+    def flush(self, conn, directory, changes):
+        """
+        Send a set of changes to the database.
+
+        :param conn: The server connection
+        :param directory: The watched directory
+        :param changes: A dictionary mapping paths to 'write' or 'delete'
+        """
+        deletes = [self._uri(directory, path) for path in changes
+                   if changes[path] == 'delete']
+
+        def documents():
+            for path in changes:
+                if changes[path] != 'write':
+                    continue
+                try:
+                    with open(path, "rb") as data_file:
+                        content = data_file.read()
+                except (IOError, OSError):
+                    # Removed since the event
+                    if not os.path.isfile(path):
+                        deletes.append(self._uri(directory, path))
+                    continue
+                yield Document(self._uri(directory, path), content,
+                               self.content_type, collections=self.collections)
+
+        self.database.write_documents(conn, documents(), batch_size=self.batch_size)
+        if deletes:
+            self.database.delete_documents(conn, deletes, batch_size=self.batch_size)
+
+    def _uri(self, directory, path):
+        return self.prefix + os.path.relpath(path, directory).replace(os.sep, "/")
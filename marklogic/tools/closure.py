@@ -0,0 +1,269 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from marklogic.models.database import Database
+from marklogic.models.server import Server
+from marklogic.models.user import User
+from marklogic.models.role import Role
+from marklogic.models.privilege import Privilege
+
+"""
+The dependency closure of a set of configuration objects.
+"""
+
+class Closure:
+    """
+    The Closure class collects a set of servers, databases, users,
+    roles and privileges together with everything they depend on: the
+    databases a server or database uses, a server's default user and
+    privilege, the roles of users, roles and privileges.
+
+    Objects are resolved with a work queue.  Every name is fetched at
+    most once, as soon as it is discovered, and up to `max_workers`
+    lookups run at the same time.  Privileges may be named by name or
+    by action; they are resolved through an index of all privileges
+    that is built once from `Privilege.list`.
+
+    With a ClusterSnapshot the objects are taken from the snapshot and
+    nothing is read from the server.
+    """
+    def __init__(self, connection=None, group='Default', max_workers=None, snapshot=None):
+        """
+        Create a closure.
+
+        :param connection: The connection to a MarkLogic server
+        :param group: The group of the servers
+        :param max_workers: The number of lookup threads, by default the connection's management pool size
+        :param snapshot: A ClusterSnapshot to resolve objects from instead of the connection
+        :return: The closure
+        """
+        if connection is None and snapshot is None:
+            raise ValueError("A connection or a snapshot is required")
+        if max_workers is None:
+            max_workers = connection.management_pool_size if connection is not None else 1
+
+        self.connection = connection
+        self.group = group
+        self.max_workers = max_workers
+        self.snapshot = snapshot
+        self.servers = {}
+        self.databases = {}
+        self.users = {}
+        self.roles = {}
+        self.privileges = {}
+        self.missing = []
+        self._queue = deque()
+        self._requested = set()
+        self._privilege_index = None
+        self._index_lock = threading.Lock()
+
+    def add_server(self, server):
+        """
+        Add a server, by name or object.
+
+        :param server: The server name, or a Server
+        """
+        self._add('server', server, lambda s: s.server_name())
+
+    def add_database(self, database):
+        """
+        Add a database, by name or object.
+
+        :param database: The database name, or a Database
+        """
+        self._add('database', database, lambda d: d.database_name())
+
+    def add_user(self, user):
+        """
+        Add a user, by name or object.
+
+        :param user: The user name, or a User
+        """
+        self._add('user', user, lambda u: u.user_name())
+
+    def add_role(self, role):
+        """
+        Add a role, by name or object.
+
+        :param role: The role name, or a Role
+        """
+        self._add('role', role, lambda r: r.role_name())
+
+    def add_privilege(self, privilege, kind):
+        """
+        Add a privilege, by name, action or object.
+
+        :param privilege: The privilege name or action, or a Privilege
+        :param kind: The kind of privilege, "execute" or "uri"
+        """
+        if isinstance(privilege, str):
+            self._request(('privilege', "{0}|{1}".format(kind, privilege)))
+        else:
+            self._resolved('privilege', privilege)
+
+    def _add(self, kind, item, name_of):
+        if isinstance(item, str):
+            self._request((kind, item))
+        else:
+            self._requested.add((kind, name_of(item)))
+            self._resolved(kind, item)
+
+    def _request(self, key):
+        if key not in self._requested:
+            self._requested.add(key)
+            self._queue.append(key)
+
+    def close(self):
+        """
+        Resolve every object that was added and everything it depends on.
+
+        :return: The closure
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            while self._queue or pending:
+                while self._queue:
+                    key = self._queue.popleft()
+                    pending[executor.submit(self._fetch, key[0], key[1])] = key
+
+                done, not_done = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, name = pending.pop(future)
+                    item = future.result()
+                    if item is None:
+                        logging.warning("No {0} named {1}".format(kind, name))
+                        self.missing.append((kind, name))
+                    else:
+                        self._resolved(kind, item)
+        return self
+
+    def _fetch(self, kind, name):
+        if kind == 'server':
+            if self.snapshot is not None:
+                return self.snapshot.server(name, self.group)
+            return Server.lookup(self.connection, name, self.group)
+        if kind == 'database':
+            if self.snapshot is not None:
+                return self.snapshot.database(name)
+            return Database.lookup(self.connection, name)
+        if kind == 'user':
+            if self.snapshot is not None:
+                return self.snapshot.user(name)
+            return User.lookup(self.connection, name)
+        if kind == 'role':
+            if self.snapshot is not None:
+                return self.snapshot.role(name)
+            return Role.lookup(self.connection, name)
+
+        privilege_kind, privilege_name = name.split("|", 1)
+        if self.snapshot is not None:
+            privilege = self.snapshot.privilege_for_action(privilege_name, privilege_kind)
+            if privilege is None:
+                privilege = self.snapshot.privilege(privilege_name, privilege_kind)
+            return privilege
+
+        privilege_name = self.privilege_index().get(name)
+        if privilege_name is None:
+            return None
+        return Privilege.lookup(self.connection, privilege_name, privilege_kind)
+
+    def privilege_index(self):
+        """
+        The names of all the privileges, indexed by "kind|action" and
+        by "kind|name".  The index is read from the server once.
+
+        :return: A dictionary
+        """
+        with self._index_lock:
+            if self._privilege_index is None:
+                index = {}
+                for privilege in Privilege.list(self.connection):
+                    kind, name, action = privilege.split("|", 2)
+                    index["{0}|{1}".format(kind, name)] = name
+                    index["{0}|{1}".format(kind, action)] = name
+                self._privilege_index = index
+            return self._privilege_index
+
+    def _resolved(self, kind, item):
+        if kind == 'server':
+            self.servers[item.server_name()] = item
+            for name in [item.content_database_name(),
+                         item.last_login_database_name(),
+                         item.modules_database_name()]:
+                if name is not None:
+                    self.add_database(name)
+            if item.default_user() is not None:
+                self.add_user(item.default_user())
+            if item.privilege_name() is not None:
+                self.add_privilege(item.privilege_name(), "execute")
+
+        elif kind == 'database':
+            self.databases[item.database_name()] = item
+            for name in [item.security_database_name(),
+                         item.schema_database_name(),
+                         item.triggers_database_name()]:
+                if name is not None:
+                    self.add_database(name)
+
+        elif kind == 'user':
+            self.users[item.user_name()] = item
+            for name in item.role_names():
+                self.add_role(name)
+            if item.permissions() is not None:
+                for perm in item.permissions():
+                    self.add_role(perm.role_name())
+
+        elif kind == 'role':
+            self.roles[item.role_name()] = item
+            if item.role_names() is not None:
+                for name in item.role_names():
+                    self.add_role(name)
+
+        else:
+            key = "{0}|{1}".format(item.kind(), item.privilege_name())
+            self._requested.add(('privilege', key))
+            self.privileges[key] = item
+            for name in item.role_names():
+                self.add_role(name)
+
+    def dump(self):
+        """
+        Print the names of the objects in the closure.
+        """
+        for title, items in [("Servers", self.servers), ("Databases", self.databases),
+                             ("Users", self.users), ("Roles", self.roles),
+                             ("Privileges", self.privileges)]:
+            print("{0}:".format(title))
+            for item in items:
+                print("\t{0}".format(item))
+
+    def marshal(self):
+        """
+        Return a flat structure suitable for conversion to JSON or XML.
+
+        :return: A hash with a list of configurations for each resource type
+        """
+        return {
+            'servers': [item.marshal() for item in self.servers.values()],
+            'databases': [item.marshal() for item in self.databases.values()],
+            'users': [item.marshal() for item in self.users.values()],
+            'roles': [item.marshal() for item in self.roles.values()],
+            'privileges': [item.marshal() for item in self.privileges.values()]
+            }
@@ -0,0 +1,278 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import re
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from marklogic.models.utilities import files
+
+"""
+Running the content pump and parsing its output.  Each line MLCP
+writes is turned into an event dictionary with a 'type' of 'progress',
+'counter', 'error' or 'output', the 'line' itself and the 'elapsed'
+seconds since the run started.
+"""
+
+PROGRESS = re.compile(r"completed (\d+)%")
+COUNTER = re.compile(r"\b([A-Z][A-Z_]+): (\d+)\s*$")
+EXECUTION_TIME = re.compile(r"Total execution time: (\d+) sec")
+ERROR = re.compile(r"\b(ERROR|FATAL)\b")
+
+# The counters reported in the summary, by MLCP counter name
+SUMMARY_COUNTERS = {
+    'INPUT_RECORDS': 'input_records',
+    'OUTPUT_RECORDS': 'output_records',
+    'OUTPUT_RECORDS_COMMITTED': 'committed',
+    'OUTPUT_RECORDS_FAILED': 'failed'
+    }
+
+
+def parse_line(line):
+    """
+    Parse a line of MLCP output.
+
+    :param line: The line
+    :return: The event dictionary, without the 'elapsed' time
+    """
+    line = line.rstrip()
+
+    match = PROGRESS.search(line)
+    if match:
+        return {'type': 'progress', 'percent': int(match.group(1)), 'line': line}
+
+    match = COUNTER.search(line)
+    if match:
+        return {'type': 'counter', 'name': match.group(1), 'value': int(match.group(2)),
+                'line': line}
+
+    match = EXECUTION_TIME.search(line)
+    if match:
+        return {'type': 'counter', 'name': 'EXECUTION_TIME', 'value': int(match.group(1)),
+                'line': line}
+
+    if ERROR.search(line):
+        return {'type': 'error', 'line': line}
+
+    return {'type': 'output', 'line': line}
+
+
+class MLCPRun():
+    """
+    A running MLCP process.  Iterating over the run yields its events
+    as they are written; `summary()` gives the totals so far.  The run
+    can be stopped early with `abort()`, or by closing the iteration.
+    """
+    def __init__(self, command):
+        """
+        Start MLCP.
+
+        :param command: The command as a list of arguments
+        :return: The run object
+        """
+        self.command = command
+        self.start_time = time.time()
+        self.aborted = False
+        self.returncode = None
+        self.errors = []
+        self.percent = 0
+        self.counters = {}
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        universal_newlines=True)
+
+    def __iter__(self):
+        finished = False
+        try:
+            for line in self.process.stdout:
+                event = parse_line(line)
+                event['elapsed'] = time.time() - self.start_time
+                self._record(event)
+                yield event
+            finished = True
+        finally:
+            if not finished:
+                # The iteration was closed before MLCP finished
+                self.abort()
+            self.returncode = self.process.wait()
+            self.process.stdout.close()
+
+    def _record(self, event):
+        if event['type'] == 'progress':
+            self.percent = event['percent']
+        elif event['type'] == 'counter':
+            self.counters[event['name']] = event['value']
+        elif event['type'] == 'error':
+            self.errors.append(event['line'])
+
+    def abort(self):
+        """
+        Stop the MLCP process.
+        """
+        self.aborted = True
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def wait(self, callback=None):
+        """
+        Run to completion.  If a callback is given it is called with
+        each event; the run is aborted if it returns False.
+
+        :param callback: A function called with each event
+        :return: The summary
+        """
+        for event in self:
+            if callback is not None and callback(event) is False:
+                self.abort()
+                break
+        if self.returncode is None:
+            self.returncode = self.process.wait()
+        return self.summary()
+
+    def summary(self):
+        """
+        The totals of the run so far: the 'input_records',
+        'output_records', 'committed' and 'failed' counts, the 'percent'
+        complete, the 'elapsed' seconds, the 'records_per_second' committed,
+        the 'errors' lines, the 'returncode' and whether it was 'aborted'.
+
+        :return: The summary dictionary
+        """
+        elapsed = time.time() - self.start_time
+        summary = dict((key, self.counters.get(name, 0))
+                       for name, key in SUMMARY_COUNTERS.items())
+        summary['percent'] = self.percent
+        summary['elapsed'] = elapsed
+        summary['records_per_second'] = summary['committed'] / elapsed if elapsed > 0 else 0.0
+        summary['errors'] = list(self.errors)
+        summary['returncode'] = self.returncode
+        summary['aborted'] = self.aborted
+        return summary
+
+
+def partition_directory(data_directory, partitions):
+    """
+    Split a directory tree into at most `partitions` groups of paths of
+    roughly equal total size.  The groups are made of the entries at the
+    top of the tree; the largest directories are split into their
+    entries until there are enough pieces to fill every group.
+
+    :param data_directory: The path to the directory root
+    :param partitions: The number of groups
+    :return: A list of non-empty lists of paths
+    """
+    # One walk of the tree gives the size of every file and directory
+    sizes = {}
+    children = {}
+    for result in files.iter_files(data_directory):
+        parts = os.path.relpath(result['partial-directory'], data_directory).split(os.sep)
+        parent = data_directory
+        for part in parts:
+            path = os.path.join(parent, part)
+            sizes[path] = sizes.get(path, 0) + result['size']
+            children.setdefault(parent, set()).add(path)
+            parent = path
+
+    def entries(directory):
+        return [(sizes[path], path) for path in sorted(children.get(directory, []))]
+
+    pieces = entries(data_directory)
+    while len(pieces) < partitions:
+        directories = [piece for piece in pieces if piece[1] in children]
+        if not directories:
+            break
+        largest = max(directories)
+        pieces.remove(largest)
+        pieces.extend(entries(largest[1]))
+
+    # Largest first into the emptiest group
+    groups = [[0, []] for i in range(0, partitions)]
+    for size, path in sorted(pieces, reverse=True):
+        group = min(groups, key=lambda g: g[0])
+        group[0] += size
+        group[1].append(path)
+
+    return [sorted(group[1]) for group in groups if group[1]]
+
+
+def run_parallel(commands, callback=None):
+    """
+    Run several MLCP commands at once and wait for them all.  Each event
+    passed to the callback has the 'partition' index of its command added;
+    if the callback returns False every run is stopped.  The callback is
+    never called by two runs at the same time.
+
+    :param commands: A list of commands, each a list of arguments
+    :param callback: A function called with each event
+    :return: The combined summary, with the summary of each run in 'partitions'
+    """
+    runs = [MLCPRun(command) for command in commands]
+    lock = threading.Lock()
+
+    def abort_all():
+        for run in runs:
+            run.abort()
+
+    def watch(partition, run):
+        def partition_callback(event):
+            event['partition'] = partition
+            if callback is None:
+                return True
+            with lock:
+                if callback(event) is False:
+                    abort_all()
+                    return False
+            return True
+        return run.wait(partition_callback)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(len(runs), 1)) as executor:
+            summaries = list(executor.map(watch, range(0, len(runs)), runs))
+    except BaseException:
+        abort_all()
+        raise
+
+    return combine_summaries(summaries)
+
+
+def combine_summaries(summaries):
+    """
+    Combine the summaries of several runs.  Counts are added, the
+    elapsed time is that of the longest run and the return code is the
+    first non-zero one.
+
+    :param summaries: A list of run summaries
+    :return: The combined summary
+    """
+    combined = dict((key, sum([summary[key] for summary in summaries]))
+                    for key in SUMMARY_COUNTERS.values())
+    elapsed = max([summary['elapsed'] for summary in summaries] + [0.0])
+    returncodes = [summary['returncode'] for summary in summaries if summary['returncode']]
+
+    combined['percent'] = min([summary['percent'] for summary in summaries] + [100])
+    combined['elapsed'] = elapsed
+    combined['records_per_second'] = combined['committed'] / elapsed if elapsed > 0 else 0.0
+    combined['errors'] = [line for summary in summaries for line in summary['errors']]
+    combined['returncode'] = returncodes[0] if returncodes else 0
+    combined['aborted'] = True in [summary['aborted'] for summary in summaries]
+    combined['partitions'] = summaries
+    return combined
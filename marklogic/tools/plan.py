@@ -0,0 +1,283 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import copy
+import json
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from marklogic.models.database import Database
+from marklogic.models.server import Server
+from marklogic.models.user import User
+from marklogic.models.role import Role
+from marklogic.models.privilege import Privilege
+
+"""
+Planning and applying configuration changes.
+"""
+
+# The resource types of a configuration, in the order they are planned
+RESOURCE_TYPES = ['roles', 'privileges', 'users', 'databases', 'servers']
+
+# The operations of each stage run in parallel; a stage only starts when
+# the one before it has finished.  Roles and databases exist before
+# anything refers to them, privileges exist before roles are given
+# them, and servers are configured last.
+STAGES = [
+    [('create', 'roles'), ('create', 'databases')],
+    [('create', 'privileges')],
+    [('update', 'roles'), ('update', 'privileges'), ('create', 'users'),
+     ('update', 'users'), ('update', 'databases')],
+    [('create', 'servers'), ('update', 'servers')]
+    ]
+
+
+def _normalize(value):
+    # The server does not preserve the order of lists
+    if isinstance(value, dict):
+        return dict((key, _normalize(value[key])) for key in value)
+    if isinstance(value, list):
+        items = [_normalize(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    return value
+
+
+def changed_properties(desired, actual):
+    """
+    The properties of a desired configuration that differ from the
+    actual one.  Properties that are not in the desired configuration
+    are not compared.
+
+    :param desired: The desired configuration, as returned by marshal()
+    :param actual: The actual configuration, as returned by marshal()
+    :return: A sorted list of property names
+    """
+    return sorted([key for key in desired
+                   if _normalize(desired[key]) != _normalize(actual.get(key))])
+
+
+class ConfigPlan:
+    """
+    The ConfigPlan class compares a desired configuration, in the
+    format produced by `marshal()` (as written by get-config), with the
+    configuration of a cluster, and lists the operations needed to
+    make the cluster match.  Resources that already match are left
+    alone, so applying a large configuration in which few objects
+    changed costs few writes.
+
+    The plan is applied in dependency order (roles and databases first,
+    then privileges, servers last), with the independent operations of
+    each stage run in parallel.  Databases and servers are updated with
+    only the properties that changed, unless a list property changed.
+    """
+    def __init__(self, operations):
+        """
+        Create a plan.
+
+        :param operations: A list of operations, as returned by `operations()`
+        :return: The plan
+        """
+        self._operations = operations
+
+    @classmethod
+    def plan(cls, connection, config, max_workers=None, snapshot=None):
+        """
+        Plan the changes that make a cluster match a configuration.  The
+        current configuration of every resource is looked up in parallel,
+        or taken from a ClusterSnapshot.
+
+        :param connection: The connection to a MarkLogic server
+        :param config: A hash with a list of configurations for each resource type
+        :param max_workers: The number of lookup threads, by default the connection's management pool size
+        :param snapshot: A ClusterSnapshot of the cluster
+        :return: The plan
+        """
+        if max_workers is None:
+            max_workers = connection.management_pool_size
+
+        desired = [(resource_type, item) for resource_type in RESOURCE_TYPES
+                   for item in config.get(resource_type, [])]
+
+        def current(resource_type, item):
+            if snapshot is not None:
+                return _from_snapshot(snapshot, resource_type, item)
+            return _lookup(connection, resource_type, item)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(current, resource_type, item)
+                       for resource_type, item in desired]
+            actual = [future.result() for future in futures]
+
+        operations = []
+        for (resource_type, item), existing in zip(desired, actual):
+            name = _name(resource_type, item)
+            if existing is None:
+                operations.append({'action': 'create', 'type': resource_type,
+                                   'name': name, 'config': item,
+                                   'changes': sorted(item.keys())})
+                if resource_type in ('roles', 'databases'):
+                    # Created empty, then configured
+                    operations.append({'action': 'update', 'type': resource_type,
+                                       'name': name, 'config': item,
+                                       'changes': sorted(item.keys())})
+                continue
+
+            changes = changed_properties(item, existing.marshal())
+            if changes:
+                operations.append({'action': 'update', 'type': resource_type,
+                                   'name': name, 'config': item, 'changes': changes})
+
+        logging.info("Planned {0} changes to {1} resources".format(len(operations), len(desired)))
+        return ConfigPlan(operations)
+
+    def operations(self):
+        """
+        The operations of the plan.  Each is a hash with the 'action'
+        ('create' or 'update'), the resource 'type', its 'name', the
+        desired 'config' and the names of the properties that 'changes'.
+
+        :return: A list of operations
+        """
+        return self._operations
+
+    def stages(self):
+        """
+        The operations grouped into the stages they are applied in.
+
+        :return: A list of lists of operations
+        """
+        result = []
+        for stage in STAGES:
+            operations = [operation for operation in self._operations
+                          if (operation['action'], operation['type']) in stage]
+            if operations:
+                result.append(operations)
+        return result
+
+    def apply(self, connection, max_workers=None):
+        """
+        Apply the plan.  If an operation fails, the rest of its stage is
+        completed and the first error is raised; later stages are not
+        started.
+
+        :param connection: The connection to a MarkLogic server
+        :param max_workers: The number of threads, by default the connection's management pool size
+        :return: The plan
+        """
+        if max_workers is None:
+            max_workers = connection.management_pool_size
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for stage in self.stages():
+                futures = [executor.submit(_apply, connection, operation)
+                           for operation in stage]
+                errors = [future.exception() for future in futures
+                          if future.exception() is not None]
+                if errors:
+                    raise errors[0]
+
+        return self
+
+    def describe(self):
+        """
+        A description of the plan, one line per operation.
+
+        :return: A list of strings
+        """
+        return ["{0} {1} {2}: {3}".format(operation['action'].capitalize(),
+                                          operation['type'][:-1], operation['name'],
+                                          ", ".join(operation['changes']))
+                for operation in self._operations]
+
+    def __len__(self):
+        return len(self._operations)
+
+
+def _name(resource_type, config):
+    if resource_type == 'roles':
+        return config['role-name']
+    if resource_type == 'privileges':
+        return "{0}|{1}".format(config['kind'], config['privilege-name'])
+    if resource_type == 'users':
+        return config['user-name']
+    if resource_type == 'databases':
+        return config['database-name']
+    return "{0}|{1}".format(config['group-name'], config['server-name'])
+
+
+def _lookup(connection, resource_type, config):
+    if resource_type == 'roles':
+        return Role.lookup(connection, config['role-name'])
+    if resource_type == 'privileges':
+        return Privilege.lookup(connection, config['privilege-name'], config['kind'])
+    if resource_type == 'users':
+        return User.lookup(connection, config['user-name'])
+    if resource_type == 'databases':
+        return Database.lookup(connection, config['database-name'])
+    return Server.lookup(connection, config['server-name'], config['group-name'])
+
+
+def _from_snapshot(snapshot, resource_type, config):
+    if resource_type == 'roles':
+        return snapshot.role(config['role-name'])
+    if resource_type == 'privileges':
+        return snapshot.privilege(config['privilege-name'], config['kind'])
+    if resource_type == 'users':
+        return snapshot.user(config['user-name'])
+    if resource_type == 'databases':
+        return snapshot.database(config['database-name'])
+    return snapshot.server(config['server-name'], config['group-name'])
+
+
+def _apply(connection, operation):
+    resource_type = operation['type']
+    # unmarshal() takes ownership of the configuration
+    config = copy.deepcopy(operation['config'])
+    logging.info("{0} {1} {2}".format(operation['action'], resource_type[:-1], operation['name']))
+
+    if operation['action'] == 'create':
+        if resource_type == 'roles':
+            # Roles may refer to each other, so they are created empty
+            # and configured in the next stage
+            Role(config['role-name']).create(connection)
+            return
+        if resource_type == 'databases':
+            Database(config['database-name']).create(connection)
+            return
+        if resource_type == 'users':
+            user = User.unmarshal(config)
+            # Must assign some sort of password
+            user.set_password(base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8'))
+            user.create(connection)
+            return
+        if resource_type == 'privileges':
+            Privilege.unmarshal(config).create(connection)
+            return
+        Server.unmarshal(config).create(connection)
+        return
+
+    if resource_type == 'roles':
+        Role.unmarshal(config).update(connection)
+    elif resource_type == 'privileges':
+        Privilege.unmarshal(config).update(connection)
+    elif resource_type == 'users':
+        User.unmarshal(config).update(connection)
+    elif resource_type == 'databases':
+        # Only the changed properties are sent
+        Database.unmarshal(config).mark_clean(operation['changes']).update(connection)
+    else:
+        Server.unmarshal(config).mark_clean(operation['changes']).update(connection)
@@ -0,0 +1,221 @@
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0#
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from marklogic.models.utilities import files
+
+"""
+Sources of file change events for the Watcher.  Each source reports
+changes as (path, kind) tuples where kind is 'write' or 'delete'.
+"""
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _libc():
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    libc = ctypes.CDLL(name, use_errno=True)
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class InotifyEvents:
+    """
+    Reports changes in a directory tree using Linux inotify.  New
+    subdirectories are watched as they appear.  The files in the tree
+    are remembered, so that when a directory is moved away or renamed
+    the files that were under its old path are reported as deleted.
+    If the kernel event queue overflows, the tree is scanned again:
+    every file in it is reported as written and every file that is
+    gone as deleted.
+    """
+    def __init__(self, directory):
+        self._libc = _libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.directory = directory
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}
+        self._files = set()
+        self._watch_tree(directory)
+
+    @classmethod
+    def available(cls):
+        """
+        Is inotify available on this system?
+
+        :return: True or False
+        """
+        return _libc() is not None
+
+    def _watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            self._paths[wd] = directory
+
+    def _watch_tree(self, directory):
+        # The files found, which may have been written before the watch was added
+        found = []
+        for dirpath, dirnames, filenames in os.walk(directory):
+            self._watch(dirpath)
+            found.extend([os.path.join(dirpath, name) for name in filenames])
+        self._files.update(found)
+        return found
+
+    def _unwatch_tree(self, directory):
+        # The files that were under the directory
+        inside = directory + os.sep
+        for wd in [wd for wd in self._paths
+                   if self._paths[wd] == directory or self._paths[wd].startswith(inside)]:
+            self._libc.inotify_rm_watch(self._fd, wd)
+            del self._paths[wd]
+        gone = [path for path in self._files if path.startswith(inside)]
+        self._files.difference_update(gone)
+        return gone
+
+    def read_events(self, timeout):
+        """
+        Wait up to `timeout` seconds for changes.
+
+        :param timeout: The maximum time to wait in seconds
+        :return: A list of (path, kind) tuples
+        """
+        readable, writable, failed = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self._fd, 1024 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                known = self._files
+                self._files = set()
+                found = self._watch_tree(self.directory)
+                events.extend([(path, 'write') for path in found])
+                events.extend([(path, 'delete') for path in known.difference(found)])
+                continue
+
+            if mask & IN_IGNORED:
+                self._paths.pop(wd, None)
+                continue
+
+            if wd not in self._paths or not name:
+                continue
+
+            path = os.path.join(self._paths[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    events.extend([(found, 'write') for found in self._watch_tree(path)])
+                elif mask & IN_MOVED_FROM:
+                    events.extend([(gone, 'delete') for gone in self._unwatch_tree(path)])
+                continue
+
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._files.add(path)
+                events.append((path, 'write'))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._files.discard(path)
+                events.append((path, 'delete'))
+
+        return events
+
+    def close(self):
+        """
+        Stop watching.
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingEvents:
+    """
+    Reports changes in a directory tree by comparing the size and
+    modification time of every file every `interval` seconds.
+    """
+    def __init__(self, directory, interval=1.0):
+        self.directory = directory
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_poll = time.time() + interval
+
+    def _scan(self):
+        return dict((result['partial-directory'], (result['size'], result['mtime']))
+                    for result in files.iter_files(self.directory))
+
+    def read_events(self, timeout):
+        """
+        Wait up to `timeout` seconds for changes.
+
+        :param timeout: The maximum time to wait in seconds
+        :return: A list of (path, kind) tuples
+        """
+        delay = self._next_poll - time.time()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        if delay > 0:
+            time.sleep(delay)
+
+        snapshot = self._scan()
+        self._next_poll = time.time() + self.interval
+
+        events = [(path, 'write') for path in snapshot
+                  if self._snapshot.get(path) != snapshot[path]]
+        events.extend([(path, 'delete') for path in self._snapshot
+                       if path not in snapshot])
+        self._snapshot = snapshot
+        return events
+
+    def close(self):
+        """
+        Stop watching.
+        """
+        pass
@@ -39,6 +39,10 @@ setup(
     install_requires=[
         'requests>=2.5.0'
     ],
+    extras_require={
+        # AsyncConnection
+        'async': ['aiohttp>=3.12']
+    },
     include_package_data=True,
     zip_safe=False,
     platforms='any',
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from marklogic.models import ClusterSnapshot
+from tests.stubserver import StubServerTestCase
+
+DATABASES = ["Documents", "Security"]
+SERVERS = ["App", "Admin"]
+USERS = ["admin", "nobody"]
+ROLES = ["admin", "app-user"]
+PRIVILEGES = [("execute", "app-access", "http://example.com/app"),
+              ("uri", "app-uri", "/app/")]
+
+
+class ManagementHandler(BaseHTTPRequestHandler):
+    """
+    A small management API with list and properties endpoints.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.split("/")
+        kind = parts[3]
+        with self.server.lock:
+            self.server.requests.append(url.path)
+
+        if len(parts) == 4:
+            self.reply(self.list(kind))
+        else:
+            self.reply(self.properties(kind, parts[4], parse_qs(url.query)))
+
+    def list(self, kind):
+        if kind == 'servers':
+            items = [{'groupnameref': "Default", 'nameref': name} for name in SERVERS]
+        elif kind == 'privileges':
+            items = [{'kind': k, 'nameref': name, 'action': action}
+                     for k, name, action in PRIVILEGES]
+        else:
+            items = [{'nameref': name} for name in {'databases': DATABASES, 'users': USERS,
+                                                    'roles': ROLES}[kind]]
+        return {kind[:-1] + '-default-list': {'list-items': {
+            'list-count': {'value': len(items)}, 'list-item': items}}}
+
+    def properties(self, kind, name, query):
+        if kind == 'databases':
+            return {'database-name': name, 'forest': []}
+        if kind == 'servers':
+            return {'server-name': name, 'group-name': query['group-id'][0], 'root': "/",
+                    'port': 8010, 'server-type': 'http', 'content-database': "Documents"}
+        if kind == 'users':
+            return {'user-name': name, 'role': ["app-user"]}
+        if kind == 'roles':
+            return {'role-name': name}
+        for k, privilege, action in PRIVILEGES:
+            if privilege == name:
+                return {'privilege-name': name, 'kind': k, 'action': action, 'role': ["admin"]}
+
+    def reply(self, config):
+        body = json.dumps(config).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestClusterSnapshot(StubServerTestCase):
+    handler = ManagementHandler
+
+    def setUp(self):
+        super(TestClusterSnapshot, self).setUp()
+        self.server.requests = []
+
+    def test_fetch(self):
+        snapshot = ClusterSnapshot.fetch(self.conn, max_workers=4)
+
+        self.assertEqual(sorted(DATABASES), sorted(snapshot.databases()))
+        self.assertEqual(["Default|Admin", "Default|App"], sorted(snapshot.servers()))
+        self.assertEqual("Documents", snapshot.server("App").content_database_name())
+        self.assertEqual(["app-user"], snapshot.user("admin").role_names())
+        self.assertIsNotNone(snapshot.role("app-user"))
+        self.assertEqual("app-access", snapshot.privilege_for_action("http://example.com/app",
+                                                                     "execute").privilege_name())
+        self.assertEqual("/app/", snapshot.privilege("app-uri", "uri").action())
+        self.assertIsNone(snapshot.database("Missing"))
+        self.assertEqual(5 + 10, len(self.server.requests))
+        self.assertEqual(2, len(snapshot.marshal()['privileges']))
+
+    def test_read_only(self):
+        snapshot = ClusterSnapshot([], [], [], [], [])
+        with self.assertRaises(AttributeError):
+            snapshot.timestamp = 0
+        with self.assertRaises(TypeError):
+            snapshot.databases()["Documents"] = None
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import json
+import socket
+import asyncio
+import unittest
+import requests
+from marklogic.models import Connection, AsyncConnection, Database, Forest, Server, Document
+from marklogic.models.permission import Permission
+from marklogic.models.utilities.retry import RetryPolicy
+from marklogic.models.utilities.exceptions import UnexpectedManagementAPIResponse
+from marklogic.models.utilities.multipart import decode_multipart, content_type_boundary
+from tests.connections.test_connection import DigestHandler, FlakyHandler
+from tests.databases.test_documents import DocumentsHandler, documents, unusual
+from tests.databases.test_update_delta import PropertiesHandler
+from tests.forests.test_create_forests import ForestsHandler
+from tests.stubserver import StubServerTestCase, start_server, stop_server
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def run_async(conn, function):
+    """
+    Run a coroutine function with an AsyncConnection made from `conn`.
+    """
+    async def main():
+        async with AsyncConnection(conn) as aconn:
+            return await function(aconn)
+    return asyncio.run(main())
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncConnection(unittest.TestCase):
+
+    def test_digest_auth(self):
+        server = start_server(DigestHandler)
+        conn = Connection.make_connection("127.0.0.1", "admin", "admin")
+        uri = "http://127.0.0.1:{0}/manage/v2".format(server.server_port)
+
+        async def fetch(aconn):
+            first = await asyncio.gather(*[aconn.get(uri) for i in range(0, 4)])
+            second = await asyncio.gather(*[aconn.get(uri) for i in range(0, 4)])
+            return first + second
+
+        try:
+            responses = run_async(conn, fetch)
+        finally:
+            stop_server(server)
+        self.assertEqual([200] * 8, [response.status_code for response in responses])
+        self.assertEqual("ok", responses[0].text)
+
+    def test_connection_errors(self):
+        # A port nothing listens on
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            port = listener.getsockname()[1]
+
+        conn = Connection("127.0.0.1", None, port=port,
+                          retry_policy=RetryPolicy(max_attempts=2, backoff=0.01))
+        uri = "http://127.0.0.1:{0}/v1/documents".format(port)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            run_async(conn, lambda aconn: aconn.get(uri))
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncRetry(StubServerTestCase):
+    handler = FlakyHandler
+
+    def setUp(self):
+        super(TestAsyncRetry, self).setUp()
+        self.server.attempts = 0
+        self.server.failures = 2
+        self.uri = "http://127.0.0.1:{0}/manage/v2".format(self.port)
+
+    def connect(self):
+        return Connection("127.0.0.1", None,
+                          retry_policy=RetryPolicy(max_attempts=3, backoff=0.01))
+
+    def test_idempotent_requests_are_retried(self):
+        response = run_async(self.conn, lambda aconn: aconn.put(self.uri, data=b"payload"))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"payload", response.content)
+        self.assertEqual(3, self.server.attempts)
+
+    def test_post_is_not_retried(self):
+        response = run_async(self.conn, lambda aconn: aconn.post(self.uri, data=b"payload"))
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(1, self.server.attempts)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncForests(StubServerTestCase):
+    handler = ForestsHandler
+
+    def setUp(self):
+        super(TestAsyncForests, self).setUp()
+        self.server.requests = []
+        self.server.failing = set()
+        self.server.undeletable = set()
+        self.server.database_fails = False
+
+    def requests(self, method):
+        return sorted([name for m, name in self.server.requests if m == method])
+
+    def test_create_database(self):
+        db = Database("test-db")
+        db.set_forest_names(["test-db-1", "test-db-2"])
+
+        self.assertIs(db, run_async(self.conn, db.create))
+        self.assertEqual(["test-db", "test-db-1", "test-db-2"], self.requests('POST'))
+        self.assertEqual([], self.requests('DELETE'))
+
+    def test_database_failure_removes_forests(self):
+        self.server.database_fails = True
+        db = Database("test-db")
+        db.set_forest_names(["test-db-1", "test-db-2"])
+
+        with self.assertRaises(UnexpectedManagementAPIResponse):
+            run_async(self.conn, db.create)
+        self.assertEqual(["test-db-1", "test-db-2"], self.requests('DELETE'))
+
+    def test_create_forests(self):
+        self.server.failing.add("bad")
+        forests = [Forest(name) for name in ["a", "b", "bad", "c"]]
+
+        with self.assertRaises(UnexpectedManagementAPIResponse) as context:
+            run_async(self.conn, lambda aconn: Forest.create_forests(aconn, forests, max_workers=2))
+        self.assertIn("bad", str(context.exception))
+        self.assertEqual(["a", "b", "c"], self.requests('DELETE'))
+
+    def test_forest_lookup(self):
+        forest = run_async(self.conn, lambda aconn: Forest.lookup(aconn, "a"))
+        self.assertEqual("a", forest.forest_name())
+        self.assertEqual("online", forest.availability())
+        self.assertEqual([('GET', "a"), ('GET', "a")], self.server.requests)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncUpdate(StubServerTestCase):
+    handler = PropertiesHandler
+
+    def setUp(self):
+        super(TestAsyncUpdate, self).setUp()
+        self.server.puts = []
+        self.server.etag = "\"0\""
+
+    def test_lookup_and_update(self):
+        async def update(aconn):
+            db = await Database.lookup(aconn, "Documents")
+            db.set_stemmed_searches("advanced")
+            await db.update(aconn)
+            db.set_enabled(False)
+            await db.update(aconn)
+            return db
+
+        db = run_async(self.conn, update)
+        self.assertEqual("\"2\"", db.etag)
+        self.assertEqual([{'stemmed-searches': "advanced"}, {'enabled': False}],
+                         self.server.puts)
+
+    def test_server_lookup(self):
+        server = run_async(self.conn, lambda aconn: Server.lookup(aconn, "App"))
+        self.assertEqual("App", server.server_name())
+        self.assertEqual("\"0\"", server.etag)
+
+
+@unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+class TestAsyncDocuments(StubServerTestCase):
+    handler = DocumentsHandler
+
+    def setUp(self):
+        super(TestAsyncDocuments, self).setUp()
+        self.server.posts = []
+
+    def test_write_documents(self):
+        docs = [Document("/test/{0}.json".format(i), {'value': i}, collections=["c1"],
+                         permissions=[Permission("app-user", "read")])
+                for i in range(0, 3)]
+        db = Database("test-db")
+        self.assertIs(db, run_async(self.conn,
+                                    lambda aconn: db.write_documents(aconn, docs, batch_size=2)))
+
+        self.assertEqual(2, len(self.server.posts))
+        query, content_type, body = self.server.posts[0]
+        self.assertEqual({'database': ["test-db"]}, query)
+        parts = decode_multipart(body, content_type_boundary(content_type))
+        self.assertEqual(4, len(parts))
+        self.assertEqual({'collections': ["c1"],
+                          'permissions': [{'role-name': "app-user", 'capabilities': ["read"]}]},
+                         json.loads(bytes(parts[0][1]).decode('utf-8')))
+        self.assertEqual({'value': 0}, json.loads(bytes(parts[1][1]).decode('utf-8')))
+
+    def test_get_documents(self):
+        uris = sorted(unusual) + ["/one.json", "/missing.json"]
+        db = Database("test-db")
+        result = run_async(self.conn, lambda aconn: db.get_documents(aconn, uris))
+
+        expected = dict(unusual)
+        expected["/one.json"] = documents["/one.json"]
+        self.assertEqual(expected, dict((uri, bytes(result[uri])) for uri in result))
+
+if __name__ == "__main__":
+    unittest.main()
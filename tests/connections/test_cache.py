@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from marklogic.models import Connection, Database
+from marklogic.models.utilities.cache import ConfigurationCache
+from tests.stubserver import StubServerTestCase
+
+
+class PropertiesHandler(BaseHTTPRequestHandler):
+    """
+    Serves database properties with an ETag that changes on every PUT,
+    and answers conditional GETs.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        name = self.path.split("/")[4]
+        if name not in self.server.databases:
+            self.reply(404, b"")
+            return
+
+        etag = '"{0}"'.format(self.server.version)
+        if self.headers.get('If-None-Match') == etag:
+            self.server.responses.append(304)
+            self.reply(304, None, etag)
+            return
+
+        self.server.responses.append(200)
+        config = {'database-name': name, 'forest': ["{0}-{1}".format(name, self.server.version)]}
+        self.reply(200, json.dumps(config).encode('utf-8'), etag)
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.version += 1
+        self.reply(204, b"")
+
+    def reply(self, status, body, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if body is not None:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestConfigurationCache(StubServerTestCase):
+    handler = PropertiesHandler
+
+    def setUp(self):
+        super(TestConfigurationCache, self).setUp()
+        self.server.databases = ["Documents", "Meters"]
+        self.server.version = 1
+        self.server.responses = []
+
+    def test_not_modified(self):
+        first = Database.lookup(self.conn, "Documents")
+        first.set_forest_names(["changed"])
+        second = Database.lookup(self.conn, "Documents")
+
+        self.assertEqual([200, 304], self.server.responses)
+        self.assertEqual(["Documents-1"], second.forest_names())
+        self.assertEqual('"1"', second.etag)
+        self.assertEqual({'entries': 1, 'hits': 1, 'misses': 1},
+                         self.conn.configuration_cache.statistics())
+
+    def test_modified(self):
+        Database.lookup(self.conn, "Documents")
+        self.server.version = 2
+        database = Database.lookup(self.conn, "Documents")
+
+        self.assertEqual([200, 200], self.server.responses)
+        self.assertEqual(["Documents-2"], database.forest_names())
+
+    def test_updates_invalidate(self):
+        Database.lookup(self.conn, "Documents")
+        self.conn.put("http://127.0.0.1:{0}/manage/v2/databases/Documents/properties"
+                      .format(self.port), json={})
+        self.assertEqual(0, len(self.conn.configuration_cache))
+
+    def test_missing(self):
+        self.assertIsNone(Database.lookup(self.conn, "Missing"))
+
+    def test_disabled(self):
+        conn = Connection("127.0.0.1", None, management_port=self.port,
+                          cache_size=0)
+        Database.lookup(conn, "Documents")
+        Database.lookup(conn, "Documents")
+        conn.close()
+        self.assertEqual([200, 200], self.server.responses)
+
+    def test_ttl_and_eviction(self):
+        cache = ConfigurationCache(max_entries=2, ttl=0.2)
+        cache.put("a", '"1"', "A")
+        cache.put("b", '"1"', "B")
+        cache.get("a")
+        cache.put("c", '"1"', "C")
+
+        self.assertEqual(('"1"', "A"), cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        time.sleep(0.3)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(1, len(cache))
+
+if __name__ == "__main__":
+    unittest.main()
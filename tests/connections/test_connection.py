@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import os
+import gzip
+import json
+import unittest
+import hashlib
+import requests
+from http.server import BaseHTTPRequestHandler
+from marklogic.models import Connection, Database, Document
+from marklogic.models.utilities.auth import CachedDigestAuth
+from marklogic.models.utilities.retry import RetryPolicy
+from requests.auth import HTTPDigestAuth
+from requests.utils import parse_dict_header
+from tests.stubserver import StubServerTestCase, start_server, stop_server
+
+data_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                         "examples", "data", "purchases", "november", "purchase-003.json")
+
+
+class DigestHandler(BaseHTTPRequestHandler):
+    """
+    A minimal digest protected endpoint that accepts any response
+    computed for the single nonce it hands out.
+    """
+    protocol_version = "HTTP/1.1"
+    nonce = "0123456789abcdef"
+
+    def _authorized(self):
+        header = self.headers.get('Authorization')
+        if header is None or not header.startswith('Digest '):
+            return False
+        fields = parse_dict_header(header[7:])
+        if fields['nonce'] != self.nonce:
+            return False
+        md5 = lambda x: hashlib.md5(x.encode('utf-8')).hexdigest()
+        ha1 = md5("admin:public:admin")
+        ha2 = md5("{0}:{1}".format(self.command, self.path))
+        expected = md5("{0}:{1}:{2}:{3}:auth:{4}".format(
+            ha1, self.nonce, fields['nc'], fields['cnonce'], ha2))
+        return expected == fields['response']
+
+    def do_GET(self):
+        if self._authorized():
+            self.send_response(200)
+            body = b"ok"
+        else:
+            self.send_response(401)
+            self.send_header('WWW-Authenticate',
+                             'Digest realm="public", qop="auth", nonce="{0}"'
+                             .format(self.nonce))
+            body = b""
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        length = int(self.headers['Content-Length'])
+        self.rfile.read(length)
+        self.server.uploads.append(length)
+        self.do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """
+    Replies to a POST or PUT with the decoded request body and the request's
+    Content-Encoding.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        encoding = self.headers.get('Content-Encoding', 'identity')
+        self.server.encodings.append(encoding)
+        if encoding == 'gzip':
+            body = gzip.decompress(body)
+        self.reply(json.dumps({'encoding': encoding,
+                               'content-type': self.headers.get('Content-Type'),
+                               'body': body.decode('utf-8')}).encode('utf-8'))
+
+    do_PUT = do_POST
+
+    def reply(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Answers 503 until `server.failures` requests have failed, then
+    replies with the request body.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b""
+        self.server.attempts += 1
+        if self.server.attempts <= self.server.failures:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = respond
+    do_PUT = respond
+    do_POST = respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestConnection(unittest.TestCase):
+
+    def test_session_pools(self):
+        conn = Connection("example.com", HTTPDigestAuth("admin", "admin"),
+                          pool_size=4, management_pool_size=2)
+
+        rest = conn.session.get_adapter("http://example.com:8000/v1/documents")
+        manage = conn.session.get_adapter("http://example.com:8002/manage/v2")
+
+        self.assertEqual(4, rest._pool_maxsize)
+        self.assertEqual(2, manage._pool_maxsize)
+        self.assertIs(conn.auth, conn.session.auth)
+
+        conn.close()
+
+    def test_digest_auth_is_cached(self):
+        conn = Connection("example.com", HTTPDigestAuth("admin", "admin"))
+        self.assertIsInstance(conn.auth, CachedDigestAuth)
+
+        server = start_server(DigestHandler)
+        try:
+            conn = Connection.make_connection("127.0.0.1", "admin", "admin")
+            uri = "http://127.0.0.1:{0}/manage/v2".format(server.server_port)
+            for i in range(0, 5):
+                self.assertEqual(200, conn.get(uri).status_code)
+
+            stats = conn.auth.statistics()
+            self.assertEqual(5, stats['requests'])
+            self.assertEqual(1, stats['challenges'])
+        finally:
+            conn.close()
+            stop_server(server)
+
+    def test_streamed_file_is_sent_once(self):
+        server = start_server(DigestHandler)
+        server.uploads = []
+        conn = Connection("127.0.0.1", CachedDigestAuth("admin", "admin"),
+                          port=server.server_port)
+        try:
+            Database("test-db").load_file(conn, data_file, "/purchase.json",
+                                          stream_threshold=0)
+            self.assertEqual([os.path.getsize(data_file)], server.uploads)
+
+            # The challenge is only fetched once
+            Database("test-db").load_file(conn, data_file, "/purchase.json",
+                                          stream_threshold=0)
+            self.assertEqual(2, len(server.uploads))
+            self.assertEqual(1, conn.auth.statistics()['challenges'])
+        finally:
+            conn.close()
+            stop_server(server)
+
+
+class TestRetry(StubServerTestCase):
+    handler = FlakyHandler
+
+    def setUp(self):
+        super(TestRetry, self).setUp()
+        self.server.attempts = 0
+        self.server.failures = 2
+        self.uri = "http://127.0.0.1:{0}/manage/v2".format(self.port)
+
+    def connect(self):
+        return Connection("127.0.0.1", None,
+                          retry_policy=RetryPolicy(max_attempts=3, backoff=0.01))
+
+    def test_idempotent_requests_are_retried(self):
+        self.assertEqual(200, self.conn.get(self.uri).status_code)
+        self.assertEqual(3, self.server.attempts)
+
+    def test_attempts_are_limited(self):
+        self.server.failures = 5
+        self.assertEqual(503, self.conn.get(self.uri).status_code)
+        self.assertEqual(3, self.server.attempts)
+
+    def test_post_is_not_retried(self):
+        self.assertEqual(503, self.conn.post(self.uri, data=b"payload").status_code)
+        self.assertEqual(1, self.server.attempts)
+
+        response = self.conn.post(self.uri, data=b"payload", retry=True)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"payload", response.content)
+
+    def test_file_body_is_rewound(self):
+        response = self.conn.put(self.uri, data=io.BytesIO(b"file content"))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"file content", response.content)
+
+    def test_connection_errors_are_retried(self):
+        policy = RetryPolicy(max_attempts=3, backoff=0.01)
+        attempts = []
+
+        def send():
+            attempts.append(1)
+            raise requests.exceptions.ConnectionError("refused")
+
+        self.assertRaises(requests.exceptions.ConnectionError, policy.send, 'GET', send)
+        self.assertEqual(3, len(attempts))
+
+        del attempts[:]
+        self.assertRaises(requests.exceptions.ConnectionError, policy.send, 'POST', send)
+        self.assertEqual(1, len(attempts))
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1.0, max_backoff=4.0)
+        for attempt in range(1, 10):
+            self.assertLessEqual(policy.delay(attempt), min(4.0, 2 ** (attempt - 1)))
+
+
+class TestCompression(StubServerTestCase):
+    handler = EchoHandler
+
+    def setUp(self):
+        super(TestCompression, self).setUp()
+        self.server.encodings = []
+        self.uri = "http://127.0.0.1:{0}/manage/v2".format(self.port)
+
+    def connect(self):
+        return None
+
+    def test_compressed_requests(self):
+        conn = Connection("127.0.0.1", None, compression_threshold=100)
+        payload = {'database-name': "Documents", 'range-element-index': ["index"] * 50}
+        try:
+            echo = conn.post(self.uri, json=payload, compress=True).json()
+            self.assertEqual('gzip', echo['encoding'])
+            self.assertEqual('application/json', echo['content-type'])
+            self.assertEqual(payload, json.loads(echo['body']))
+
+            echo = conn.put(self.uri, data="x" * 200, headers={'Content-Type': 'text/plain'},
+                            compress=True).json()
+            self.assertEqual('gzip', echo['encoding'])
+            self.assertEqual('text/plain', echo['content-type'])
+
+            self.assertEqual('identity', conn.post(self.uri, data="small", compress=True).json()['encoding'])
+            self.assertEqual('identity', conn.post(self.uri, data=io.BytesIO(b"x" * 200),
+                                                   compress=True).json()['encoding'])
+        finally:
+            conn.close()
+
+    def test_uncompressed_by_default(self):
+        conn = Connection("127.0.0.1", None)
+        try:
+            self.assertEqual('identity', conn.post(self.uri, data="x" * 5000).json()['encoding'])
+            self.assertEqual('gzip', conn.post(self.uri, data="x" * 5000, compress=True).json()['encoding'])
+        finally:
+            conn.close()
+
+    def test_only_document_writes_are_compressed(self):
+        conn = Connection("127.0.0.1", None, port=self.port, management_port=self.port,
+                          compress_requests=True, compression_threshold=100)
+        try:
+            self.assertEqual('identity', conn.post(self.uri, data="x" * 5000).json()['encoding'])
+
+            documents = [Document("/test/{0}.json".format(i), {'value': "x" * 100})
+                         for i in range(0, 3)]
+            Database("test-db").write_documents(conn, documents)
+            self.assertEqual(['identity', 'gzip'], self.server.encodings)
+
+            self.assertEqual('identity', conn.post(self.uri, data="x" * 5000,
+                                                   compress=False).json()['encoding'])
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    unittest.main()
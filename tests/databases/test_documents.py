@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from marklogic.models import Database, Document
+from marklogic.models.permission import Permission
+from marklogic.models.utilities.multipart import encode_multipart, decode_multipart
+from marklogic.models.utilities.multipart import content_type_boundary
+from tests.stubserver import StubServerTestCase
+
+documents = {
+    "/one.json": b'{"one": 1}',
+    "/big.bin": bytes(range(0, 256)) * 1024
+    }
+
+unusual = {
+    "/dir/a#1.json": b'{"a": 1}',
+    "/dir/c+d&e f.json": b'{"c": 1}'
+    }
+
+
+class DocumentsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the documents above, one at a time or as multipart, and
+    records the query and body of every POST.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def handle(self):
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except ConnectionError:
+            # Clients may hang up before reading the whole body
+            pass
+
+    def do_GET(self):
+        uris = parse_qs(urlparse(self.path).query)['uri']
+        stored = dict(documents, **unusual)
+        if len(uris) == 1:
+            if uris[0] not in stored:
+                return self.reply(404, b"", "text/plain")
+            return self.reply(200, stored[uris[0]], "application/octet-stream")
+
+        parts = [({'Content-Type': 'application/octet-stream',
+                   'Content-Disposition': 'attachment; filename="{0}"'.format(uri)},
+                  stored[uri]) for uri in uris if uri in stored]
+        self.reply(200, encode_multipart(parts, "BOUNDARY"), "multipart/mixed; boundary=BOUNDARY")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.posts.append((parse_qs(urlparse(self.path).query),
+                                      self.headers['Content-Type'], body))
+        self.reply(200, b"{}", "application/json")
+
+    def reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDocuments(unittest.TestCase):
+
+    def test_document_metadata(self):
+        doc = Document("/test/one.json", {'a': 1}, collections=["c1", "c2"],
+                       permissions=[Permission("app-user", "read"),
+                                    Permission("app-user", "update"),
+                                    Permission("admin", "read")])
+
+        self.assertEqual(b'{"a": 1}', doc.content_bytes())
+
+        metadata = doc.metadata()
+        self.assertEqual(["c1", "c2"], metadata['collections'])
+        self.assertEqual([{'role-name': 'app-user', 'capabilities': ['read', 'update']},
+                          {'role-name': 'admin', 'capabilities': ['read']}],
+                         metadata['permissions'])
+
+        self.assertIsNone(Document("/test/two.xml", "<a/>").metadata())
+
+    def test_encode_multipart(self):
+        body = encode_multipart([({'Content-Type': 'text/plain'}, b"one"),
+                                 ({'Content-Type': 'text/plain'}, b"two")],
+                                "BOUNDARY")
+
+        self.assertEqual(b"--BOUNDARY\r\nContent-Type: text/plain\r\n\r\none\r\n"
+                         b"--BOUNDARY\r\nContent-Type: text/plain\r\n\r\ntwo\r\n"
+                         b"--BOUNDARY--\r\n", body)
+
+    def test_decode_multipart(self):
+        parts = decode_multipart(encode_multipart([({'Content-Type': 'text/plain'}, b"one\r\n"),
+                                                   ({'Content-Type': 'text/plain'}, b"")],
+                                                  "BOUNDARY"), "BOUNDARY")
+
+        self.assertEqual(2, len(parts))
+        self.assertEqual({'content-type': 'text/plain'}, parts[0][0])
+        self.assertEqual(b"one\r\n", bytes(parts[0][1]))
+        self.assertEqual(b"", bytes(parts[1][1]))
+
+
+class TestDocumentReads(StubServerTestCase):
+    handler = DocumentsHandler
+
+    def setUp(self):
+        super(TestDocumentReads, self).setUp()
+        self.db = Database("test-db")
+
+    def test_stream(self):
+        chunks = list(self.db.get_document_stream(self.conn, "/big.bin", chunk_size=1000))
+        self.assertEqual(documents["/big.bin"], b"".join(chunks))
+        self.assertIsNone(self.db.get_document_stream(self.conn, "/missing.json"))
+
+    def test_stream_closed_early(self):
+        stream = self.db.get_document_stream(self.conn, "/big.bin", chunk_size=1000)
+        self.assertEqual(documents["/big.bin"][:1000], next(stream))
+        stream.close()
+        self.assertEqual([], list(stream))
+        self.assertEqual(documents["/one.json"],
+                         b"".join(self.db.get_document_stream(self.conn, "/one.json")))
+
+    def test_download(self):
+        out = io.BytesIO()
+        self.assertEqual(len(documents["/big.bin"]),
+                         self.db.download_document(self.conn, "/big.bin", out, chunk_size=1000))
+        self.assertEqual(documents["/big.bin"], out.getvalue())
+
+        buffer = bytearray(20)
+        self.assertEqual(10, self.db.download_document(self.conn, "/one.json", buffer))
+        self.assertEqual(documents["/one.json"], bytes(buffer[:10]))
+
+        with self.assertRaises(ValueError):
+            self.db.download_document(self.conn, "/big.bin", bytearray(100))
+
+    def test_get_documents(self):
+        result = self.db.get_documents(self.conn, ["/one.json", "/big.bin", "/missing.json"])
+        self.assertEqual(documents, dict((uri, bytes(result[uri])) for uri in result))
+
+        # Both documents are views of the same response body
+        self.assertIsInstance(result["/one.json"], memoryview)
+        self.assertIs(result["/one.json"].obj, result["/big.bin"].obj)
+
+    def test_unusual_uris(self):
+        uris = sorted(unusual) + ["/one.json"]
+        result = self.db.get_documents(self.conn, uris)
+        self.assertEqual(uris, sorted(result))
+
+        for uri in unusual:
+            self.assertEqual(unusual[uri], b"".join(self.db.get_document_stream(self.conn, uri)))
+            out = io.BytesIO()
+            self.db.download_document(self.conn, uri, out)
+            self.assertEqual(unusual[uri], out.getvalue())
+
+
+class TestDocumentWrites(StubServerTestCase):
+    handler = DocumentsHandler
+
+    def setUp(self):
+        super(TestDocumentWrites, self).setUp()
+        self.server.posts = []
+
+    def test_write_documents(self):
+        docs = [Document("/test/one.json", {'a': 1}, collections=["c1", "c2"],
+                         permissions=[Permission("app-user", "read"),
+                                      Permission("app-user", "update")]),
+                Document("/test/two.xml", "<a/>", content_type="application/xml"),
+                Document("/test/three.json", {'b': 2}, collections=["c3"])]
+        Database("test-db").write_documents(self.conn, docs, batch_size=2)
+
+        self.assertEqual(2, len(self.server.posts))
+        query, content_type, body = self.server.posts[0]
+        self.assertEqual({'database': ["test-db"]}, query)
+        self.assertTrue(content_type.startswith("multipart/mixed"))
+
+        parts = decode_multipart(body, content_type_boundary(content_type))
+        self.assertEqual(3, len(parts))
+
+        # The metadata comes before the content it applies to
+        headers, metadata = parts[0]
+        self.assertEqual('attachment; filename="/test/one.json"; category=metadata',
+                         headers['content-disposition'])
+        self.assertEqual('application/json', headers['content-type'])
+        self.assertEqual({'collections': ["c1", "c2"],
+                          'permissions': [{'role-name': "app-user",
+                                           'capabilities': ["read", "update"]}]},
+                         json.loads(bytes(metadata).decode('utf-8')))
+
+        headers, content = parts[1]
+        self.assertEqual('attachment; filename="/test/one.json"', headers['content-disposition'])
+        self.assertEqual('application/json', headers['content-type'])
+        self.assertEqual({'a': 1}, json.loads(bytes(content).decode('utf-8')))
+
+        # A document without metadata has only a content part
+        headers, content = parts[2]
+        self.assertEqual('attachment; filename="/test/two.xml"', headers['content-disposition'])
+        self.assertEqual('application/xml', headers['content-type'])
+        self.assertEqual(b"<a/>", bytes(content))
+
+        query, content_type, body = self.server.posts[1]
+        parts = decode_multipart(body, content_type_boundary(content_type))
+        self.assertEqual(['attachment; filename="/test/three.json"; category=metadata',
+                          'attachment; filename="/test/three.json"'],
+                         [headers['content-disposition'] for headers, content in parts])
+        self.assertEqual({'collections': ["c3"]}, json.loads(bytes(parts[0][1]).decode('utf-8')))
+
+if __name__ == "__main__":
+    unittest.main()
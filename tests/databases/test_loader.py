@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from marklogic.models import Database
+from marklogic.models.database.loader import DocumentLoader, DirectorySync
+from tests.stubserver import StubServerTestCase
+
+data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "..", "..", "examples", "data")
+
+
+class DocumentsHandler(BaseHTTPRequestHandler):
+    """
+    Records the URIs of the documents in each multipart POST.  The
+    management API knows the host 127.0.0.1, in the group "Loaders"
+    with the host localhost.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/manage/v2/hosts/127.0.0.1/properties":
+            self.reply(200, {'host-name': "127.0.0.1", 'group': "Loaders"})
+        elif url.path == "/manage/v2/hosts":
+            with self.server.lock:
+                self.server.groups.extend(parse_qs(url.query)['group-id'])
+            items = [{'nameref': "127.0.0.1"}, {'nameref': "localhost"}]
+            self.reply(200, {'host-default-list': {'list-items': {
+                'list-count': {'value': len(items)}, 'list-item': items}}})
+        else:
+            self.reply(404, {})
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        uris = re.findall(rb'filename="([^"]+)"\r\n', body)
+        with self.server.lock:
+            self.server.batches.append([uri.decode('utf-8') for uri in uris])
+            self.server.hosts.append(self.headers['Host'].split(':')[0])
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        uri = parse_qs(urlparse(self.path).query)['uri'][0]
+        with self.server.lock:
+            self.server.puts[uri] = body
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_DELETE(self):
+        with self.server.lock:
+            self.server.deletes.extend(parse_qs(urlparse(self.path).query)['uri'])
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDocumentLoader(StubServerTestCase):
+    handler = DocumentsHandler
+
+    def setUp(self):
+        super(TestDocumentLoader, self).setUp()
+        self.server.batches = []
+        self.server.hosts = []
+        self.server.puts = {}
+        self.server.deletes = []
+        self.server.groups = []
+
+    def test_load_directory(self):
+        loader = DocumentLoader(self.conn, Database("test-db"), threads=3, batch_size=2)
+        stats = loader.load_directory(data_directory, prefix="")
+
+        uris = sorted([uri for batch in self.server.batches for uri in batch])
+        self.assertEqual(6, stats.documents)
+        self.assertEqual(3, len(self.server.batches))
+        self.assertEqual(6, len(uris))
+        self.assertTrue(uris[0].endswith("customer-001.json"))
+        self.assertGreater(stats.bytes, 0)
+
+    def test_spread_over_hosts(self):
+        loader = DocumentLoader(self.conn, Database("test-db"), threads=2, batch_size=1,
+                                hosts=["127.0.0.1", "localhost"])
+        stats = loader.load_directory(data_directory)
+
+        self.assertEqual(6, stats.documents)
+        self.assertEqual(3, self.server.hosts.count("127.0.0.1"))
+        self.assertEqual(3, self.server.hosts.count("localhost"))
+
+    def test_host_affinity(self):
+        loader = DocumentLoader(self.conn, Database("test-db"), threads=2, batch_size=1,
+                                host_affinity=True)
+        stats = loader.load_directory(data_directory)
+
+        self.assertEqual(["Loaders"], self.server.groups)
+        self.assertEqual(6, stats.documents)
+        self.assertEqual(3, self.server.hosts.count("127.0.0.1"))
+        self.assertEqual(3, self.server.hosts.count("localhost"))
+
+    def test_host_affinity_unknown_host(self):
+        conn = self.conn.for_host("localhost")
+        try:
+            loader = DocumentLoader(conn, Database("test-db"), batch_size=1,
+                                    host_affinity=True)
+            stats = loader.load_directory(data_directory)
+        finally:
+            conn.close()
+
+        self.assertEqual([], self.server.groups)
+        self.assertEqual(6, stats.documents)
+        self.assertEqual(["localhost"] * 6, self.server.hosts)
+
+    def test_stream_large_files(self):
+        loader = DocumentLoader(self.conn, Database("test-db"), threads=2, batch_size=10,
+                                stream_threshold=400)
+        stats = loader.load_directory(data_directory, prefix="")
+
+        # The four purchases are larger than 400 bytes
+        self.assertEqual(6, stats.documents)
+        self.assertEqual(4, len(self.server.puts))
+        self.assertEqual(2, sum([len(batch) for batch in self.server.batches]))
+        for uri in self.server.puts:
+            with open(uri, "rb") as data_file:
+                self.assertEqual(data_file.read(), self.server.puts[uri])
+
+    def test_sync_directory(self):
+        root = tempfile.mkdtemp()
+        try:
+            source = os.path.join(root, "data")
+            shutil.copytree(data_directory, source)
+            manifest = os.path.join(root, "manifest.json")
+            sync = DirectorySync(self.conn, Database("test-db"), manifest, delete=True)
+
+            result = sync.sync(source)
+            self.assertEqual((6, 0, 0), (result['uploaded'], result['unchanged'], result['deleted']))
+
+            result = sync.sync(source)
+            self.assertEqual((0, 6, 0), (result['uploaded'], result['unchanged'], result['deleted']))
+
+            customer = os.path.join(source, "customer-001.json")
+            later = time.time() + 10
+            os.utime(customer, (later, later))
+            with open(os.path.join(source, "customer-002.json"), "a") as out:
+                out.write("\n")
+            os.remove(os.path.join(source, "purchases", "november", "purchase-003.json"))
+
+            self.server.batches = []
+            result = sync.sync(source)
+            self.assertEqual((1, 4, 1), (result['uploaded'], result['unchanged'], result['deleted']))
+            self.assertTrue(self.server.batches[0][0].endswith("customer-002.json"))
+            self.assertTrue(self.server.deletes[0].endswith("purchase-003.json"))
+        finally:
+            shutil.rmtree(root)
+
+    def test_delete_unusual_uris(self):
+        uris = ["/dir/a#1.json", "/dir/c+d.json", "/dir/e&f.json", "/dir/x y.json", "/dir/%41.json"]
+        Database("test-db").delete_documents(self.conn, uris, batch_size=3)
+        self.assertEqual(uris, self.server.deletes)
+
+    def test_sync_deletes_unusual_names(self):
+        root = tempfile.mkdtemp()
+        try:
+            source = os.path.join(root, "data")
+            os.makedirs(source)
+            names = ["a#1.json", "c+d.json", "e&f.json", "x y.json"]
+            for name in names:
+                with open(os.path.join(source, name), "w") as out:
+                    out.write("{}")
+            sync = DirectorySync(self.conn, Database("test-db"),
+                                 os.path.join(root, "manifest.json"), delete=True)
+            sync.sync(source)
+
+            for name in names:
+                os.remove(os.path.join(source, name))
+            result = sync.sync(source)
+            self.assertEqual(4, result['deleted'])
+            self.assertEqual(sorted(["/" + os.path.join(source, name) for name in names]),
+                             sorted(self.server.deletes))
+        finally:
+            shutil.rmtree(root)
+
+    def test_sync_new_prefix(self):
+        root = tempfile.mkdtemp()
+        try:
+            source = os.path.join(root, "data")
+            shutil.copytree(data_directory, source)
+            manifest = os.path.join(root, "manifest.json")
+            DirectorySync(self.conn, Database("test-db"), manifest, prefix="/old").sync(source)
+            old_uris = sorted([uri for batch in self.server.batches for uri in batch])
+
+            self.server.batches = []
+            result = DirectorySync(self.conn, Database("test-db"), manifest, prefix="/new",
+                                   delete=True).sync(source)
+            self.assertEqual((6, 0, 6), (result['uploaded'], result['unchanged'], result['deleted']))
+            self.assertEqual(old_uris, sorted(self.server.deletes))
+            self.assertTrue(all(uri.startswith("/old") for uri in old_uris))
+        finally:
+            shutil.rmtree(root)
+
+    def test_sync_new_prefix_pending_deletes(self):
+        root = tempfile.mkdtemp()
+        try:
+            source = os.path.join(root, "data")
+            shutil.copytree(data_directory, source)
+            manifest = os.path.join(root, "manifest.json")
+            DirectorySync(self.conn, Database("test-db"), manifest, prefix="/old").sync(source)
+            old_uris = sorted([uri for batch in self.server.batches for uri in batch])
+
+            result = DirectorySync(self.conn, Database("test-db"), manifest,
+                                   prefix="/new").sync(source)
+            self.assertEqual((6, 0, 0), (result['uploaded'], result['unchanged'], result['deleted']))
+            self.assertEqual([], self.server.deletes)
+
+            result = DirectorySync(self.conn, Database("test-db"), manifest, prefix="/new",
+                                   delete=True).sync(source)
+            self.assertEqual((0, 6, 6), (result['uploaded'], result['unchanged'], result['deleted']))
+            self.assertEqual(old_uris, sorted(self.server.deletes))
+
+            self.server.deletes = []
+            result = DirectorySync(self.conn, Database("test-db"), manifest, prefix="/new",
+                                   delete=True).sync(source)
+            self.assertEqual(0, result['deleted'])
+            self.assertEqual([], self.server.deletes)
+        finally:
+            shutil.rmtree(root)
+
+    def test_sync_prefix_changed_back(self):
+        root = tempfile.mkdtemp()
+        try:
+            source = os.path.join(root, "data")
+            shutil.copytree(data_directory, source)
+            manifest = os.path.join(root, "manifest.json")
+            DirectorySync(self.conn, Database("test-db"), manifest, prefix="/old").sync(source)
+            DirectorySync(self.conn, Database("test-db"), manifest, prefix="/new").sync(source)
+            DirectorySync(self.conn, Database("test-db"), manifest, prefix="/old").sync(source)
+
+            DirectorySync(self.conn, Database("test-db"), manifest, prefix="/old",
+                          delete=True).sync(source)
+            self.assertTrue(self.server.deletes)
+            self.assertTrue(all(uri.startswith("/new") for uri in self.server.deletes))
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from marklogic.models import Database, Server
+from marklogic.models.database.index import ElementRangeIndex
+from tests.stubserver import StubServerTestCase
+
+
+class PropertiesHandler(BaseHTTPRequestHandler):
+    """
+    Serves database and server properties and records every PUT.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        kind = urlparse(self.path).path.split("/")[3]
+        if kind == 'databases':
+            config = {'database-name': "Documents", 'enabled': True,
+                      'stemmed-searches': "basic", 'forest': ["Documents"]}
+        else:
+            config = {'server-name': "App", 'group-name': "Default", 'root': "/",
+                      'port': 8010, 'server-type': "http",
+                      'content-database': "Documents", 'enabled': True}
+        self.reply(200, config)
+
+    def do_PUT(self):
+        length = int(self.headers['Content-Length'])
+        with self.server.lock:
+            self.server.puts.append(json.loads(self.rfile.read(length).decode('utf-8')))
+            if self.headers['if-match'] not in (None, self.server.etag):
+                self.reply(412, None)
+                return
+            self.server.etag = "\"{0}\"".format(len(self.server.puts))
+        self.reply(204, None)
+
+    def reply(self, status, config):
+        body = b"" if config is None else json.dumps(config).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestUpdateDelta(StubServerTestCase):
+    handler = PropertiesHandler
+
+    def setUp(self):
+        super(TestUpdateDelta, self).setUp()
+        self.server.puts = []
+        self.server.etag = "\"0\""
+
+    def test_scalar_change(self):
+        db = Database.lookup(self.conn, "Documents")
+        db.set_stemmed_searches("advanced")
+        db.update(self.conn)
+        self.assertEqual([{'stemmed-searches': "advanced"}], self.server.puts)
+
+        # Nothing changed since the last update
+        db.update(self.conn)
+        self.assertEqual(1, len(self.server.puts))
+
+    def test_second_update(self):
+        db = Database.lookup(self.conn, "Documents")
+        self.assertEqual("\"0\"", db.etag)
+        db.set_stemmed_searches("advanced")
+        db.update(self.conn)
+        self.assertEqual("\"1\"", db.etag)
+
+        db.set_enabled(False)
+        db.update(self.conn)
+        self.assertEqual([{'stemmed-searches': "advanced"}, {'enabled': False}],
+                         self.server.puts)
+
+    def test_list_change(self):
+        db = Database.lookup(self.conn, "Documents")
+        db.add_index(ElementRangeIndex("string", "", "title"))
+        db.update(self.conn)
+        self.assertEqual(1, len(self.server.puts))
+        self.assertEqual(db.marshal(), self.server.puts[0])
+        self.assertIn('range-element-index', self.server.puts[0])
+
+    def test_unchanged(self):
+        Database.lookup(self.conn, "Documents").update(self.conn)
+        Server.lookup(self.conn, "App").update(self.conn)
+        self.assertEqual([], self.server.puts)
+
+    def test_new_object(self):
+        db = Database.unmarshal({'database-name': "Documents", 'enabled': True})
+        db.update(self.conn)
+        self.assertEqual([db.marshal()], self.server.puts)
+
+    def test_server_change(self):
+        server = Server.lookup(self.conn, "App")
+        server.set_enabled(False)
+        server.update(self.conn)
+        self.assertEqual([{'enabled': False}], self.server.puts)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from marklogic.models import Database, Forest
+from marklogic.models.utilities.exceptions import UnexpectedManagementAPIResponse
+from tests.stubserver import StubServerTestCase
+
+
+class ForestsHandler(BaseHTTPRequestHandler):
+    """
+    Creates and deletes forests, failing for the names in
+    `server.failing` and `server.undeletable`, and creates databases
+    unless `server.database_fails`.  Every request is recorded.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def record(self, method, name):
+        with self.server.lock:
+            self.server.requests.append((method, name))
+
+    def do_POST(self):
+        kind = urlparse(self.path).path.split("/")[3]
+        config = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        if kind == 'databases':
+            self.record('POST', config['database-name'])
+            self.reply(400 if self.server.database_fails else 201)
+        else:
+            self.record('POST', config['forest-name'])
+            self.reply(500 if config['forest-name'] in self.server.failing else 201)
+
+    def do_DELETE(self):
+        name = urlparse(self.path).path.split("/")[4]
+        self.record('DELETE', name)
+        self.reply(500 if name in self.server.undeletable else 204)
+
+    def do_GET(self):
+        name = urlparse(self.path).path.split("/")[4]
+        self.record('GET', name)
+        if self.path.endswith("view=config"):
+            self.reply(200, {'forest-config': {'name': name, 'config-properties': {},
+                                               'relations': {'relation-group': []}}})
+        else:
+            self.reply(200, {'availability': "online"})
+
+    def reply(self, status, config=None):
+        body = json.dumps(config).encode('utf-8') if config is not None else b""
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestCreateForests(StubServerTestCase):
+    handler = ForestsHandler
+
+    def setUp(self):
+        super(TestCreateForests, self).setUp()
+        self.server.requests = []
+        self.server.failing = set()
+        self.server.undeletable = set()
+        self.server.database_fails = False
+
+    def requests(self, method):
+        return sorted([name for m, name in self.server.requests if m == method])
+
+    def test_failure_removes_created_forests(self):
+        self.server.failing.add("bad")
+        forests = [Forest(name) for name in ["a", "b", "bad", "c"]]
+
+        with self.assertRaises(UnexpectedManagementAPIResponse) as context:
+            Forest.create_forests(self.conn, forests, max_workers=2)
+
+        self.assertIn("bad", str(context.exception))
+        self.assertEqual(["a", "b", "c"], self.requests('DELETE'))
+
+    def test_failed_removal_is_reported(self):
+        self.server.failing.add("bad")
+        self.server.undeletable.add("a")
+        forests = [Forest(name) for name in ["a", "b", "bad"]]
+
+        with self.assertRaises(UnexpectedManagementAPIResponse) as context:
+            Forest.create_forests(self.conn, forests)
+
+        self.assertIn("Failed to create forests: bad", str(context.exception))
+        self.assertIn("Failed to remove forests: a", str(context.exception))
+        self.assertEqual(["a", "b"], self.requests('DELETE'))
+
+    def test_database_failure_removes_forests(self):
+        self.server.database_fails = True
+        db = Database("test-db")
+        db.set_forest_names(["test-db-1", "test-db-2"])
+
+        with self.assertRaises(UnexpectedManagementAPIResponse):
+            db.create(self.conn)
+
+        self.assertEqual(["test-db", "test-db-1", "test-db-2"], self.requests('POST'))
+        self.assertEqual(["test-db-1", "test-db-2"], self.requests('DELETE'))
+
+    def test_create_without_lookup(self):
+        forest = Forest("a")
+        self.assertIs(forest, forest.create(self.conn, lookup=False))
+        self.assertEqual([('POST', "a")], self.server.requests)
+
+    def test_create_with_lookup(self):
+        forest = Forest("a").create(self.conn)
+        self.assertEqual("a", forest.forest_name())
+        self.assertEqual([('POST', "a"), ('GET', "a"), ('GET', "a")], self.server.requests)
+
+    def test_create_forests_lookup(self):
+        Forest.create_forests(self.conn, [Forest("a"), Forest("b")])
+        self.assertEqual([], self.requests('GET'))
+        self.assertEqual(["a", "b"], self.requests('POST'))
+
+        del self.server.requests[:]
+        created = Forest.create_forests(self.conn, [Forest("a"), Forest("b")], lookup=True)
+        self.assertEqual(["a", "a", "b", "b"], self.requests('GET'))
+        self.assertEqual(["a", "b"], [forest.forest_name() for forest in created])
+
+if __name__ == "__main__":
+    unittest.main()
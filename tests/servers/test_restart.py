@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import time
+import asyncio
+import unittest
+from http.server import BaseHTTPRequestHandler
+from marklogic.models import Connection, AsyncConnection, Server
+from marklogic.models.utilities.exceptions import RestartTimeout
+from tests.stubserver import StubServerTestCase
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+LAST_STARTUP = "2015-05-01T10:00:00.000000-04:00"
+RESTARTED = "2015-05-01T10:00:05.000000-04:00"
+
+
+class RestartHandler(BaseHTTPRequestHandler):
+    """
+    Plays a cluster of two hosts, 127.0.0.1 and localhost, that report
+    the old startup time for their first `server.polls` timestamp
+    requests.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        host = self.headers['Host'].split(':')[0]
+        if self.path.startswith("/manage/v2/hosts"):
+            items = [{'idref': "1001", 'nameref': "127.0.0.1"},
+                     {'idref': "1002", 'nameref': "localhost"}]
+            self.reply(json.dumps({'host-default-list': {'list-items': {'list-item': items}}}))
+            return
+
+        with self.server.lock:
+            self.server.requests[host] = self.server.requests.get(host, 0) + 1
+            count = self.server.requests[host]
+        self.reply(LAST_STARTUP if count <= self.server.polls else RESTARTED)
+
+    def reply(self, text):
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RestartResponse:
+    def __init__(self, host_ids):
+        self.text = json.dumps({'restart': {'last-startup': [
+            {'value': LAST_STARTUP, 'host-id': host_id} for host_id in host_ids]}})
+
+
+class TestWaitForRestart(StubServerTestCase):
+    handler = RestartHandler
+
+    def setUp(self):
+        super(TestWaitForRestart, self).setUp()
+        self.server.requests = {}
+        self.server.polls = 3
+
+    def connect(self):
+        return Connection("127.0.0.1", None, management_port=self.port, admin_port=self.port)
+
+    def test_wait_for_every_host(self):
+        start = time.time()
+        Server.wait_for_restart(self.conn, RestartResponse(["1001", "1002"]), timeout=10)
+
+        self.assertEqual({'127.0.0.1': 4, 'localhost': 4}, self.server.requests)
+        self.assertLess(time.time() - start, 2)
+
+    def test_unknown_host(self):
+        Server.wait_for_restart(self.conn, RestartResponse(["9999"]), timeout=10)
+        self.assertEqual({'127.0.0.1': 4}, self.server.requests)
+
+    def test_timeout(self):
+        self.server.polls = 1000
+        self.assertRaises(RestartTimeout, Server.wait_for_restart,
+                          self.conn, RestartResponse(["1001"]), timeout=1)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_wait_for_restart_async(self):
+        async def wait():
+            async with AsyncConnection(self.conn) as aconn:
+                await Server.wait_for_restart_async(
+                    aconn, RestartResponse(["1001", "1002"]), timeout=10)
+
+        asyncio.run(wait())
+        self.assertEqual({'127.0.0.1': 4, 'localhost': 4}, self.server.requests)
+
+if __name__ == "__main__":
+    unittest.main()
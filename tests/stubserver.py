@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""
+A local HTTP server for tests that play the part of MarkLogic.  Each
+test module defines only a request handler; the server, its thread
+and the connection to it come from here.
+"""
+
+import threading
+import unittest
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from marklogic.models import Connection
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_server(handler):
+    """
+    Serve requests with a handler class on a free local port, in a
+    daemon thread.  The server has a `lock` for handlers that record
+    what they receive.
+
+    :param handler: A BaseHTTPRequestHandler subclass
+    :return: The running server
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def stop_server(server):
+    """
+    Stop a server started with start_server and release its port.
+
+    :param server: The server
+    """
+    server.shutdown()
+    server.server_close()
+
+
+class StubServerTestCase(unittest.TestCase):
+    """
+    Runs `handler` on a local server for every test.  The server is
+    `self.server`, its port `self.port` and `self.conn` is the
+    connection returned by `connect()`.
+    """
+    handler = None
+
+    def setUp(self):
+        self.server = start_server(self.handler)
+        self.port = self.server.server_port
+        self.conn = self.connect()
+
+    def connect(self):
+        """
+        The connection the tests use.  By default the REST and
+        management ports are both the server's port.
+
+        :return: A Connection, or None
+        """
+        return Connection("127.0.0.1", None, port=self.port, management_port=self.port)
+
+    def tearDown(self):
+        if self.conn is not None:
+            self.conn.close()
+        stop_server(self.server)
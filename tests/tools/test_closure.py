@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from marklogic.models import ClusterSnapshot
+from marklogic.tools.closure import Closure
+from tests.stubserver import StubServerTestCase
+
+RESOURCES = {
+    'servers': {
+        'App': {'server-name': "App", 'group-name': "Default", 'root': "/", 'port': 8010,
+                'server-type': "http", 'content-database': "Documents",
+                'modules-database': "Modules", 'default-user': "nobody",
+                'privilege': "http://example.com/app"}
+        },
+    'databases': {
+        'Documents': {'database-name': "Documents", 'security-database': "Security",
+                      'schema-database': "Schemas"},
+        'Modules': {'database-name': "Modules", 'security-database': "Security",
+                    'schema-database': "Schemas"},
+        'Security': {'database-name': "Security", 'schema-database': "Schemas"},
+        'Schemas': {'database-name': "Schemas", 'security-database': "Security"}
+        },
+    'users': {
+        'nobody': {'user-name': "nobody", 'role': ["app-user"]}
+        },
+    'roles': {
+        'app-user': {'role-name': "app-user", 'role': ["base"]},
+        'base': {'role-name': "base", 'role': []},
+        'admin': {'role-name': "admin", 'role': ["base"]}
+        },
+    'privileges': {
+        'app-access': {'privilege-name': "app-access", 'kind': "execute",
+                       'action': "http://example.com/app", 'role': ["admin", "app-user"]}
+        }
+    }
+
+
+class ManagementHandler(BaseHTTPRequestHandler):
+    """
+    Serves the properties of RESOURCES and a privilege list.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.split("/")
+        with self.server.lock:
+            self.server.requests.append("/".join(parts[3:5]))
+
+        if parts[3] == 'privileges' and len(parts) == 4:
+            items = [{'kind': config['kind'], 'nameref': name, 'action': config['action']}
+                     for name, config in RESOURCES['privileges'].items()]
+            self.reply(200, {'privilege-default-list': {'list-items': {'list-item': items}}})
+        elif parts[4] in RESOURCES[parts[3]]:
+            self.reply(200, RESOURCES[parts[3]][parts[4]])
+        else:
+            self.reply(404, {})
+
+    def reply(self, status, config):
+        body = json.dumps(config).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestClosure(StubServerTestCase):
+    handler = ManagementHandler
+
+    def setUp(self):
+        super(TestClosure, self).setUp()
+        self.server.requests = []
+
+    def check(self, closure):
+        self.assertEqual(["App"], list(closure.servers))
+        self.assertEqual(["Documents", "Modules", "Schemas", "Security"], sorted(closure.databases))
+        self.assertEqual(["nobody"], list(closure.users))
+        self.assertEqual(["admin", "app-user", "base"], sorted(closure.roles))
+        self.assertEqual(["execute|app-access"], list(closure.privileges))
+        self.assertEqual(4, len(closure.marshal()['databases']))
+
+    def test_close(self):
+        closure = Closure(self.conn, max_workers=4)
+        closure.add_server("App")
+        closure.add_role("missing")
+        closure.close()
+
+        self.check(closure)
+        self.assertEqual([('role', "missing")], closure.missing)
+        # Every object is fetched once and the privileges are listed once
+        self.assertEqual(len(self.server.requests), len(set(self.server.requests)))
+        self.assertEqual(1, self.server.requests.count("privileges"))
+
+    def test_close_from_snapshot(self):
+        closure = Closure(self.conn, max_workers=4)
+        closure.add_server("App")
+        closure.close()
+
+        snapshot = ClusterSnapshot(closure.databases.values(), closure.servers.values(),
+                                   closure.users.values(), closure.roles.values(),
+                                   closure.privileges.values())
+        del self.server.requests[:]
+
+        closure = Closure(snapshot=snapshot)
+        closure.add_server("App")
+        closure.close()
+
+        self.check(closure)
+        self.assertEqual([], self.server.requests)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -27,35 +27,77 @@
 import unittest
 import os
 import time
+import tempfile
+import zipfile
+from http.server import BaseHTTPRequestHandler
+from unittest import mock
+import marklogic.tools
 from marklogic.tools import MLCPLoader
+from marklogic.models.utilities import files
+from marklogic.models.utilities.exceptions import MLClientException
 from marklogic.models import Connection, Host
 from marklogic.recipes import SimpleDatabase
 from requests.auth import HTTPDigestAuth
 from resources import TestConnection as tc
+from tests.stubserver import StubServerTestCase
 import shutil
 
 class TestMLCPDownload(unittest.TestCase):
 
     def setUp(self):
-        if os.path.isdir(".mlcp"):
-           shutil.rmtree(".mlcp")
+        self.cache_directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_directory)
+
+    def make_archive(self):
+        archive_path = os.path.join(self.cache_directory, "mlcp-local.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("mlcp-Hadoop2-1.3-1/bin/mlcp.sh", "#!/bin/sh\n")
+            archive.writestr("mlcp-Hadoop2-1.3-1/lib/mlcp.jar", "jar")
+        return archive_path
 
     def test_download(self):
-        loader = MLCPLoader()
+        loader = MLCPLoader(cache_directory=self.cache_directory)
         loader.clear_directory()
 
-        loader.download_mlcp()
-        dir_stat = os.stat(".mlcp")
+        home = loader.download_mlcp()
+
+        self.assertTrue(os.path.isdir(os.path.join(home, "bin")), "There should be a cached mlcp install")
+        self.assertTrue(os.path.exists(os.path.join(self.cache_directory, "1.3-1", "mlcp.zip.sha256")))
+
+    def test_offline_archive(self):
+        archive_path = self.make_archive()
+        loader = MLCPLoader(cache_directory=self.cache_directory, archive=archive_path,
+                            checksum=files.file_hash(archive_path))
+
+        home = loader.download_mlcp()
 
-        self.assertIsNotNone(dir_stat, "There should be an mlcp subdirectory created")
+        self.assertEqual(loader.mlcp_home(), home)
+        script = os.path.join(home, "bin", "mlcp.sh")
+        self.assertTrue(os.path.exists(script))
+        self.assertTrue(os.access(script, os.X_OK))
+        self.assertEqual(["mlcp"], os.listdir(os.path.join(self.cache_directory, "1.3-1")))
+
+        # A second loader, from anywhere, reuses the cached install
+        os.remove(archive_path)
+        self.assertEqual(home, MLCPLoader(cache_directory=self.cache_directory,
+                                          archive=archive_path).download_mlcp())
+
+    def test_checksum_mismatch(self):
+        loader = MLCPLoader(cache_directory=self.cache_directory, archive=self.make_archive(),
+                            checksum="0" * 64)
+
+        self.assertRaises(MLClientException, loader.download_mlcp)
+        self.assertFalse(os.path.isdir(loader.mlcp_home()))
 
     def test_clear_directory(self):
-        os.mkdir(".mlcp")
+        loader = MLCPLoader(cache_directory=self.cache_directory)
+        os.makedirs(loader.mlcp_home())
 
-        loader = MLCPLoader()
         loader.clear_directory()
 
-        self.assertFalse(os.path.isdir(".mlcp"))
+        self.assertFalse(os.path.isdir(loader.mlcp_home()))
 
     def test_load_data(self):
         simpledb = SimpleDatabase("example_app", port=8400)
@@ -65,7 +107,6 @@ class TestMLCPDownload(unittest.TestCase):
         exampledb = simpledb.create(conn, hostname)
 
         loader = MLCPLoader()
-        loader.download_mlcp()
 
         try:
             loader.load_directory(conn, exampledb['content'], os.path.join("examples", "data"),
@@ -78,5 +119,77 @@ class TestMLCPDownload(unittest.TestCase):
             exampledb['modules'].delete(conn)
             exampledb['content'].delete(conn)
 
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Serves `server.archive`, or hangs up part way through it if
+    `server.truncate` is set.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.archive)))
+        self.end_headers()
+        if self.server.truncate:
+            self.wfile.write(self.server.archive[:10])
+            self.close_connection = True
+        else:
+            self.wfile.write(self.server.archive)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestMLCPFetch(StubServerTestCase):
+    handler = ArchiveHandler
+
+    def setUp(self):
+        super(TestMLCPFetch, self).setUp()
+        self.cache_directory = tempfile.mkdtemp()
+        archive_path = os.path.join(self.cache_directory, "source.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("mlcp-Hadoop2-1.3-1/bin/mlcp.sh", "#!/bin/sh\n")
+        with open(archive_path, "rb") as archive:
+            self.server.archive = archive.read()
+        os.remove(archive_path)
+        self.server.truncate = False
+        self.url = mock.patch.object(marklogic.tools, "MLCP_URL",
+                                     "http://127.0.0.1:{0}/mlcp-{{0}}.zip".format(self.port))
+        self.url.start()
+
+    def connect(self):
+        return None
+
+    def tearDown(self):
+        self.url.stop()
+        super(TestMLCPFetch, self).tearDown()
+        shutil.rmtree(self.cache_directory)
+
+    def version_files(self):
+        return sorted(os.listdir(os.path.join(self.cache_directory, "1.3-1")))
+
+    def test_download(self):
+        loader = MLCPLoader(cache_directory=self.cache_directory)
+        loader.download_mlcp()
+
+        self.assertEqual(["mlcp", "mlcp.zip", "mlcp.zip.sha256"], self.version_files())
+        archive_path = os.path.join(self.cache_directory, "1.3-1", "mlcp.zip")
+        with open(archive_path + ".sha256") as checksum_file:
+            self.assertEqual(files.file_hash(archive_path), checksum_file.read())
+
+    def test_interrupted_download(self):
+        self.server.truncate = True
+        loader = MLCPLoader(cache_directory=self.cache_directory)
+
+        self.assertRaises(Exception, loader.download_mlcp)
+        self.assertEqual([], self.version_files())
+
+    def test_checksum_mismatch(self):
+        loader = MLCPLoader(cache_directory=self.cache_directory, checksum="0" * 64)
+
+        self.assertRaises(MLClientException, loader.download_mlcp)
+        self.assertEqual([], self.version_files())
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from marklogic.models import Connection, Database
+from marklogic.tools import MLCPLoader
+from marklogic.models.utilities import files
+from marklogic.tools.mlcp import MLCPRun, parse_line, partition_directory, run_parallel
+from requests.auth import HTTPDigestAuth
+
+data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "..", "..", "examples", "data")
+
+OUTPUT = """15/04/25 10:00:00 INFO contentpump.ContentPump: Job name: local_1
+15/04/25 10:00:01 INFO contentpump.LocalJobRunner:  completed 50%
+15/04/25 10:00:02 WARN mapreduce.ContentWriter: Failed document /a.json
+15/04/25 10:00:02 INFO contentpump.LocalJobRunner:  completed 100%
+15/04/25 10:00:02 INFO contentpump.LocalJobRunner: com.marklogic.mapreduce.MarkLogicCounter:
+15/04/25 10:00:02 INFO contentpump.LocalJobRunner: INPUT_RECORDS: 6
+15/04/25 10:00:02 INFO contentpump.LocalJobRunner: OUTPUT_RECORDS: 6
+15/04/25 10:00:02 INFO contentpump.LocalJobRunner: OUTPUT_RECORDS_COMMITTED: 5
+15/04/25 10:00:02 INFO contentpump.LocalJobRunner: OUTPUT_RECORDS_FAILED: 1
+15/04/25 10:00:02 ERROR contentpump.ContentPump: Error loading /a.json
+15/04/25 10:00:02 INFO contentpump.LocalJobRunner: Total execution time: 2 sec
+"""
+
+
+class TestMLCPRun(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fake_mlcp(self, sleep=0):
+        script = os.path.join(self.directory, "mlcp.py")
+        with open(script, "w") as out:
+            out.write("import sys, time\n")
+            for line in OUTPUT.splitlines():
+                out.write("print({0!r}, flush=True)\n".format(line))
+                if sleep:
+                    out.write("time.sleep({0})\n".format(sleep))
+        return [sys.executable, script]
+
+    def test_parse_line(self):
+        self.assertEqual(50, parse_line("INFO contentpump.LocalJobRunner:  completed 50%")['percent'])
+        event = parse_line("INFO contentpump.LocalJobRunner: OUTPUT_RECORDS_FAILED: 3\n")
+        self.assertEqual(('counter', 'OUTPUT_RECORDS_FAILED', 3),
+                         (event['type'], event['name'], event['value']))
+        self.assertEqual('output', parse_line("INFO contentpump.ContentPump: Job name: x")['type'])
+
+    def test_events(self):
+        run = MLCPRun(self.fake_mlcp())
+        events = list(run)
+
+        self.assertEqual(11, len(events))
+        self.assertEqual([50, 100], [event['percent'] for event in events
+                                     if event['type'] == 'progress'])
+        summary = run.summary()
+        self.assertEqual(6, summary['input_records'])
+        self.assertEqual(5, summary['committed'])
+        self.assertEqual(1, summary['failed'])
+        self.assertEqual(100, summary['percent'])
+        self.assertEqual(1, len(summary['errors']))
+        self.assertEqual(0, summary['returncode'])
+        self.assertFalse(summary['aborted'])
+
+    def test_abort(self):
+        run = MLCPRun(self.fake_mlcp(sleep=1))
+        start = time.time()
+
+        summary = run.wait(lambda event: event['type'] != 'progress')
+
+        self.assertTrue(summary['aborted'])
+        self.assertEqual(50, summary['percent'])
+        self.assertEqual(0, summary['input_records'])
+        self.assertLess(time.time() - start, 5)
+
+    def test_partition_directory(self):
+        groups = partition_directory(data_directory, 2)
+        self.assertEqual(2, len(groups))
+        self.assertIn([os.path.join(data_directory, "purchases")], groups)
+
+        # The purchases directory is split to make four groups
+        groups = partition_directory(data_directory, 4)
+        paths = sorted([path for group in groups for path in group])
+        self.assertEqual(4, len(groups))
+        self.assertEqual([os.path.join(data_directory, "customer-001.json"),
+                          os.path.join(data_directory, "customer-002.json"),
+                          os.path.join(data_directory, "purchases", "december"),
+                          os.path.join(data_directory, "purchases", "november")], paths)
+
+        self.assertEqual(6, len(partition_directory(data_directory, 10)))
+
+    def test_partition_directory_walks_once(self):
+        with mock.patch.object(files, "iter_files", wraps=files.iter_files) as iter_files:
+            partition_directory(data_directory, 10)
+        self.assertEqual(1, iter_files.call_count)
+
+    def test_run_parallel(self):
+        events = []
+        summary = run_parallel([self.fake_mlcp(), self.fake_mlcp()], events.append)
+
+        self.assertEqual(22, len(events))
+        self.assertEqual([0, 1], sorted(set([event['partition'] for event in events])))
+        self.assertEqual(12, summary['input_records'])
+        self.assertEqual(10, summary['committed'])
+        self.assertEqual(2, len(summary['partitions']))
+        self.assertFalse(summary['aborted'])
+
+    def test_run_parallel_abort(self):
+        summary = run_parallel([self.fake_mlcp(sleep=1), self.fake_mlcp(sleep=1)],
+                               lambda event: event['type'] != 'progress')
+
+        self.assertTrue(summary['aborted'])
+        self.assertEqual(0, summary['input_records'])
+
+    def test_load_directory_parallel(self):
+        script = os.path.join(self.directory, "mlcp.sh")
+        with open(script, "w") as out:
+            out.write("#!/bin/sh\n")
+            out.write("echo \"$@\"\n")
+            out.write("echo \"INFO contentpump.LocalJobRunner: INPUT_RECORDS: 3\"\n")
+        os.chmod(script, 0o755)
+
+        path = os.environ["PATH"]
+        os.environ["PATH"] = self.directory + os.pathsep + path
+        try:
+            events = []
+            loader = MLCPLoader(cache_directory=self.directory)
+            conn = Connection("localhost", HTTPDigestAuth("admin", "admin"))
+            summary = loader.load_directory_parallel(conn, Database("test-db"), data_directory,
+                                                     prefix="/test", hosts=["host1", "host2"],
+                                                     thread_count=4, callback=events.append)
+        finally:
+            os.environ["PATH"] = path
+
+        self.assertEqual(6, summary['input_records'])
+        self.assertEqual(["host1", "host2"], [partition['host'] for partition in summary['partitions']])
+        for event in events:
+            if event['type'] == 'output':
+                self.assertIn("-host {0} ".format(event['host']), event['line'])
+                self.assertIn("-thread_count 4", event['line'])
+
+if __name__ == "__main__":
+    unittest.main()
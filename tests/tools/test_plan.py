@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from marklogic.tools.plan import ConfigPlan, changed_properties
+from tests.stubserver import StubServerTestCase
+
+NAME_PROPERTY = {'roles': 'role-name', 'users': 'user-name', 'privileges': 'privilege-name',
+                 'databases': 'database-name', 'servers': 'server-name'}
+
+
+def server_config(name, database):
+    return {'server-name': name, 'group-name': "Default", 'root': "/", 'port': 8010,
+            'server-type': "http", 'content-database': database}
+
+
+class ManagementHandler(BaseHTTPRequestHandler):
+    """
+    Stores configurations by type and name, and records every write
+    and the body of every PUT.  Like the server, it refuses to give a
+    role a privilege that does not exist.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def resource(self):
+        parts = urlparse(self.path).path.split("/")
+        return parts[3], parts[4] if len(parts) > 4 else None
+
+    def do_GET(self):
+        kind, name = self.resource()
+        config = self.server.resources[kind].get(name)
+        if config is None:
+            self.reply(404, {})
+        else:
+            self.reply(200, config)
+
+    def do_PUT(self):
+        kind, name = self.resource()
+        config = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        with self.server.lock:
+            if kind == 'roles':
+                for privilege in config.get('privilege', []):
+                    if privilege.split("|")[1] not in self.server.resources['privileges']:
+                        self.reply(400, {'message': "No privilege {0}".format(privilege)})
+                        return
+            self.server.writes.append(('PUT', kind, name))
+            self.server.payloads[(kind, name)] = config
+            self.server.resources[kind][name].update(config)
+        self.reply(204, None)
+
+    def do_POST(self):
+        kind, name = self.resource()
+        config = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        name = config[NAME_PROPERTY[kind]]
+        with self.server.lock:
+            self.server.writes.append(('POST', kind, name))
+            self.server.resources[kind][name] = config
+        self.reply(201, None)
+
+    def reply(self, status, config):
+        body = json.dumps(config).encode('utf-8') if config is not None else b""
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestConfigPlan(StubServerTestCase):
+    handler = ManagementHandler
+
+    def setUp(self):
+        super(TestConfigPlan, self).setUp()
+        self.server.writes = []
+        self.server.payloads = {}
+        self.server.resources = {
+            'roles': dict(("role-{0}".format(i), {'role-name': "role-{0}".format(i), 'role': []})
+                          for i in range(0, 20)),
+            'users': {'alice': {'user-name': "alice", 'role': ["role-1", "role-2"]}},
+            'privileges': {},
+            'databases': {'Documents': {'database-name': "Documents", 'forest': []}},
+            'servers': {'App': server_config("App", "Documents")}
+            }
+
+    def desired(self):
+        return {
+            'roles': [{'role-name': "role-{0}".format(i), 'role': []} for i in range(0, 20)],
+            'users': [{'user-name': "alice", 'role': ["role-2", "role-1"]}],
+            'privileges': [],
+            'databases': [{'database-name': "Documents", 'forest': []}],
+            'servers': [server_config("App", "Documents")]
+            }
+
+    def test_nothing_changed(self):
+        plan = ConfigPlan.plan(self.conn, self.desired())
+        plan.apply(self.conn)
+
+        self.assertEqual(0, len(plan))
+        self.assertEqual([], self.server.writes)
+
+    def test_changes(self):
+        config = self.desired()
+        config['roles'][3]['role'] = ["role-4"]
+        config['roles'].append({'role-name': "new-role", 'role': ["role-1"]})
+        config['privileges'].append({'privilege-name': "app", 'kind': "execute",
+                                     'action': "http://example.com/app", 'role': ["new-role"]})
+        config['servers'][0]['content-database'] = "Other"
+
+        plan = ConfigPlan.plan(self.conn, config)
+        self.assertEqual(sorted(["Create role new-role: role, role-name",
+                                 "Update role role-3: role",
+                                 "Update role new-role: role, role-name",
+                                 "Create privilege execute|app: action, kind, privilege-name, role",
+                                 "Update server Default|App: content-database"]),
+                         sorted(plan.describe()))
+        self.assertEqual(4, len(plan.stages()))
+
+        plan.apply(self.conn)
+        self.assertEqual([('POST', 'roles', "new-role")], self.server.writes[:1])
+        self.assertEqual(('PUT', 'servers', "App"), self.server.writes[-1])
+        self.assertEqual(5, len(self.server.writes))
+        self.assertEqual(["role-1"], self.server.resources['roles']['new-role']['role'])
+        self.assertEqual("Other", self.server.resources['servers']['App']['content-database'])
+        self.assertEqual({'content-database': "Other"},
+                         self.server.payloads[('servers', "App")])
+
+    def test_new_role_with_new_privilege(self):
+        config = self.desired()
+        config['roles'].append({'role-name': "app-role", 'role': [],
+                                'privilege': ["execute|app"]})
+        config['privileges'].append({'privilege-name': "app", 'kind': "execute",
+                                     'action': "http://example.com/app", 'role': ["app-role"]})
+
+        plan = ConfigPlan.plan(self.conn, config)
+        self.assertEqual([['roles'], ['privileges'], ['roles']],
+                         [sorted(set(operation['type'] for operation in stage))
+                          for stage in plan.stages()])
+
+        plan.apply(self.conn)
+        self.assertEqual([('POST', 'roles', "app-role"), ('POST', 'privileges', "app"),
+                          ('PUT', 'roles', "app-role")], self.server.writes)
+        self.assertEqual(["execute|app"],
+                         self.server.resources['roles']['app-role']['privilege'])
+
+    def test_list_change_sends_everything(self):
+        config = self.desired()
+        config['databases'][0]['forest'] = ["Documents-1"]
+        config['databases'][0]['enabled'] = False
+
+        ConfigPlan.plan(self.conn, config).apply(self.conn)
+        payload = self.server.payloads[('databases', "Documents")]
+        self.assertEqual(["Documents-1"], payload['forest'])
+        self.assertEqual("Documents", payload['database-name'])
+        self.assertFalse(payload['enabled'])
+
+    def test_changed_properties(self):
+        self.assertEqual([], changed_properties({'role': ["a", "b"]}, {'role': ["b", "a"], 'x': 1}))
+        self.assertEqual(['role'], changed_properties({'role': ["a"]}, {}))
+
+if __name__ == "__main__":
+    unittest.main()
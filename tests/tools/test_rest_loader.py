@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os
+import re
+import unittest
+from http.server import BaseHTTPRequestHandler
+from marklogic.models import Database
+from marklogic.tools import RESTLoader
+from tests.stubserver import StubServerTestCase
+
+data_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "..", "..", "examples", "data")
+
+
+class DocumentsHandler(BaseHTTPRequestHandler):
+    """
+    Records the URI and content type of the documents in each multipart POST.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        parts = re.findall(rb'Content-Type: ([^\r]+)\r\nContent-Disposition: [^\r]*filename="([^"]+)"', body)
+        with self.server.lock:
+            self.server.batches.append(dict((uri.decode('utf-8'), content_type.decode('utf-8'))
+                                            for content_type, uri in parts))
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRESTLoader(StubServerTestCase):
+    handler = DocumentsHandler
+
+    def setUp(self):
+        super(TestRESTLoader, self).setUp()
+        self.server.batches = []
+
+    def test_load_directory(self):
+        progress = []
+        loader = RESTLoader(threads=2, batch_size=4,
+                            callback=lambda statistics: progress.append(statistics.documents))
+        stats = loader.load_directory(self.conn, Database("test-db"), data_directory,
+                                      collections=["example1"], prefix="/test/data1")
+
+        documents = {}
+        for batch in self.server.batches:
+            documents.update(batch)
+        self.assertEqual(6, stats.documents)
+        self.assertEqual(2, len(self.server.batches))
+        self.assertEqual(6, max(progress))
+        self.assertIn("/test/data1/purchases/december/purchase-001.json", documents)
+        self.assertIn("/test/data1/customer-001.json", documents)
+        self.assertEqual(["application/json"], list(set(documents.values())))
+
+    def test_document_uri(self):
+        loader = RESTLoader()
+        path = os.path.join("data", "orders", "001.json")
+        self.assertEqual("/test/orders/001.json", loader.document_uri("data", path, "/test/"))
+        self.assertEqual("/orders/001.json", loader.document_uri("data", path))
+
+if __name__ == "__main__":
+    unittest.main()
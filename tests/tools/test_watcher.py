@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import re
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from marklogic.models import Database
+from marklogic.tools import Watcher
+from marklogic.tools.watchers import InotifyEvents
+from tests.stubserver import StubServerTestCase
+
+
+class DocumentsHandler(BaseHTTPRequestHandler):
+    """
+    Records the requests made by the watcher.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        uris = re.findall(rb'filename="([^"]+)"\r\n', body)
+        self.server.requests.append(('write', [uri.decode('utf-8') for uri in uris]))
+        self.reply()
+
+    def do_DELETE(self):
+        self.server.requests.append(('delete', parse_qs(urlparse(self.path).query)['uri']))
+        self.reply()
+
+    def reply(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestWatcher(StubServerTestCase):
+    handler = DocumentsHandler
+
+    def setUp(self):
+        super(TestWatcher, self).setUp()
+        self.server.requests = []
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, "old.json"), "w") as out:
+            out.write("{}")
+
+    def tearDown(self):
+        super(TestWatcher, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def run_watcher(self, watcher):
+        thread = threading.Thread(target=watcher.watch, args=(self.conn, self.directory))
+        thread.start()
+        time.sleep(0.3)
+
+        os.makedirs(os.path.join(self.directory, "sub"))
+        for i in range(0, 50):
+            with open(os.path.join(self.directory, "sub", "doc-{0}.json".format(i)), "w") as out:
+                out.write('{"n": 1}')
+        os.remove(os.path.join(self.directory, "old.json"))
+
+        deadline = time.time() + 10
+        while len(self.server.requests) < 2 and time.time() < deadline:
+            time.sleep(0.1)
+        watcher.stop()
+        thread.join()
+
+        writes = [uri for kind, uris in self.server.requests if kind == 'write' for uri in uris]
+        deletes = [uri for kind, uris in self.server.requests if kind == 'delete' for uri in uris]
+        self.assertEqual(50, len(set(writes)))
+        self.assertIn("/test/sub/doc-0.json", writes)
+        self.assertEqual(["/test/old.json"], deletes)
+        self.assertLessEqual(len(self.server.requests), 4)
+
+    @unittest.skipUnless(InotifyEvents.available(), "inotify is not available")
+    def test_inotify(self):
+        self.run_watcher(Watcher(Database("test-db"), prefix="/test/", debounce=0.2))
+
+    def test_polling(self):
+        self.run_watcher(Watcher(Database("test-db"), prefix="/test/", debounce=0.2,
+                                 poll_interval=0.5, use_inotify=False))
+
+@unittest.skipUnless(InotifyEvents.available(), "inotify is not available")
+class TestInotifyEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.outside = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.directory, "sub", "deeper"))
+        for name in ["sub/a.json", "sub/deeper/b.json"]:
+            with open(os.path.join(self.directory, name), "w") as out:
+                out.write("{}")
+        self.events = InotifyEvents(self.directory)
+
+    def tearDown(self):
+        self.events.close()
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.outside)
+
+    def read_events(self):
+        return sorted((os.path.relpath(path, self.directory), kind)
+                      for path, kind in self.events.read_events(1.0))
+
+    def test_rename_directory(self):
+        os.rename(os.path.join(self.directory, "sub"), os.path.join(self.directory, "renamed"))
+        self.assertEqual([("renamed/a.json", 'write'), ("renamed/deeper/b.json", 'write'),
+                          ("sub/a.json", 'delete'), ("sub/deeper/b.json", 'delete')],
+                         self.read_events())
+
+    def test_move_directory_away(self):
+        moved = os.path.join(self.outside, "sub")
+        os.rename(os.path.join(self.directory, "sub"), moved)
+        self.assertEqual([("sub/a.json", 'delete'), ("sub/deeper/b.json", 'delete')],
+                         self.read_events())
+
+        # The moved directory is no longer watched
+        with open(os.path.join(moved, "deeper", "c.json"), "w") as out:
+            out.write("{}")
+        self.assertEqual([], self.read_events())
+
+if __name__ == "__main__":
+    unittest.main()
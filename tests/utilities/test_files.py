@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+
+#
+# Copyright 2015 MarkLogic Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from marklogic.models.utilities.files import iter_files, walk_directories
+
+
+class TestFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "a", "b"))
+        os.makedirs(os.path.join(self.root, "skip"))
+        for name in ["one.json", "a/two.json", "a/b/three.xml", "skip/four.json"]:
+            with open(os.path.join(self.root, name), "w") as out:
+                out.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def names(self, results):
+        return sorted([result['filename'] for result in results])
+
+    def test_walk(self):
+        results = iter_files(self.root)
+        self.assertFalse(isinstance(results, list))
+
+        results = list(results)
+        self.assertEqual(["four.json", "one.json", "three.xml", "two.json"], self.names(results))
+        for result in results:
+            # Each file contains its own relative path
+            relative = os.path.relpath(result['partial-directory'], self.root)
+            self.assertEqual(len(relative), result['size'])
+
+        self.assertEqual(self.names(results), self.names(walk_directories(self.root)))
+
+    def test_filters(self):
+        self.assertEqual(["one.json", "two.json"],
+                         self.names(iter_files(self.root, include=["*.json"], exclude=["skip"])))
+        self.assertEqual(["three.xml"],
+                         self.names(iter_files(self.root, include=["a/b/*"])))
+
+    def test_abandoned_walk(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            results = iter_files(self.root)
+            next(results)
+            results.close()
+        self.assertEqual([], [w for w in caught if issubclass(w.category, ResourceWarning)])
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "Symlinks are not supported")
+    def test_symlinks(self):
+        os.symlink(os.path.join(self.root, "a"), os.path.join(self.root, "link"))
+        os.symlink(self.root, os.path.join(self.root, "a", "loop"))
+
+        self.assertEqual(["four.json", "one.json", "three.xml", "two.json"],
+                         self.names(iter_files(self.root, symlinks='follow')))
+        self.assertEqual(["four.json", "one.json", "three.xml", "two.json"],
+                         self.names(iter_files(self.root, symlinks='files')))
+
+        os.symlink(os.path.join(self.root, "one.json"), os.path.join(self.root, "alias.json"))
+        self.assertEqual(["alias.json", "four.json", "one.json", "three.xml", "two.json"],
+                         self.names(iter_files(self.root, symlinks='files')))
+        self.assertEqual(["four.json", "one.json", "three.xml", "two.json"],
+                         self.names(iter_files(self.root, symlinks='skip')))
+
+if __name__ == "__main__":
+    unittest.main()